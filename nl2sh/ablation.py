@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+from nl2sh.agents.response_cache import ResponseCache
+from nl2sh.evaluator.evaluator import Evaluator
+from nl2sh.inference import Inference, load_evaluation_nl
+
+"""
+Ablation matrix: run several Inference configurations over the same tasks in one sweep and compare them.
+All configurations share one in-memory ResponseCache. The configurations of a task run one after the other, so
+a stage whose request is the same in every configuration (the Clarifier call, and the first Composer call when the
+composer model is the same) goes to the API once per task, and the later configurations only pay for the stages
+that differ. Since a shared stage also shares its sampled answer, the configurations are compared on the same
+clarification, which removes that source of noise from the comparison.
+The commands of all configurations are then judged in a single Evaluator pass, where a (task, command) pair
+produced by several configurations is judged once.
+    python -m nl2sh.ablation --configs default finetune ablation --out-dir gened_files/ablation
+"""
+
+# the experiments of the README
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "finetune": {"use_finetune": True},
+    "ablation": {"inspect_abltn": True},
+}
+
+
+async def _generate(pipelines: Dict[str, Inference], tasks: List[str], max_recompose: int | None,
+                    max_concurrency: int) -> Dict[str, List[tuple[str, str, int]]]:
+    from tqdm import tqdm
+
+    results = {name: [("", "", 0)] * len(tasks) for name in pipelines}
+    sem = asyncio.Semaphore(max_concurrency)
+    pbar = tqdm(total=len(tasks), desc=f"Ablation ({len(pipelines)} configs, concurrency={max_concurrency})",
+                unit="task")
+
+    async def _run(i: int, task: str) -> None:
+        async with sem:
+            # one configuration at a time: the first one fills the cache with the shared stages
+            for name, inference in pipelines.items():
+                try:
+                    res = await inference.arun_single(task, max_recompose)
+                except Exception as e:
+                    inference._fail(task, e)
+                    res = ""
+                cmd, retry_times = res if res else ("", 0)
+                results[name][i] = (task, cmd, retry_times)
+        pbar.update(1)
+
+    try:
+        await asyncio.gather(*(_run(i, task) for i, task in enumerate(tasks)))
+    finally:
+        pbar.close()
+    return results
+
+
+def run_matrix(
+        configs: Dict[str, Dict[str, Any]],
+        tasks: List[str],
+        max_recompose: int | None = 2,
+        max_concurrency: int = 8,
+        judge_model: str = 'gpt-5.1',
+        judge_workers: int = 5,
+        pack_size: int = 1,
+        out_dir: str | Path | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Generate and judge the commands of every configuration.
+    Args:
+        configs (Dict[str, Dict[str, Any]]): Configuration name -> keyword arguments of Inference, e.g. PRESETS.
+            The first configuration is the baseline of the "same" column.
+        tasks (List[str]): The NL tasks.
+        max_recompose (int | None): Maximum number of recomposition attempts if the inspector does not pass.
+        max_concurrency (int): Maximum number of tasks in flight at the same time.
+        judge_model (str), judge_workers (int), pack_size (int): Options of the judging pass (see Evaluator.eval_batch).
+        out_dir (str | Path | None): If given, the commands of every configuration are saved as <name>.txt in the
+            format of gen_eval_commands, and the judgments as judged.jsonl.
+    Returns:
+        List[Dict[str, Any]]: One row per configuration: avg_score, judged, failed (judgments that got -1), empty
+            (tasks without a command), avg_retries and same (share of the tasks with the baseline's command).
+            The shared-stage counters are in the "calls" key of the first row.
+    """
+    if not configs:
+        raise ValueError("No configurations to run")
+    if out_dir is not None:
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    # in memory and without eviction: it only lives for this sweep
+    cache = ResponseCache(path=None, max_entries=None)
+    pipelines = {name: Inference(cache=cache, **kwargs) for name, kwargs in configs.items()}
+    results = asyncio.run(_generate(pipelines, tasks, max_recompose, max_concurrency))
+
+    # one judging pass over the distinct pairs of all configurations
+    unique: Dict[tuple[str, str], int] = {}
+    for rows in results.values():
+        for task, cmd, _ in rows:
+            if cmd:
+                unique.setdefault((task, cmd), len(unique))
+    scores: Dict[tuple[str, str], float] = {}
+    if unique:
+        judged, _ = Evaluator(judge_model).eval_batch(
+            [(task, cmd, 0) for task, cmd in unique], num_workers=judge_workers, ordered=True, pack_size=pack_size,
+            ofile=out_dir / "judged.jsonl" if out_dir is not None else None,
+        )
+        scores = {(task, cmd): score for task, cmd, score in judged}
+
+    baseline = next(iter(results.values()))
+    report = []
+    for name, rows in results.items():
+        if out_dir is not None:
+            Inference._save_results(rows, str(out_dir / f"{name}.txt"))
+        valid = [scores[(task, cmd)] for task, cmd, _ in rows if cmd and scores.get((task, cmd), -1) >= 0]
+        report.append({
+            "config": name,
+            "composer": pipelines[name].composer.model,
+            "inspector": pipelines[name].inspector.model,
+            "tasks": len(rows),
+            "avg_score": sum(valid) / len(valid) if valid else 0.0,
+            "judged": len(valid),
+            "failed": sum(1 for task, cmd, _ in rows if cmd and scores.get((task, cmd), -1) < 0),
+            "empty": sum(1 for _, cmd, _ in rows if not cmd),
+            "avg_retries": sum(r for _, _, r in rows) / len(rows) if rows else 0.0,
+            "same": sum(a[1] == b[1] for a, b in zip(rows, baseline)) / len(rows) if rows else 0.0,
+        })
+
+    stats = cache.stats()
+    # every cache hit is a call a separate pass per configuration would have made
+    report[0]["calls"] = {"api": stats["misses"], "shared": stats["hits"],
+                          "judged_pairs": len(unique), "pairs": sum(len(rows) for rows in results.values())}
+    return report
+
+
+def print_report(report: List[Dict[str, Any]]) -> None:
+    print(f"{'config':<14}{'composer':<28}{'inspector':<14}{'avg':>7}{'judged':>8}{'failed':>8}{'empty':>7}"
+          f"{'retries':>9}{'same':>7}")
+    for r in report:
+        composer = r["composer"] if len(r["composer"]) <= 26 else r["composer"][:23] + "..."
+        print(f"{r['config']:<14}{composer:<28}{r['inspector']:<14}{r['avg_score']:>7.2f}{r['judged']:>8}"
+              f"{r['failed']:>8}{r['empty']:>7}{r['avg_retries']:>9.2f}{r['same']:>7.0%}")
+    calls = report[0]["calls"]
+    total = calls["api"] + calls["shared"]
+    print(f"LLM calls: {calls['api']} sent, {calls['shared']} shared between configs "
+          f"({calls['shared'] / total if total else 0:.0%} of {total}); "
+          f"judged {calls['judged_pairs']} distinct pairs of {calls['pairs']}")
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run and judge several Inference configurations in one sweep")
+    parser.add_argument("--input", default="nl2sh/data/nl2bash_eval_50.jsonl")
+    parser.add_argument("--configs", nargs="+", default=list(PRESETS), choices=list(PRESETS))
+    parser.add_argument("--config-file", default=None,
+                        help='JSON object of configuration name -> Inference keyword arguments, '
+                             'e.g. {"base": {}, "pre": {"pre_inspect": true}}; replaces --configs')
+    parser.add_argument("--max-recompose", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--judge-model", default="gpt-5.1")
+    parser.add_argument("--judge-workers", type=int, default=5)
+    parser.add_argument("--pack-size", type=int, default=1)
+    parser.add_argument("--out-dir", default=None)
+    parser.add_argument("--json", default=None, help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.config_file:
+        with open(args.config_file, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+    else:
+        configs = {name: PRESETS[name] for name in args.configs}
+
+    report = run_matrix(configs, load_evaluation_nl(args.input), args.max_recompose, args.concurrency,
+                        args.judge_model, args.judge_workers, args.pack_size, args.out_dir)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import asyncio
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Dict, List
+
+from nl2sh import deadline
+from nl2sh.agents.composer import Composer
+from nl2sh.agents.inspector import Inspector
+from nl2sh.agents.llm_service import AsyncLLMService, LLMService
+from nl2sh.agents.pre_inspector import PreInspector
+from nl2sh.agents.response_cache import ResponseCache
+from nl2sh.prompts.inspector_pmpt import batch_candidate_block, batch_inspector_pmt
+from nl2sh.sandbox import Sandbox
+
+if TYPE_CHECKING:
+    from nl2sh.retrieval import RetrievalIndex
+
+# suggestion for the recompose loop when no candidate got a guide (its verdict was missing or unparseable)
+NO_GUIDE = "The command does not do what the task asks. Write a different command for the task."
+
+"""
+context = {
+    "usr_input": "xxx",
+    "clarifier": "yyy",
+    "candidates": [
+        'c1', 'c2', 'c3'
+    ],
+    "composer_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "inspector_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "state": "sss"
+}
+"""
+
+
+class CandidateComposer(Composer):
+    """
+    Composer that produces N diverse candidates at once, with N parallel sampled calls.
+    Every call after the first asks for an alternative solution, which also gives each call its own cache key.
+    Attributes:
+        n (int): Number of candidates per task.
+        temperature (float | None): Sampling temperature of the candidate calls. None keeps the model default.
+        index (RetrievalIndex | None), few_shot (int): Retrieved examples for every candidate call, as in Composer.
+    Methods:
+        execute(context: Dict[str, Any]) -> Dict[str, Any]: Composes the candidates and sets the state to 'candidates'.
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]: Async version of execute.
+    """
+
+    def __init__(self, model: str = "gpt-4o-mini", n: int = 3, temperature: float | None = 0.8,
+                 cache: ResponseCache | None = None, index: "RetrievalIndex | None" = None,
+                 few_shot: int = 0) -> None:
+        super().__init__(model, cache=cache, index=index, few_shot=few_shot)
+        self.name = "candidate_composer"
+        self.n = n
+        self.temperature = temperature
+        params = {"temperature": temperature} if temperature is not None else None
+        self.instance = LLMService(model=model, cache=cache, params=params)
+        self.async_instance = AsyncLLMService(model=model, cache=cache, params=params)
+
+    def _sample_messages(self, context: Dict[str, Any], k: int) -> List[Dict[str, Any]]:
+        messages = self._build_messages(context)
+        if k > 0:
+            messages[-1]["content"] += (f"This is alternative {k + 1} of {self.n}: if there are several reasonable "
+                                        f"ways to do the task, use a different one than the most common.\n")
+        return messages
+
+    def _update_candidates(self, context: Dict[str, Any], results: List[str]) -> Dict[str, Any]:
+        # keep the order, drop empty and duplicate candidates
+        candidates = []
+        for res in results:
+            res = (res or "").strip()
+            if res and res not in candidates:
+                candidates.append(res)
+        if not candidates:
+            raise ValueError("The LLM said nothing")
+        context['candidates'] = candidates
+        context['state'] = 'candidates'
+        return context
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # worker threads do not inherit contextvars, so each call runs in a copy of ours (trace span, deadline)
+        ctxs = [contextvars.copy_context() for _ in range(self.n)]
+        with ThreadPoolExecutor(max_workers=self.n) as ex:
+            results = list(ex.map(lambda k: ctxs[k].run(self.instance.chat, self._sample_messages(context, k)),
+                                  range(self.n)))
+        return self._update_candidates(context, results)
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        results = await asyncio.gather(*(self.async_instance.chat(self._sample_messages(context, k))
+                                         for k in range(self.n)))
+        return self._update_candidates(context, list(results))
+
+
+class BatchInspector(Inspector):
+    """
+    Inspector that judges all candidates of a task in one request and accepts the first one judged CORRECT.
+    If none is correct, the first candidate with a guide and that guide (or the first candidate and a generic
+    suggestion) go to the histories and the state becomes not_passed, so the usual suggestion-driven recompose loop
+    takes over. If the answer cannot be parsed, the first candidate
+    goes to the regular inspector (state composed).
+    Attributes:
+        pre_inspector (PreInspector | None): Optional local check; candidates with hard errors are dropped before
+            the request.
+        sandbox (Sandbox | None): Optional execution check after the pre-inspector; the candidates are run in
+            parallel, and those whose run shows they are broken are dropped before the request. Under a task
+            deadline with less time left than the sandbox timeout the check is skipped, and runs still going when
+            the deadline passes are left to the batch request.
+        stats (Dict[str, Any]): batches, accepted (with the rank of the accepted candidate), none_correct,
+            unparseable, pre_rejected, sandbox_rejected and sandbox_skipped counts.
+    Methods:
+        execute(context: Dict[str, Any]) -> Dict[str, Any]: Judges context["candidates"] and updates the context.
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]: Async version of execute.
+    """
+
+    def __init__(self, model: str = 'gpt-5.1', pre_inspector: PreInspector | None = None,
+                 cache: ResponseCache | None = None, sandbox: Sandbox | None = None):
+        super().__init__(model, cache=cache)
+        self.name = "batch_inspector"
+        self.template = batch_inspector_pmt
+        self.pre_inspector = pre_inspector
+        self.sandbox = sandbox
+        self.stats = {"batches": 0, "accepted": 0, "accepted_rank": {}, "none_correct": 0,
+                      "unparseable": 0, "pre_rejected": 0, "sandbox_rejected": 0, "sandbox_skipped": 0}
+        self._lock = threading.Lock()
+
+    def _prepare(self, context: Dict[str, Any]) -> tuple[List[str], List[str]]:
+        """
+        Returns:
+            tuple[List[str], List[str]]: The candidates to judge, and the errors of the first rejected one.
+        """
+        candidates = context.get('candidates')
+        if not candidates:
+            raise KeyError("No valid candidates!")
+
+        kept, first_errors = list(candidates), []
+        if self.pre_inspector is not None:
+            kept = []
+            for cand in candidates:
+                errors = self.pre_inspector.find_errors(cand)
+                if errors:
+                    first_errors = first_errors or errors
+                else:
+                    kept.append(cand)
+            with self._lock:
+                self.stats["pre_rejected"] += len(candidates) - len(kept)
+
+        left = deadline.remaining()
+        if self.sandbox is not None and kept and left is not None and left < self.sandbox.timeout:
+            # a run could outlast the task: leave the candidates to the batch request
+            with self._lock:
+                self.stats["sandbox_skipped"] += 1
+        elif self.sandbox is not None and kept:
+            # all runs at once on the sandbox's process pool
+            futures = [self.sandbox.submit(context['usr_input'], cand) for cand in kept]
+            wait(futures, timeout=None if left is None else max(0.0, deadline.remaining()))
+            # a run that has not finished by the deadline decides nothing
+            failures = [self.sandbox.failure(f.result()) if f.done() else None for f in futures]
+            for f in futures:
+                f.cancel()
+            if not first_errors:
+                first_errors = [f"The command failed when it was run on a test file system: {failure}"
+                                for failure in failures if failure is not None][:1]
+            with self._lock:
+                self.stats["sandbox_rejected"] += sum(failure is not None for failure in failures)
+            kept = [cand for cand, failure in zip(kept, failures) if failure is None]
+        return kept, first_errors
+
+    def _build_batch_messages(self, context: Dict[str, Any], candidates: List[str]) -> List[Dict[str, Any]]:
+        task = context.get('clarifier') or context.get('usr_input')
+        if not task:
+            raise KeyError("No valid input!")
+        blocks = [
+            batch_candidate_block
+            .replace("{{CANDIDATE_ID}}", str(k))
+            .replace("{{USER_COMMAND}}", cand)
+            for k, cand in enumerate(candidates, start=1)
+        ]
+        prompt = (self.template
+                  .replace('{{TASK_DESCRIPTION}}', task)
+                  .replace('{{CANDIDATES}}', "\n".join(blocks)))
+        return [{"role": "system", "content": prompt}]
+
+    def _parse_batch(self, res: str, n: int) -> List[tuple[bool | None, str | None]] | None:
+        # tolerate a markdown fence around the JSON
+        text = (res or "").strip().strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(obj, dict):
+            return None
+        return [self._parse_output(str(obj.get(str(k), ""))) for k in range(1, n + 1)]
+
+    def _select(self, context: Dict[str, Any], candidates: List[str], res: str | None,
+                pre_errors: List[str]) -> Dict[str, Any]:
+        if 'composer_history' not in context:
+            context['composer_history'] = []
+        if 'inspector_history' not in context:
+            context['inspector_history'] = []
+
+        with self._lock:
+            self.stats["batches"] += 1
+
+        if not candidates:
+            # every candidate has a hard error: recompose from the first one
+            context['composer_history'].append(context['candidates'][0])
+            context['inspector_history'].append(" ".join(pre_errors))
+            context['state'] = 'not_passed'
+            with self._lock:
+                self.stats["none_correct"] += 1
+            return context
+
+        verdicts = self._parse_batch(res, len(candidates))
+        if verdicts is None:
+            # fall back to the regular inspector on the first candidate
+            context['composer_history'].append(candidates[0])
+            context['state'] = 'composed'
+            with self._lock:
+                self.stats["unparseable"] += 1
+            return context
+
+        for rank, (cand, (is_correct, _)) in enumerate(zip(candidates, verdicts), start=1):
+            if is_correct:
+                context['composer_history'].append(cand)
+                context['inspector_history'].append('done')
+                context['state'] = 'done'
+                with self._lock:
+                    self.stats["accepted"] += 1
+                    self.stats["accepted_rank"][rank] = self.stats["accepted_rank"].get(rank, 0) + 1
+                return context
+
+        # none is correct: recompose from the first candidate that got a guide
+        cand, guide = next(((cand, guide) for cand, (_, guide) in zip(candidates, verdicts) if guide),
+                           (candidates[0], NO_GUIDE))
+        context['composer_history'].append(cand)
+        context['inspector_history'].append(guide)
+        context['state'] = 'not_passed'
+        with self._lock:
+            self.stats["none_correct"] += 1
+        return context
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        candidates, pre_errors = self._prepare(context)
+        res = self.instance.chat(self._build_batch_messages(context, candidates)) if candidates else None
+        return self._select(context, candidates, res, pre_errors)
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        if self.pre_inspector is not None or self.sandbox is not None:
+            # the local checks spawn subprocesses, so keep them off the event loop.
+            candidates, pre_errors = await asyncio.to_thread(self._prepare, context)
+        else:
+            candidates, pre_errors = self._prepare(context)
+        res = await self.async_instance.chat(self._build_batch_messages(context, candidates)) if candidates else None
+        return self._select(context, candidates, res, pre_errors)
+
+
+if __name__ == "__main__":
+    # test with python -m nl2sh.agents.candidates
+    context = {"usr_input": "List all files in the current directory with their sizes.", "state": "clarified"}
+    context = CandidateComposer(n=3).execute(context)
+    print(context["candidates"])
+    context = BatchInspector().execute(context)
+    print(context)
@@ -0,0 +1,163 @@
+import random
+import re
+import threading
+from typing import Any, Dict, Tuple
+
+from nl2sh.agents.inspector import Inspector
+from nl2sh.agents.response_cache import ResponseCache
+from nl2sh.prompts.inspector_pmpt import cascade_inspector_pmt
+
+"""
+context = {
+    "usr_input": "xxx",
+    "clarifier": "yyy",
+    "composer_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "inspector_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "state": "sss"
+}
+"""
+
+CONFIDENCE = re.compile(r"^\s*CONFIDENCE\s*:\s*([0-9]*\.?[0-9]+)\s*$", re.I | re.M)
+
+
+class CascadeInspector(Inspector):
+    """
+    Two-stage Inspector. A fast, cheap model judges first and reports its confidence. The strong model is only
+    asked when the cheap verdict is INCORRECT, cannot be parsed, or is less confident than `threshold`;
+    its verdict is then final. Most passing commands finish without a flagship-model call.
+    Attributes:
+        model (str): "<cheap model> -> <strong model>", for display.
+        cheap_model (str): The model of the first stage.
+        threshold (float): Minimum confidence for accepting a cheap CORRECT without escalation.
+        escalate_incorrect (bool): Whether a confident cheap INCORRECT is also escalated.
+        audit_rate (float): Fraction of accepted cheap verdicts that are re-judged by the strong model anyway,
+            to measure the agreement on the path that is normally not checked. 0 disables it.
+        strong (Inspector): The second stage.
+        stats (Dict[str, Any]): inspections, escalations, escalation reasons, audited,
+            and compared / agreed (cheap vs strong verdicts on the same command).
+    Methods:
+        execute(context: Dict[str, Any]) -> Dict[str, Any]: Inspects the latest command and updates the context.
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]: Async version of execute.
+        escalation_rate() -> float: Fraction of inspections that needed the strong model.
+        agreement_rate() -> float: Fraction of compared inspections where both models gave the same verdict.
+    """
+
+    def __init__(self, cheap_model: str = 'gpt-4o-mini', strong_model: str = 'gpt-5.1',
+                 threshold: float = 0.8, escalate_incorrect: bool = True, audit_rate: float = 0.0,
+                 cache: ResponseCache | None = None):
+        super().__init__(cheap_model, cache=cache)
+        self.cheap_model = cheap_model
+        self.model = f"{cheap_model} -> {strong_model}"
+        self.template = cascade_inspector_pmt
+        self.strong = Inspector(strong_model, cache=cache)
+        self.threshold = threshold
+        self.escalate_incorrect = escalate_incorrect
+        self.audit_rate = audit_rate
+        self.stats = {
+            "inspections": 0,
+            "escalations": 0,
+            "reasons": {"incorrect": 0, "unparseable": 0, "low_confidence": 0},
+            "audited": 0,
+            "compared": 0,
+            "agreed": 0,
+        }
+        self._lock = threading.Lock()
+
+    def _parse_cascade(self, o: str) -> Tuple[bool | None, str | None, float | None, str]:
+        """
+        Parse the cheap model's answer: the usual CORRECT / INCORRECT: <guide> line, plus a CONFIDENCE line.
+        Returns:
+            Tuple[bool | None, str | None, float | None, str]: The verdict and guide as in _parse_output,
+                the confidence (None if missing), and the answer without the confidence line.
+        """
+        m = CONFIDENCE.search(o)
+        confidence = None
+        if m:
+            try:
+                confidence = min(1.0, max(0.0, float(m.group(1))))
+            except ValueError:
+                confidence = None
+        verdict_text = CONFIDENCE.sub("", o).strip()
+        is_correct, guide = self._parse_output(verdict_text)
+        return is_correct, guide, confidence, verdict_text
+
+    def _escalation_reason(self, is_correct: bool | None, confidence: float | None) -> str | None:
+        if is_correct is None:
+            return "unparseable"
+        if is_correct is False:
+            return "incorrect" if self.escalate_incorrect else None
+        if confidence is None or confidence < self.threshold:
+            return "low_confidence"
+        return None
+
+    def _route(self, res: str) -> Tuple[str | None, bool | None, str]:
+        """
+        Decide whether the cheap answer is final.
+        Returns:
+            Tuple[str | None, bool | None, str]: The escalation reason (None to accept, "audit" for an audit),
+                the cheap verdict, and the cleaned cheap answer.
+        """
+        if not res:
+            raise ValueError("The LLM said nothing")
+        is_correct, _, confidence, verdict_text = self._parse_cascade(res)
+        reason = self._escalation_reason(is_correct, confidence)
+        with self._lock:
+            self.stats["inspections"] += 1
+            if reason is not None:
+                self.stats["escalations"] += 1
+                self.stats["reasons"][reason] += 1
+            elif self.audit_rate and random.random() < self.audit_rate:
+                self.stats["audited"] += 1
+                reason = "audit"
+        return reason, is_correct, verdict_text
+
+    def _record_agreement(self, cheap_verdict: bool | None, strong_res: str) -> None:
+        if cheap_verdict is None:
+            return
+        strong_verdict, _ = self._parse_output(strong_res)
+        with self._lock:
+            self.stats["compared"] += 1
+            self.stats["agreed"] += int(strong_verdict == cheap_verdict)
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # first stage: the cheap model with the confidence prompt.
+        res = self.instance.chat(self._build_messages(context))
+        reason, cheap_verdict, verdict_text = self._route(res)
+        if reason is None:
+            return self._update_context(context, verdict_text)
+
+        # second stage: the strong model with the plain inspector prompt, its verdict is final.
+        strong_res = self.strong.instance.chat(self.strong._build_messages(context))
+        self._record_agreement(cheap_verdict, strong_res)
+        return self.strong._update_context(context, strong_res)
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        res = await self.async_instance.chat(self._build_messages(context))
+        reason, cheap_verdict, verdict_text = self._route(res)
+        if reason is None:
+            return self._update_context(context, verdict_text)
+
+        strong_res = await self.strong.async_instance.chat(self.strong._build_messages(context))
+        self._record_agreement(cheap_verdict, strong_res)
+        return self.strong._update_context(context, strong_res)
+
+    def escalation_rate(self) -> float:
+        n = self.stats["inspections"]
+        return self.stats["escalations"] / n if n else 0.0
+
+    def agreement_rate(self) -> float:
+        n = self.stats["compared"]
+        return self.stats["agreed"] / n if n else 0.0
+
+
+if __name__ == "__main__":
+    # test with python -m nl2sh.agents.cascade_inspector
+    inspector = CascadeInspector()
+    context = {'usr_input': 'List all files in the current directory with their sizes.',
+               'composer_history': ['ls -l'], 'inspector_history': [], 'state': 'composed'}
+    context = inspector.execute(context)
+    print(context, inspector.stats)
@@ -1,6 +1,8 @@
-from nl2sh.agents.llm_service import LLMService
+from typing import Any, Dict, List
+
+from nl2sh.agents.llm_service import AsyncLLMService, LLMService
+from nl2sh.agents.response_cache import ResponseCache
 from nl2sh.prompts.clarifier_pmpt import clarifier_prompt
-from typing import Dict, Any
 
 """
 context = {
@@ -24,18 +26,21 @@ class Clarifier:
         model (str): The LLM model to use.
         name (str): The name of the agent.
         instance (LLMService): An instance of the LLM service.
+        async_instance (AsyncLLMService): An instance of the async LLM service, used by aexecute.
         template (str): The prompt template for clarification.
     Methods:
         execute(context: Dict[str, Any]) -> Dict[str, Any]: Clarifies the user input and updates the context.
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]: Async version of execute.
     """
 
-    def __init__(self, model: str = "gpt-4o-mini") -> None:
+    def __init__(self, model: str = "gpt-4o-mini", cache: ResponseCache | None = None) -> None:
         self.model = model
         self.name = "clarifier"
-        self.instance = LLMService(model=model)
+        self.instance = LLMService(model=model, cache=cache)
+        self.async_instance = AsyncLLMService(model=model, cache=cache)
         self.template = clarifier_prompt
 
-    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+    def _build_messages(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
         if "usr_input" not in context:
             # (this should not happen) make sure the user input is provided
             raise KeyError("Missing usr_input in context")
@@ -45,9 +50,9 @@ class Clarifier:
         # format the prompt: replace the placeholder with the actual user input
         prompt = self.template.replace("{{USER_NATURAL_LANGUAGE_REQUEST}}", usr_input)
 
-        res = self.instance.chat(
-            [{"role": "user", "content": prompt}]
-        )
+        return [{"role": "user", "content": prompt}]
+
+    def _update_context(self, context: Dict[str, Any], res: str) -> Dict[str, Any]:
         if not res:
             # make sure the LLM returned a response
             raise ValueError("The LLM said nothing")
@@ -59,6 +64,15 @@ class Clarifier:
         context["state"] = "clarified"
         return context
 
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        res = self.instance.chat(self._build_messages(context))
+        return self._update_context(context, res)
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # same as execute, but awaits the async LLM service
+        res = await self.async_instance.chat(self._build_messages(context))
+        return self._update_context(context, res)
+
 
 if __name__ == "__main__":
     # test with python -m nl2sh.agents.clarifier
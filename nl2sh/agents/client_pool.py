@@ -0,0 +1,206 @@
+"""
+    Process-wide pool of OpenAI clients shared by every LLMService
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, Tuple
+
+if TYPE_CHECKING:
+    # openai and httpx are imported when the first client is built, see pooled_transport
+    from openai import AsyncOpenAI, OpenAI
+
+"""
+Every LLMService used to build its own OpenAI client, so the three agents of an Inference and every Evaluator
+had separate connection pools, keep-alive sockets and TLS sessions. Here we keep one sync client per
+(api_key, base_url) for the whole process, and one async client per (api_key, base_url, event loop), since an
+httpx.AsyncClient must not outlive the loop its connections were opened on.
+"""
+
+# pool settings, change them with configure_pool() before the first client is built.
+_CONFIG: Dict[str, Any] = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 30.0,
+    "http2": False,
+}
+
+_LOCK = threading.Lock()
+_CLIENTS: Dict[Tuple[str | None, str | None], OpenAI] = {}
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()    # event loop -> {(api_key, base_url): AsyncOpenAI}
+_TRANSPORTS = weakref.WeakSet()    # every live pooled transport, used by pool_stats()
+
+
+class PoolStats:
+    """
+    Thread-safe counters shared by all pooled transports.
+    Attributes:
+        requests (int): Number of HTTP requests sent through the pool.
+        connections_opened (int): Number of new TCP connections (each one pays the TCP + TLS handshake).
+        connections_reused (int): Number of requests served on an already open keep-alive connection.
+        waited (int): Number of requests that started while every connection slot was busy.
+        in_flight (int): Number of requests currently in flight.
+        peak_in_flight (int): Highest number of requests in flight at the same time.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.waited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def enter(self, max_connections: int) -> None:
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= max_connections:
+                # all slots are taken, this request has to wait for a free connection.
+                self.waited += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self, opened_new: bool) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if opened_new:
+                self.connections_opened += 1
+            else:
+                self.connections_reused += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = self.connections_opened = self.connections_reused = 0
+            self.waited = self.peak_in_flight = 0
+
+
+STATS = PoolStats()
+
+
+def _open_connections(transport: Any) -> int:
+    # httpx keeps the httpcore pool on a private attribute, so be defensive here.
+    pool = getattr(transport, "_pool", None)
+    conns = getattr(pool, "connections", None)
+    return len(conns) if conns is not None else 0
+
+
+
+def configure_pool(max_connections: int | None = None,
+                   max_keepalive_connections: int | None = None,
+                   keepalive_expiry: float | None = None,
+                   http2: bool | None = None) -> None:
+    """
+    Change the pool settings. Clients that were already built keep their old settings, so call this
+    before creating any agent (or call reset_pool() afterwards).
+    Args:
+        max_connections (int | None): Maximum number of concurrent connections per client.
+        max_keepalive_connections (int | None): Maximum number of idle keep-alive connections kept open.
+        keepalive_expiry (float | None): Seconds an idle connection stays in the pool.
+        http2 (bool | None): Whether to negotiate HTTP/2. Needs the `h2` package (pip install 'httpx[http2]').
+    """
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            raise ImportError("HTTP/2 needs the 'h2' package. Please install it via pip install 'httpx[http2]'.")
+
+    updates = {
+        "max_connections": max_connections,
+        "max_keepalive_connections": max_keepalive_connections,
+        "keepalive_expiry": keepalive_expiry,
+        "http2": http2,
+    }
+    with _LOCK:
+        _CONFIG.update({k: v for k, v in updates.items() if v is not None})
+
+
+def _transport_kwargs() -> Dict[str, Any]:
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=_CONFIG["max_connections"],
+            max_keepalive_connections=_CONFIG["max_keepalive_connections"],
+            keepalive_expiry=_CONFIG["keepalive_expiry"],
+        ),
+        "http2": _CONFIG["http2"],
+    }
+
+
+def get_client(api_key: str | None, base_url: str | None = None) -> OpenAI:
+    """
+    Return the shared sync OpenAI client for (api_key, base_url), building it on first use.
+    """
+    key = (api_key, base_url)
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            from openai import DefaultHttpxClient, OpenAI
+
+            from nl2sh.agents.pooled_transport import PooledTransport
+
+            transport = PooledTransport(**_transport_kwargs())
+            _TRANSPORTS.add(transport)
+            client = OpenAI(api_key=api_key, base_url=base_url,
+                            http_client=DefaultHttpxClient(transport=transport))
+            _CLIENTS[key] = client
+        return client
+
+
+def get_async_client(api_key: str | None, base_url: str | None = None) -> AsyncOpenAI:
+    """
+    Return the shared async OpenAI client for (api_key, base_url) on the running event loop.
+    Must be called from inside a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    key = (api_key, base_url)
+    with _LOCK:
+        per_loop = _ASYNC_CLIENTS.setdefault(loop, {})
+        client = per_loop.get(key)
+        if client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            from nl2sh.agents.pooled_transport import AsyncPooledTransport
+
+            transport = AsyncPooledTransport(**_transport_kwargs())
+            _TRANSPORTS.add(transport)
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url,
+                                 http_client=DefaultAsyncHttpxClient(transport=transport))
+            per_loop[key] = client
+        return client
+
+
+def pool_stats() -> Dict[str, int]:
+    """
+    Snapshot of the pool statistics.
+    Returns:
+        Dict[str, int]: requests, connections_open, connections_opened, connections_reused, waited, in_flight and peak_in_flight.
+    """
+    with _LOCK:
+        open_now = sum(_open_connections(t.inner) for t in list(_TRANSPORTS))
+    return {
+        "requests": STATS.requests,
+        "connections_open": open_now,
+        "connections_opened": STATS.connections_opened,
+        "connections_reused": STATS.connections_reused,
+        "waited": STATS.waited,
+        "in_flight": STATS.in_flight,
+        "peak_in_flight": STATS.peak_in_flight,
+    }
+
+
+def reset_pool() -> None:
+    """
+    Close every pooled sync client and forget all clients, so the next call builds new ones with the current settings.
+    Async clients are dropped together with their event loop.
+    """
+    with _LOCK:
+        for client in _CLIENTS.values():
+            client.close()
+        _CLIENTS.clear()
+        _ASYNC_CLIENTS.clear()
+        _TRANSPORTS.clear()
+    STATS.reset()
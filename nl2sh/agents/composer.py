@@ -1,6 +1,13 @@
-from nl2sh.agents.llm_service import LLMService
+import time
+from typing import TYPE_CHECKING, Any, Dict, List
+
+from nl2sh import tracing
+from nl2sh.agents.llm_service import AsyncLLMService, LLMService
+from nl2sh.agents.response_cache import ResponseCache
 from nl2sh.prompts.composer_pmpt import composer_prompt
-from typing import Dict, Any
+
+if TYPE_CHECKING:
+    from nl2sh.retrieval import RetrievalIndex
 
 """
 context = {
@@ -16,6 +23,20 @@ context = {
 }
 """
 
+def complete_command(text: str) -> str | None:
+    """
+    Used while streaming: returns the command once the first fenced block of the answer is closed, otherwise None.
+    A command without a fence may still go on to the next line (`cd /tmp` then `ls`), so it is only taken when
+    the stream ends.
+    """
+    lines = text.split("\n")[:-1]
+    fences = [i for i, line in enumerate(lines) if line.strip().startswith("```")]
+    if len(fences) < 2:
+        return None
+    cmd = "\n".join(lines[fences[0] + 1:fences[1]]).strip()
+    return cmd or None
+
+
 class Composer:
     """
     The Composer agent that generates shell commands based on clarified user input and previous feedback.
@@ -23,18 +44,30 @@ class Composer:
         model (str): The language model to use for command generation.
         name (str): The name of the agent.
         instance (LLMService): An instance of the LLMService for interacting with the language model.
+        async_instance (AsyncLLMService): An instance of the AsyncLLMService, used by aexecute.
         sys_pmt (str): The system prompt guiding the agent's behavior.
+        stream (bool): If True, the answer is streamed. A fenced command is handed off at its closing fence and
+            the rest of the answer is not read; any other answer is taken whole at the end of the stream.
+        index (RetrievalIndex | None): If given, the few_shot most similar vetted pairs are put in front of the
+            task as example turns.
+        few_shot (int): Number of retrieved examples.
     Methods:
         execute(context: Dict[str, Any]) -> Dict[str, Any]: Generates a shell command based on the provided context and updates the context with the new command.
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]: Async version of execute.
     """
 
-    def __init__(self, model: str = "gpt-4o-mini") -> None:
+    def __init__(self, model: str = "gpt-4o-mini", cache: ResponseCache | None = None, stream: bool = False,
+                 index: "RetrievalIndex | None" = None, few_shot: int = 3) -> None:
         self.model = model
         self.name = "composer"
-        self.instance = LLMService(model=model)
+        self.instance = LLMService(model=model, cache=cache)
+        self.async_instance = AsyncLLMService(model=model, cache=cache)
         self.sys_pmt = composer_prompt
+        self.stream = stream
+        self.index = index
+        self.few_shot = few_shot
 
-    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+    def _build_messages(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
         usr_pmt = ''    # buffer of user prompt
         if 'clarifier' in context:
             # if there is a clarified version, use it.
@@ -65,12 +98,24 @@ class Composer:
         # format the prompt to OpenAI chat format
         pmt_set =  [
             {"role": "system", "content": self.sys_pmt},
+            *self._examples(context),
             {"role": "user", "content": usr_pmt},
         ]
         # print(pmt_set)
+        return pmt_set
 
-        # call the LLM service
-        res = self.instance.chat(pmt_set)
+    def _examples(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # retrieved pairs as user / assistant turns, in the format of the fine-tune data
+        if self.index is None or self.few_shot <= 0:
+            return []
+        examples = []
+        # the raw input is closer to the indexed tasks than the clarified description
+        for hit in self.index.search(context.get('usr_input') or context.get('clarifier', ''), k=self.few_shot):
+            examples.append({"role": "user", "content": hit["task"]})
+            examples.append({"role": "assistant", "content": hit["command"]})
+        return examples
+
+    def _update_context(self, context: Dict[str, Any], res: str) -> Dict[str, Any]:
         if not res:
             raise ValueError("The LLM said nothing")
 
@@ -85,6 +130,48 @@ class Composer:
         context['state'] = 'composed'
         return context
 
+    def _stream_command(self, messages: List[Dict[str, Any]]) -> str:
+        start = time.perf_counter()
+        text = ''
+        deltas = self.instance.stream(messages)
+        try:
+            for delta in deltas:
+                text += delta
+                # a fence can only close at the end of a line
+                if '\n' in delta and (cmd := complete_command(text)) is not None:
+                    return cmd
+        finally:
+            # closing the generator closes the HTTP stream when we stopped early
+            deltas.close()
+            tracing.note_decision(time.perf_counter() - start)
+        return text
+
+    async def _astream_command(self, messages: List[Dict[str, Any]]) -> str:
+        start = time.perf_counter()
+        text = ''
+        deltas = self.async_instance.stream(messages)
+        try:
+            async for delta in deltas:
+                text += delta
+                if '\n' in delta and (cmd := complete_command(text)) is not None:
+                    return cmd
+        finally:
+            await deltas.aclose()
+            tracing.note_decision(time.perf_counter() - start)
+        return text
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # call the LLM service
+        messages = self._build_messages(context)
+        res = self._stream_command(messages) if self.stream else self.instance.chat(messages)
+        return self._update_context(context, res)
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # same as execute, but awaits the async LLM service
+        messages = self._build_messages(context)
+        res = await self._astream_command(messages) if self.stream else await self.async_instance.chat(messages)
+        return self._update_context(context, res)
+
 
 if __name__ == "__main__":
     model = "gpt-4o-mini"
@@ -1,6 +1,10 @@
+import time
+from typing import Any, Dict, List
+
+from nl2sh import tracing
+from nl2sh.agents.llm_service import AsyncLLMService, LLMService
+from nl2sh.agents.response_cache import ResponseCache
 from nl2sh.prompts.inspector_pmpt import inspector_pmt
-from typing import Dict, Any
-from nl2sh.agents.llm_service import LLMService
 
 """
 context = {
@@ -24,18 +28,25 @@ class Inspector:
         model (str): The language model to be used for inspection.
         name (str): The name of the agent.
         instance (LLMService): An instance of the LLMService for interacting with the language model.
+        async_instance (AsyncLLMService): An instance of the AsyncLLMService, used by aexecute.
         template (str): The prompt template used for inspection.
+        stream (bool): If True, the answer is streamed and a first line of exactly "CORRECT" ends the call right away.
+            An INCORRECT verdict is settled as early, but the guide is still read to the end.
     Methods:
         _parse_output(o: str) -> Tuple[Optional[bool], Optional[str]]:
             Parses the output from the language model to determine if the command is correct.
         execute(context: Dict[str, Any]) -> Dict[str, Any]:
             Executes the inspection process on the provided context and updates it accordingly. 
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]:
+            Async version of execute.
     """
-    def __init__(self, model: str = 'gpt-5.1'):
+    def __init__(self, model: str = 'gpt-5.1', cache: ResponseCache | None = None, stream: bool = False):
         self.model = model
         self.name = "inspector"
-        self.instance = LLMService(model=model)
+        self.instance = LLMService(model=model, cache=cache)
+        self.async_instance = AsyncLLMService(model=model, cache=cache)
         self.template = inspector_pmt
+        self.stream = stream
 
     def _parse_output(self, o: str):
         """
@@ -67,7 +78,7 @@ class Inspector:
 
         return None, None
 
-    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+    def _build_messages(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
         task = ''   # init task buffer.
 
         if 'clarifier' in context:
@@ -94,10 +105,9 @@ class Inspector:
                   .replace('{{TASK_DESCRIPTION}}', task)
                   .replace('{{USER_COMMAND}}', to_judge))
 
-        # call the LLM service.
-        res = self.instance.chat(
-            [{"role": "system", "content": prompt}]
-        )
+        return [{"role": "system", "content": prompt}]
+
+    def _update_context(self, context: Dict[str, Any], res: str) -> Dict[str, Any]:
         if not res:
             raise ValueError("The LLM said nothing")
 
@@ -119,6 +129,71 @@ class Inspector:
 
         return context
 
+    @staticmethod
+    def _early_verdict(text: str) -> bool | None:
+        """
+        The verdict as soon as the streamed answer settles it: True once its first line is complete and is exactly
+        CORRECT (the rule of _parse_output), False as soon as it starts with INCORRECT, None while undecided.
+        """
+        head = text.lstrip()
+        if head.startswith("INCORRECT"):
+            return False
+        if "\n" in head and head.split("\n", 1)[0].strip() == "CORRECT":
+            return True
+        return None
+
+    def _stream_verdict(self, messages: List[Dict[str, Any]]) -> str:
+        start = time.perf_counter()
+        text, decided = '', False
+        deltas = self.instance.stream(messages)
+        try:
+            for delta in deltas:
+                text += delta
+                verdict = None if decided else self._early_verdict(text)
+                if verdict is not None:
+                    decided = True
+                    tracing.note_decision(time.perf_counter() - start)
+                if verdict is True:
+                    # nothing after the CORRECT line matters, drop the rest of the answer.
+                    return "CORRECT"
+        finally:
+            deltas.close()
+        if not decided:
+            # a one-line answer is only settled by the end of the stream
+            tracing.note_decision(time.perf_counter() - start)
+        return text
+
+    async def _astream_verdict(self, messages: List[Dict[str, Any]]) -> str:
+        start = time.perf_counter()
+        text, decided = '', False
+        deltas = self.async_instance.stream(messages)
+        try:
+            async for delta in deltas:
+                text += delta
+                verdict = None if decided else self._early_verdict(text)
+                if verdict is not None:
+                    decided = True
+                    tracing.note_decision(time.perf_counter() - start)
+                if verdict is True:
+                    return "CORRECT"
+        finally:
+            await deltas.aclose()
+        if not decided:
+            tracing.note_decision(time.perf_counter() - start)
+        return text
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # call the LLM service.
+        messages = self._build_messages(context)
+        res = self._stream_verdict(messages) if self.stream else self.instance.chat(messages)
+        return self._update_context(context, res)
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # same as execute, but awaits the async LLM service.
+        messages = self._build_messages(context)
+        res = await self._astream_verdict(messages) if self.stream else await self.async_instance.chat(messages)
+        return self._update_context(context, res)
+
 
 if __name__ == "__main__":
     inspector = Inspector()
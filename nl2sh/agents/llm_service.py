@@ -1,19 +1,45 @@
 """
     LLM service wrapper for OpenAI API
 """
+from __future__ import annotations
 
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
-from typing import List, Dict, Any
 import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, List, Tuple
+
+from nl2sh import deadline, tracing
+from nl2sh.agents.client_pool import get_async_client, get_client
+from nl2sh.agents.response_cache import ResponseCache
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
 """
 As a convention, we save the key in the .env file as OPENAI_KEY in the project root directory.
-We load it here and save as a global constant KEY.
+It is loaded on first use by api_key(), so importing this module does not touch the file system or the SDK.
+KEY is still available as a module attribute.
 """
-load_dotenv()
-KEY = os.getenv("OPENAI_KEY")
+_KEY_LOCK = threading.Lock()
+_KEY: Dict[str, str | None] = {}
+
+
+def api_key() -> str | None:
+    with _KEY_LOCK:
+        if "key" not in _KEY:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _KEY["key"] = os.getenv("OPENAI_KEY")
+        return _KEY["key"]
+
+
+def __getattr__(name: str) -> Any:
+    # lazy module attribute, for `from nl2sh.agents.llm_service import KEY`
+    if name == "KEY":
+        return api_key()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class LLMService:
@@ -22,15 +48,40 @@ class LLMService:
     Uses the OpenAI Python SDK to interact with the API.
     Attributes:
         model (str): The model to use for the LLM service.
-        client (OpenAI): The OpenAI client instance.
+        client (OpenAI): The OpenAI client instance, shared with every other LLMService (see client_pool). Built on first use.
+        cache (ResponseCache | None): Optional response cache. None disables caching.
+        params (Dict[str, Any]): Extra sampling parameters passed to responses.create (e.g. temperature).
     Methods:
         chat(messages: List[Dict[str, Any]]) -> str: Sends a chat request to the LLM service and returns the response as a string.
+        chat_with_meta(messages: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]: Same as chat, plus the response headers and token usage.
         chat_json(messages: List[Dict[str, Any]]) -> Any: Sends a chat request to the LLM service and returns the response parsed as JSON.
+        stream(messages: List[Dict[str, Any]]) -> Iterator[str]: Sends a chat request and yields the text deltas as they arrive.
     """
 
-    def __init__(self, model = "gpt-4-mini") -> None:
-        self.client = OpenAI(api_key=KEY)
+    def __init__(self, model = "gpt-4-mini",
+                 cache: ResponseCache | None = None,
+                 params: Dict[str, Any] | None = None) -> None:
         self.model = model
+        self.cache = cache
+        self.params = params or {}
+        self._client: OpenAI | None = None
+
+    @property
+    def client(self) -> OpenAI:
+        # the client comes from the process-wide pool, so all agents share connections.
+        # it is built on the first call, not when the agent is constructed.
+        if self._client is None:
+            self._client = get_client(api_key())
+        return self._client
+
+    def _call_client(self, max_retries: int | None = None) -> OpenAI:
+        # under a task deadline (see nl2sh/deadline.py) the time left is the request timeout, and a timed-out
+        # request is not retried: the FSM returns its best command instead.
+        timeout = deadline.request_timeout()
+        options: Dict[str, Any] = {} if max_retries is None else {"max_retries": max_retries}
+        if timeout is not None:
+            options.update(timeout=timeout, max_retries=0)
+        return self.client.with_options(**options) if options else self.client
 
     def chat(self, messages: List[Dict[str, Any]]) -> str:
         """
@@ -40,18 +91,201 @@ class LLMService:
             {"role": "user", "content": "Hello"},
         ]
         """
-        resp = self.client.responses.create(
+        text, _ = self.chat_with_meta(messages)
+        return text
+
+    def chat_with_meta(self, messages: List[Dict[str, Any]],
+                       max_retries: int | None = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Same as chat, but also returns the response metadata.
+        Args:
+            messages (List[Dict[str, Any]]): The chat messages.
+            max_retries (int | None): Override the SDK retries, e.g. 0 when the caller handles rate limits itself.
+        Returns:
+            Tuple[str, Dict[str, Any]]: The text and {"headers": dict, "total_tokens": int, "cached": bool}.
+        """
+        key = None
+        if self.cache is not None:
+            # the cache is opt-in; it is keyed on the model, the messages and the sampling parameters.
+            key = self.cache.make_key(self.model, messages, self.params)
+            hit = self.cache.get(key)
+            if hit is not None:
+                tracing.record_llm_call(None, 0.0, cached=True)
+                return hit, {"headers": {}, "total_tokens": 0, "cached": True}
+
+        client = self._call_client(max_retries)
+        start = time.perf_counter()
+        raw = client.responses.with_raw_response.create(
             model=self.model,
             input=messages,
+            **self.params,
         )
+        resp = raw.parse()
+        # token usage and network wait go to the span of the running agent, if it is traced
+        tracing.record_llm_call(resp.usage, time.perf_counter() - start)
 
         # we only want the text content of the response
-        return resp.output_text
+        text = resp.output_text
+        if key is not None:
+            self.cache.put(key, self.model, text)
+        meta = {
+            "headers": dict(raw.headers),
+            "total_tokens": resp.usage.total_tokens if resp.usage else 0,
+            "cached": False,
+        }
+        return text, meta
 
     def chat_json(self, messages: List[Dict[str, Any]]) -> Any:
         text = self.chat(messages)
         return json.loads(text)
 
+    def stream(self, messages: List[Dict[str, Any]]) -> Iterator[str]:
+        """
+        Same as chat, but yields the text deltas as they arrive. The caller may stop early (break, or close the
+        generator); the HTTP stream is then closed and the rest of the answer is not read.
+        A cache hit is yielded as a single delta, and only complete answers are stored in the cache.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, messages, self.params)
+            hit = self.cache.get(key)
+            if hit is not None:
+                tracing.record_llm_call(None, 0.0, cached=True)
+                yield hit
+                return
+
+        client = self._call_client()
+        start = time.perf_counter()
+        stream = client.responses.create(
+            model=self.model,
+            input=messages,
+            stream=True,
+            **self.params,
+        )
+        parts, usage, first = [], None, True
+        try:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    if first:
+                        tracing.note_ttft(time.perf_counter() - start)
+                        first = False
+                    parts.append(event.delta)
+                    yield event.delta
+                elif event.type == "response.completed":
+                    usage = event.response.usage
+        finally:
+            # also runs when the caller stops early: drop the connection instead of reading the rest
+            stream.close()
+            tracing.record_llm_call(usage, time.perf_counter() - start)
+
+        if key is not None:
+            self.cache.put(key, self.model, "".join(parts))
+
+
+class AsyncLLMService:
+    """
+    Asyncio variant of LLMService, built on the async OpenAI client.
+    It exposes the same interface, but every call has to be awaited, so many requests can wait on the network at once.
+    Attributes:
+        model (str): The model to use for the LLM service.
+        client (AsyncOpenAI): The pooled async OpenAI client of the running event loop.
+        cache (ResponseCache | None): Optional response cache. None disables caching.
+        params (Dict[str, Any]): Extra sampling parameters passed to responses.create (e.g. temperature).
+    Methods:
+        chat(messages: List[Dict[str, Any]]) -> str: Sends a chat request to the LLM service and returns the response as a string.
+        chat_json(messages: List[Dict[str, Any]]) -> Any: Sends a chat request to the LLM service and returns the response parsed as JSON.
+        stream(messages: List[Dict[str, Any]]) -> AsyncIterator[str]: Async version of LLMService.stream.
+    """
+
+    def __init__(self, model = "gpt-4-mini",
+                 cache: ResponseCache | None = None,
+                 params: Dict[str, Any] | None = None) -> None:
+        self.model = model
+        self.cache = cache
+        self.params = params or {}
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # async clients are bound to an event loop, so we take the pooled one of the running loop.
+        return get_async_client(api_key())
+
+    def _call_client(self) -> AsyncOpenAI:
+        # same as LLMService._call_client
+        timeout = deadline.request_timeout()
+        if timeout is None:
+            return self.client
+        return self.client.with_options(timeout=timeout, max_retries=0)
+
+    async def chat(self, messages: List[Dict[str, Any]]) -> str:
+        """
+        Same message format as LLMService.chat.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, messages, self.params)
+            hit = self.cache.get(key)
+            if hit is not None:
+                tracing.record_llm_call(None, 0.0, cached=True)
+                return hit
+
+        client = self._call_client()
+        start = time.perf_counter()
+        resp = await client.responses.create(
+            model=self.model,
+            input=messages,
+            **self.params,
+        )
+        tracing.record_llm_call(resp.usage, time.perf_counter() - start)
+
+        # we only want the text content of the response
+        text = resp.output_text
+        if key is not None:
+            self.cache.put(key, self.model, text)
+        return text
+
+    async def chat_json(self, messages: List[Dict[str, Any]]) -> Any:
+        text = await self.chat(messages)
+        return json.loads(text)
+
+    async def stream(self, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """
+        Same as LLMService.stream. Close the generator (aclose) when stopping early.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model, messages, self.params)
+            hit = self.cache.get(key)
+            if hit is not None:
+                tracing.record_llm_call(None, 0.0, cached=True)
+                yield hit
+                return
+
+        client = self._call_client()
+        start = time.perf_counter()
+        stream = await client.responses.create(
+            model=self.model,
+            input=messages,
+            stream=True,
+            **self.params,
+        )
+        parts, usage, first = [], None, True
+        try:
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    if first:
+                        tracing.note_ttft(time.perf_counter() - start)
+                        first = False
+                    parts.append(event.delta)
+                    yield event.delta
+                elif event.type == "response.completed":
+                    usage = event.response.usage
+        finally:
+            await stream.close()
+            tracing.record_llm_call(usage, time.perf_counter() - start)
+
+        if key is not None:
+            self.cache.put(key, self.model, "".join(parts))
+
 
 if __name__ == "__main__":
     # ft:gpt-4o-mini-2024-07-18:personal:dl-prj-2-750-filtered:CeGCZAoF
@@ -0,0 +1,83 @@
+"""
+    httpx transports of the client pool
+"""
+
+import time
+from typing import Any, Dict
+
+import httpx
+
+from nl2sh import tracing
+from nl2sh.agents.client_pool import STATS
+
+"""
+Kept apart from client_pool so that httpx (and openai) are only imported when the first client is built.
+"""
+
+
+class PooledTransport(httpx.BaseTransport):
+    """
+    Wraps httpx.HTTPTransport and reports to STATS. A request is counted as a new connection
+    when httpcore traces a TCP connect for it, otherwise it reused a keep-alive connection.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        self.inner = httpx.HTTPTransport(**kwargs)
+        self.max_connections = kwargs["limits"].max_connections or 1 << 30
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        opened = []
+        prev_trace = request.extensions.get("trace")
+
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.started":
+                opened.append(True)
+            if prev_trace is not None:
+                prev_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        STATS.enter(self.max_connections)
+        start = time.perf_counter()
+        try:
+            # returns as soon as the response headers are in, so this is the time to first byte
+            response = self.inner.handle_request(request)
+            tracing.note_ttfb(time.perf_counter() - start)
+            return response
+        finally:
+            STATS.leave(bool(opened))
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncPooledTransport(httpx.AsyncBaseTransport):
+    """
+    Async version of PooledTransport.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        self.inner = httpx.AsyncHTTPTransport(**kwargs)
+        self.max_connections = kwargs["limits"].max_connections or 1 << 30
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        opened = []
+        prev_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.started":
+                opened.append(True)
+            if prev_trace is not None:
+                await prev_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        STATS.enter(self.max_connections)
+        start = time.perf_counter()
+        try:
+            response = await self.inner.handle_async_request(request)
+            tracing.note_ttfb(time.perf_counter() - start)
+            return response
+        finally:
+            STATS.leave(bool(opened))
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
@@ -0,0 +1,214 @@
+import asyncio
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+from typing import Any, Dict, List
+
+from nl2sh.data.shellcheck import run_shellcheck
+
+"""
+context = {
+    "usr_input": "xxx",
+    "clarifier": "yyy",
+    "composer_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "inspector_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "state": "sss"
+}
+"""
+
+# words that may appear in command position but are not binaries on PATH
+BASH_KEYWORDS = {
+    "if", "then", "else", "elif", "fi", "case", "esac", "for", "select", "while", "until", "do", "done",
+    "in", "function", "time", "coproc", "{", "}", "!", "[[", "]]",
+}
+BASH_BUILTINS = {
+    ".", ":", "[", "alias", "bg", "bind", "break", "builtin", "caller", "cd", "command", "compgen", "complete",
+    "compopt", "continue", "declare", "dirs", "disown", "echo", "enable", "eval", "exec", "exit", "export",
+    "false", "fc", "fg", "getopts", "hash", "help", "history", "jobs", "kill", "let", "local", "logout",
+    "mapfile", "popd", "printf", "pushd", "pwd", "read", "readarray", "readonly", "return", "set", "shift",
+    "shopt", "source", "suspend", "test", "times", "trap", "true", "type", "typeset", "ulimit", "umask",
+    "unalias", "unset", "wait",
+}
+# words after which the next word is again a command ("()" ends a function name, "<(" starts a process substitution)
+COMMAND_SEPARATORS = {"|", "||", "&&", ";", ";;", "&", "(", "|&", "\n", "()", "<(", ">("}
+# prefixes that run the next word as a command
+COMMAND_PREFIXES = {"sudo", "nohup", "xargs", "exec", "command", "builtin", "time", "nice", "env", "!"}
+
+ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\[[^]]*\])?\+?=")
+FUNCTION_DEF = re.compile(r"(?:function\s+)?([A-Za-z_][\w-]*)\s*\(\s*\)")
+# <<WORD, <<-WORD, <<'WORD' and <<"WORD", but not the here-string <<<
+HEREDOC = re.compile(r"(?<!<)<<(?!<)(-?)\s*(?:'([^']*)'|\"([^\"]*)\"|\\?([^\s;&|<>()'\"]+))")
+
+
+class PreInspector:
+    """
+    Local, LLM-free inspection that runs before the Inspector. It only looks for hard errors:
+    a leaked markdown fence, a bash syntax error (bash -n), a shellcheck error and a command that is not installed.
+    If it finds one, the state goes straight to not_passed with a machine-generated suggestion, so the expensive
+    inspector round trip is skipped. Otherwise the command is handed over to the Inspector.
+    Attributes:
+        name (str): The name of the agent.
+        model (str): Always "local", kept for the same interface as the other agents.
+        use_shellcheck (bool): Whether to run shellcheck (skipped anyway if it is not installed).
+        check_binaries (bool): Whether to report commands that cannot be found on PATH.
+        checked (int): Number of commands checked.
+        rejected (int): Number of commands rejected, i.e. inspector calls avoided.
+    Methods:
+        find_errors(cmd: str) -> List[str]: Returns the hard errors found in the command.
+        execute(context: Dict[str, Any]) -> Dict[str, Any]: Checks the latest command and updates the context.
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]: Async version of execute.
+        avoided_rate() -> float: Fraction of inspections that did not need the LLM inspector.
+    """
+
+    def __init__(self, use_shellcheck: bool = True, check_binaries: bool = True) -> None:
+        self.name = "pre_inspector"
+        self.model = "local"
+        self.use_shellcheck = use_shellcheck and shutil.which("shellcheck") is not None
+        self.check_binaries = check_binaries
+        self.checked = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _syntax_error(cmd: str) -> str | None:
+        # bash -n parses the script without running anything
+        proc = subprocess.run(["bash", "-n"], input=cmd, capture_output=True, text=True)
+        if proc.returncode == 0:
+            return None
+        msg = proc.stderr.strip().splitlines()
+        return msg[0] if msg else "bash could not parse the command"
+
+    @staticmethod
+    def _strip_heredocs(cmd: str) -> str:
+        """
+        Drop the bodies of the here-documents, which are data, not commands. The line with the << operator is kept.
+        """
+        lines, delimiters = [], []
+        for line in cmd.split("\n"):
+            if delimiters:
+                strip_tabs, word = delimiters[0]
+                if (line.lstrip("\t") if strip_tabs else line) == word:
+                    delimiters.pop(0)
+                continue
+            lines.append(line)
+            for m in HEREDOC.finditer(line):
+                delimiters.append((m.group(1) == "-", next(g for g in m.groups()[1:] if g is not None)))
+        return "\n".join(lines)
+
+    @staticmethod
+    def _command_names(cmd: str) -> List[str]:
+        """
+        Best-effort list of the words in command position. Anything with an expansion in it is skipped,
+        and so are case statements, whose patterns look like commands, and here-document bodies.
+        """
+        lexer = shlex.shlex(PreInspector._strip_heredocs(cmd), posix=True, punctuation_chars=";&|()<>")
+        lexer.whitespace = " \t"
+        lexer.wordchars += "$`{}[]!.:/~-+=,%@^*?"
+        try:
+            tokens = list(lexer)
+        except ValueError:
+            # unbalanced quotes, bash -n reports those
+            return []
+        if "case" in tokens:
+            return []
+
+        defined = set(FUNCTION_DEF.findall(cmd))
+        names, expect_cmd, i = [], True, 0
+        while i < len(tokens):
+            tok = tokens[i]
+            i += 1
+            if tok in COMMAND_SEPARATORS:
+                expect_cmd = True
+                continue
+            if tok[0] in "<>" or (tok.isdigit() and i < len(tokens) and tokens[i][0] in "<>"):
+                # a redirection: skip it and its target
+                if tok.isdigit():
+                    i += 1
+                i += 1
+                continue
+            if not expect_cmd:
+                continue
+            if tok in ("for", "select"):
+                # the next word is a loop variable, not a command
+                expect_cmd = False
+                continue
+            if ASSIGNMENT.match(tok) or tok in BASH_KEYWORDS or tok in COMMAND_PREFIXES:
+                # still waiting for the actual command
+                continue
+            expect_cmd = False
+            if any(c in tok for c in "$`*?/=") or tok.startswith("-") or tok in defined:
+                continue
+            names.append(tok)
+        return names
+
+    def find_errors(self, cmd: str) -> List[str]:
+        """
+        Look for hard errors in a command.
+        Args:
+            cmd (str): The bash command.
+        Returns:
+            List[str]: Human-readable descriptions of the hard errors. Empty if none was found.
+        """
+        if not cmd.strip():
+            return ["The command is empty. Output a bash command."]
+
+        if "```" in cmd:
+            return ["Remove the markdown code fence and output only the bash command."]
+
+        syntax = self._syntax_error(cmd)
+        if syntax:
+            return [f"Fix the bash syntax error: {syntax}"]
+
+        errors = []
+        if self.use_shellcheck:
+            for issue in run_shellcheck(cmd) or []:
+                if issue.get("level") == "error":
+                    errors.append(f"Fix ShellCheck SC{issue.get('code')}: {issue.get('message')}")
+
+        if self.check_binaries:
+            for name in self._command_names(cmd):
+                if name not in BASH_BUILTINS and name not in BASH_KEYWORDS and shutil.which(name) is None:
+                    errors.append(f"'{name}' is not an installed command; use a standard utility instead.")
+        return errors
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # make sure we have at least one composer record.
+        if not context.get("composer_history"):
+            raise KeyError("No valid command!")
+
+        errors = self.find_errors(context["composer_history"][-1])
+
+        with self._lock:
+            self.checked += 1
+            self.rejected += int(bool(errors))
+
+        if 'inspector_history' not in context:
+            context['inspector_history'] = []
+
+        if errors:
+            # hard error: no need to ask the LLM inspector, go back to the composer.
+            context['inspector_history'].append(" ".join(errors))
+            context['state'] = 'not_passed'
+        else:
+            context['state'] = 'pre_checked'
+        return context
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # the checks spawn subprocesses, so keep them off the event loop.
+        return await asyncio.to_thread(self.execute, context)
+
+    def avoided_rate(self) -> float:
+        return self.rejected / self.checked if self.checked else 0.0
+
+
+if __name__ == "__main__":
+    # test with python -m nl2sh.agents.pre_inspector
+    p = PreInspector()
+    for c in ["ls -l | sort -k5 -n", "```bash\nls\n```", "echo 'unbalanced", "fooobarbaz -x file", "for f in *; do wc -l \"$f\"; done"]:
+        print(repr(c), "->", p.find_errors(c))
@@ -0,0 +1,239 @@
+"""
+    Persistent, content-addressed cache of LLM responses
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+
+# cache modes
+USE = "use"            # read from and write to the cache
+REFRESH = "refresh"    # always call the LLM, but overwrite the cached answer
+BYPASS = "bypass"      # do not touch the cache at all
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key      TEXT PRIMARY KEY,
+    model    TEXT NOT NULL,
+    value    TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    created  REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache for LLMService.chat, keyed on the model, the full message list and the sampling parameters.
+    A small in-memory LRU sits in front of the database, so repeated hits never leave the process.
+    It is safe to share one instance between threads (e.g. the workers of Evaluator.eval_batch).
+    Attributes:
+        path (Path | None): The SQLite file. None keeps the cache in memory only.
+        max_entries (int | None): Maximum number of cached responses, least recently used ones are evicted first.
+        max_bytes (int | None): Maximum total size of the cached responses in bytes.
+        ttl (float | None): Seconds after which a cached response expires. None means never.
+        mode (str): One of "use", "refresh" and "bypass".
+        hits, misses, stores, evictions, expired (int): Counters.
+    Methods:
+        make_key(model, messages, params) -> str: Content address of a request.
+        get(key) -> str | None: Cached response for the key, or None.
+        put(key, model, value): Store a response.
+        stats() -> Dict[str, Any]: Counters and sizes.
+        clear(): Drop every cached response.
+    """
+
+    def __init__(self, path: str | Path | None = ".nl2sh_cache.sqlite",
+                 max_entries: int | None = 100_000,
+                 max_bytes: int | None = None,
+                 ttl: float | None = None,
+                 mode: str = USE,
+                 memory_entries: int = 1024) -> None:
+        if mode not in (USE, REFRESH, BYPASS):
+            raise ValueError(f"Unknown cache mode: {mode}")
+
+        self.path = Path(path) if path is not None else None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.mode = mode
+        self.memory_entries = memory_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+
+        # one connection shared by all threads, serialized by the lock.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path) if self.path else ":memory:", check_same_thread=False)
+        if self.path:
+            # WAL lets other processes read while we write.
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+        # memory front: key -> (value, created)
+        self._front: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        # keys hit in the memory front whose access time is not yet written to the database
+        self._touched: Dict[str, float] = {}
+
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self._count, self._size = count, size
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], params: Dict[str, Any] | None = None) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params or {}},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key: str) -> str | None:
+        if self.mode != USE:
+            return None
+
+        now = time.time()
+        with self._lock:
+            # fast path: the memory front
+            item = self._front.get(key)
+            if item is not None and not self._is_expired(item[1], now):
+                self._front.move_to_end(key)
+                self._touched[key] = now
+                self.hits += 1
+                return item[0]
+
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created = row
+            if self._is_expired(created, now):
+                self._delete(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, value, created)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, model: str, value: str) -> None:
+        if self.mode == BYPASS or not value:
+            return
+
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, size, now, now),
+            )
+            if old is None:
+                self._count += 1
+                self._size += size
+            else:
+                self._size += size - old[0]
+            self._remember(key, value, now)
+            self.stores += 1
+            self._evict()
+            self._db.commit()
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        self._front[key] = (value, created)
+        self._front.move_to_end(key)
+        while len(self._front) > self.memory_entries:
+            self._front.popitem(last=False)
+
+    def _delete(self, key: str) -> None:
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return
+        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._db.commit()
+        self._count -= 1
+        self._size -= row[0]
+        self._front.pop(key, None)
+        self._touched.pop(key, None)
+
+    def _evict(self) -> None:
+        # write the pending access times first, so LRU order is right.
+        if self._touched:
+            self._db.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                 [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+
+        while ((self.max_entries is not None and self._count > self.max_entries)
+               or (self.max_bytes is not None and self._size > self.max_bytes)):
+            # evict in small batches, oldest access first
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._front.pop(key, None)
+                self._count -= 1
+                self._size -= size
+                self.evictions += 1
+                if ((self.max_entries is None or self._count <= self.max_entries)
+                        and (self.max_bytes is None or self._size <= self.max_bytes)):
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "entries": self._count,
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._front.clear()
+            self._touched.clear()
+            self._count = self._size = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._touched:
+                self._db.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                     [(t, k) for k, t in self._touched.items()])
+                self._touched.clear()
+                self._db.commit()
+            self._db.close()
+
+
+if __name__ == "__main__":
+    # test with python -m nl2sh.agents.response_cache
+    cache = ResponseCache(path=None, max_entries=2)
+    msgs = [{"role": "user", "content": "list files"}]
+    k = cache.make_key("gpt-4o-mini", msgs)
+    print(cache.get(k))
+    cache.put(k, "gpt-4o-mini", "ls")
+    t = time.perf_counter()
+    print(cache.get(k), f"{(time.perf_counter() - t) * 1e6:.1f} us")
+    for i in range(3):
+        cache.put(cache.make_key("gpt-4o-mini", msgs, {"i": i}), "gpt-4o-mini", f"ls {i}")
+    print(cache.stats())
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any, Dict
+
+if TYPE_CHECKING:
+    # numpy is only imported by whoever builds the index
+    from nl2sh.retrieval import RetrievalIndex
+
+"""
+context = {
+    "usr_input": "xxx",
+    "composer_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "retrieval": {"task": "...", "command": "...", "score": 0.97},
+    "state": "sss"
+}
+"""
+
+
+class Retriever:
+    """
+    Local, LLM-free fast path that runs before the clarifier. If a vetted pair of the retrieval index is a
+    near-exact match of the task (cosine score >= threshold), its command is the answer: the state goes straight
+    to done, or to composed when verify=True so the Inspector still checks it. Otherwise the context is left in
+    init and the usual pipeline runs.
+    Attributes:
+        name (str): The name of the agent.
+        model (str): Always "local", kept for the same interface as the other agents.
+        index (RetrievalIndex): The index of vetted (task, command) pairs.
+        threshold (float): Minimum cosine score of a direct match.
+        verify (bool): Whether a direct match still goes through the Inspector.
+        lookups (int): Number of lookups.
+        hits (int): Number of direct matches, i.e. tasks answered without clarifier and composer calls.
+    Methods:
+        execute(context: Dict[str, Any]) -> Dict[str, Any]: Looks up the task and updates the context.
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]: Same as execute (a lookup takes well under a millisecond).
+        hit_rate() -> float: Fraction of lookups that were served from the index.
+    """
+
+    def __init__(self, index: RetrievalIndex, threshold: float = 0.9, verify: bool = False) -> None:
+        self.name = "retriever"
+        self.model = "local"
+        self.index = index
+        self.threshold = threshold
+        self.verify = verify
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        best = self.index.search(context["usr_input"], k=1)
+        hit = bool(best) and best[0]["score"] >= self.threshold
+        with self._lock:
+            self.lookups += 1
+            self.hits += int(hit)
+        if not hit:
+            return context
+
+        context["retrieval"] = best[0]
+        context["composer_history"].append(best[0]["command"])
+        if self.verify:
+            context["state"] = "composed"
+        else:
+            context["inspector_history"].append("done")
+            context["state"] = "done"
+        return context
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        return self.execute(context)
+
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
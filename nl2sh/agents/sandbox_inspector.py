@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from typing import Any, Dict
+
+from nl2sh.sandbox import Sandbox
+
+"""
+context = {
+    "usr_input": "xxx",
+    "clarifier": "yyy",
+    "composer_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "inspector_history": [
+        'h1', 'h2', 'h3'
+    ],
+    "execution": {"exit_code": 0, "timed_out": False, "failure": None, "effects": 2},
+    "state": "sss"
+}
+"""
+
+
+class SandboxInspector:
+    """
+    Local, execution-based inspection that runs before the Inspector. The latest command is run on a throwaway
+    fixture file system (see nl2sh/sandbox.py). If the run shows the command is broken (time-out, syntax or usage
+    error), the state goes straight to not_passed with the error as the suggestion. With accept=True a clean run
+    (exit 0, no stderr, some output or side effect) is accepted as done without the LLM inspector. Anything else,
+    including failures that depend on this host (a tool that is not installed, no network), and every run that could
+    not be executed, goes on to the Inspector.
+    Attributes:
+        name (str): The name of the agent.
+        model (str): Always "local", kept for the same interface as the other agents.
+        sandbox (Sandbox): The execution engine; its process pool runs the inspections of concurrent tasks.
+        accept (bool): Whether a clean run is accepted without the Inspector.
+        checked (int): Number of commands run.
+        rejected (int): Number of commands rejected by their run.
+        accepted (int): Number of commands accepted by their run.
+    Methods:
+        execute(context: Dict[str, Any]) -> Dict[str, Any]: Runs the latest command and updates the context.
+        aexecute(context: Dict[str, Any]) -> Dict[str, Any]: Async version of execute.
+        avoided_rate() -> float: Fraction of inspections that did not need the LLM inspector.
+    """
+
+    def __init__(self, sandbox: Sandbox | None = None, accept: bool = False) -> None:
+        self.name = "sandbox_inspector"
+        self.model = "local"
+        self.sandbox = sandbox or Sandbox()
+        self.accept = accept
+        self.checked = 0
+        self.rejected = 0
+        self.accepted = 0
+        self._lock = threading.Lock()
+
+    def _update_context(self, context: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        failure = self.sandbox.failure(result)
+        accepted = self.accept and failure is None and self.sandbox.clean(result)
+        with self._lock:
+            self.checked += int(not result["skipped"])
+            self.rejected += int(failure is not None)
+            self.accepted += int(accepted)
+
+        context['execution'] = {
+            "exit_code": result["exit_code"], "timed_out": result["timed_out"], "failure": failure,
+            "effects": len(result["created"]) + len(result["deleted"]) + len(result["modified"]),
+        }
+        if 'inspector_history' not in context:
+            context['inspector_history'] = []
+
+        if failure is not None:
+            # the run proves it is broken: no need to ask the LLM inspector, go back to the composer.
+            context['inspector_history'].append(f"The command failed when it was run on a test file system: {failure}")
+            context['state'] = 'not_passed'
+        elif accepted:
+            context['inspector_history'].append('done')
+            context['state'] = 'done'
+        else:
+            context['state'] = 'executed'
+        return context
+
+    def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # make sure we have at least one composer record.
+        if not context.get("composer_history"):
+            raise KeyError("No valid command!")
+        result = self.sandbox.submit(context["usr_input"], context["composer_history"][-1]).result()
+        return self._update_context(context, result)
+
+    async def aexecute(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        if not context.get("composer_history"):
+            raise KeyError("No valid command!")
+        # the run happens in the sandbox's process pool, so the event loop keeps serving other tasks
+        result = await asyncio.wrap_future(self.sandbox.submit(context["usr_input"], context["composer_history"][-1]))
+        return self._update_context(context, result)
+
+    def avoided_rate(self) -> float:
+        return (self.rejected + self.accepted) / self.checked if self.checked else 0.0
@@ -0,0 +1,95 @@
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Set, Tuple
+
+"""
+Import-time budget of the nl2sh package, driven by `python -X importtime`.
+Every module is imported in a fresh interpreter a few times; the best cumulative import time is compared with its
+budget, and the heavy third-party packages must not be imported at all. Exits 1 on a regression.
+    python -m nl2sh.bench.import_time
+    python -m nl2sh.bench.import_time --scale 2 --budget nl2sh.inference=200
+"""
+
+# cumulative import time in milliseconds, with headroom for a slower machine
+BUDGETS_MS: Dict[str, float] = {
+    "nl2sh.cli": 40,
+    "nl2sh.agents.llm_service": 120,
+    "nl2sh.inference": 150,
+    "nl2sh.scheduler": 150,
+    "nl2sh.daemon": 200,
+    "nl2sh.evaluator.evaluator": 150,
+    "nl2sh.data.dataloader": 100,
+}
+
+# loaded on first use only; importing any nl2sh module must not pull them in
+HEAVY = ("openai", "httpx", "tqdm", "datasets", "pandas", "dotenv", "matplotlib", "numpy")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    Parse `-X importtime` output into (module, self_us, cumulative_us) rows.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            parts = line[len("import time:"):].split("|")
+            self_us, cum_us, name = int(parts[0]), int(parts[1]), parts[2].strip()
+        except (ValueError, IndexError):
+            continue
+        rows.append((name, self_us, cum_us))
+    return rows
+
+
+def measure(module: str, runs: int = 5) -> Tuple[float, List[Tuple[str, int, int]], Set[str]]:
+    """
+    Returns:
+        Tuple[float, List[Tuple[str, int, int]], Set[str]]: The best cumulative import time in ms, the rows of the
+            best run, and the top-level packages that were imported.
+    """
+    best_ms, best_rows = float("inf"), []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+        rows = parse_importtime(proc.stderr)
+        cum = next((c for name, _, c in rows if name == module), None)
+        if cum is not None and cum / 1000 < best_ms:
+            best_ms, best_rows = cum / 1000, rows
+    return best_ms, best_rows, {name.split(".")[0] for name, _, _ in best_rows}
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Check the import time of the nl2sh modules against a budget")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply all budgets, e.g. on a slow CI machine")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS", help="override a budget")
+    parser.add_argument("--top", type=int, default=5, help="show the slowest imports of a module over its budget")
+    args = parser.parse_args(argv)
+
+    budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        module, ms = item.split("=", 1)
+        budgets[module] = float(ms)
+
+    failed = 0
+    print(f"{'module':<30}{'import ms':>11}{'budget':>9}  status")
+    for module, budget in budgets.items():
+        budget *= args.scale
+        ms, rows, packages = measure(module, args.runs)
+        heavy = sorted(p for p in HEAVY if p in packages)
+        ok = ms <= budget and not heavy
+        failed += not ok
+        status = "ok" if ok else "OVER BUDGET" if ms > budget else "HEAVY IMPORT"
+        print(f"{module:<30}{ms:>11.1f}{budget:>9.0f}  {status}" + (f" ({', '.join(heavy)})" if heavy else ""))
+        if not ok:
+            for name, self_us, _ in sorted(rows, key=lambda r: -r[1])[:args.top]:
+                print(f"{'':<4}{name:<40}{self_us / 1000:>8.1f} ms self")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
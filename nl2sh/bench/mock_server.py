@@ -0,0 +1,379 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+"""
+A local, OpenAI-compatible mock of the `responses.create` endpoint (POST /v1/responses), for load tests without
+API cost or network variance. Point the SDK at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+Requests are classified by their prompt (clarifier, composer, inspector, evaluator, packed evaluator) and answered
+with a plausible text after a sampled latency. It can inject 429 / 5xx responses, enforce a requests-per-minute
+limit, script the inspector to say INCORRECT N times per task before CORRECT, and replay the latencies and token
+counts of a recorded trace (the JSONL written by Tracer.to_jsonl). Requests with "stream": true are answered
+with server-sent events, a few characters per delta.
+Only the standard library is used.
+"""
+
+KINDS = ("clarifier", "composer", "inspector", "batch_inspector", "evaluator", "evaluator_packed")
+# answers of the composer to the "alternative k of n" prompts of CandidateComposer
+ALTERNATIVES = ("ls -l", "ls -la", "ls -lh", "ls -lS", "find . -maxdepth 1 -ls")
+
+_USER_REQUEST = re.compile(r"<UserRequest>\s*(.*?)\s*</UserRequest>", re.S)
+_TASK = re.compile(r"<Task_Description>\s*(.*?)\s*</Task_Description>", re.S)
+_PAIR_ID = re.compile(r'<Pair id="([^"]+)">')
+_CANDIDATE_ID = re.compile(r'<Candidate id="([^"]+)">')
+_ALTERNATIVE = re.compile(r"This is alternative (\d+) of")
+
+
+def classify(messages: List[Dict[str, Any]]) -> str:
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    if "<Pair id=" in text:
+        return "evaluator_packed"
+    if "<Candidate id=" in text:
+        return "batch_inspector"
+    if "<BashCommand>" in text:
+        return "evaluator"
+    if "<User_Command>" in text:
+        return "inspector"
+    if "<UserRequest>" in text:
+        return "clarifier"
+    return "composer"
+
+
+class Latency:
+    """
+    A latency distribution in seconds.
+    Attributes:
+        kind (str): "fixed", "uniform", "normal" or "lognormal".
+        a (float), b (float): fixed: a; uniform: [a, b]; normal: mean a, std b; lognormal: median a, sigma b.
+    """
+
+    def __init__(self, kind: str = "lognormal", a: float = 0.2, b: float = 0.5) -> None:
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.kind, self.a, self.b = kind, a, b
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(self.a, self.b))
+        return rng.lognormvariate(math.log(self.a), self.b)
+
+
+class MockConfig:
+    """
+    Behaviour of the mock server.
+    Attributes:
+        latency (Dict[str, Latency]): Latency per request kind; "default" is used for the kinds not listed.
+        rate_limit_rate (float): Probability of answering 429.
+        error_rate (float): Probability of answering 500.
+        rpm (int | None): Server-side requests-per-minute limit; requests over it get a 429 with retry-after.
+        inspector_incorrect (int): The inspector says INCORRECT this many times per task before CORRECT.
+        trace (str | Path | None): A Tracer JSONL file to replay; its per-agent latencies and tokens replace the
+            latency model for the agents it contains.
+        seed (int | None): Random seed.
+        ttft_share (float): For streamed answers, the share of the latency spent before the first delta;
+            the rest is spread evenly over the deltas.
+    """
+
+    def __init__(self, latency: Dict[str, Latency] | None = None, rate_limit_rate: float = 0.0,
+                 error_rate: float = 0.0, rpm: int | None = None, inspector_incorrect: int = 0,
+                 trace: str | Path | None = None, seed: int | None = None, ttft_share: float = 0.3) -> None:
+        self.latency = {"default": Latency("lognormal", 0.2, 0.5)}
+        self.latency.update(latency or {})
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.inspector_incorrect = inspector_incorrect
+        self.trace = trace
+        self.seed = seed
+        self.ttft_share = ttft_share
+
+
+def load_trace(path: str | Path) -> Dict[str, List[Tuple[float, int, int, int]]]:
+    """
+    Read a Tracer JSONL file into {agent: [(network_s, input_tokens, output_tokens, cached_tokens), ...]}.
+    Spans without an API call (local agents, response-cache hits) are skipped.
+    """
+    samples: Dict[str, List[Tuple[float, int, int, int]]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            span = json.loads(line)
+            calls = span.get("llm_calls", 0) - span.get("response_cache_hits", 0)
+            if calls <= 0:
+                continue
+            samples.setdefault(span["agent"], []).append((
+                span["network_s"] / calls,
+                span["input_tokens"] // calls,
+                span["output_tokens"] // calls,
+                span["cached_tokens"] // calls,
+            ))
+    return samples
+
+
+def _response_body(model: str, text: str, usage: Tuple[int, int, int]) -> Dict[str, Any]:
+    input_tokens, output_tokens, cached_tokens = usage
+    return {
+        "id": f"resp_mock_{random.getrandbits(48):x}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "id": f"msg_mock_{random.getrandbits(48):x}",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": cached_tokens},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+class MockServer:
+    """
+    The mock server, running in a background thread.
+    Attributes:
+        config (MockConfig): The behaviour of the server.
+        base_url (str): The URL to use as OPENAI_BASE_URL.
+    Methods:
+        start() -> MockServer, stop(): Start and stop the server (also usable as a context manager).
+        stats() -> Dict[str, Any]: Requests per kind, status counts, peak concurrency, service latencies, and the
+            number of streams and of streams the client closed early.
+        reset_stats(): Clear the counters and the scripted inspector state.
+    """
+
+    def __init__(self, config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config or MockConfig()
+        self._rng = random.Random(self.config.seed)
+        self._replay = load_trace(self.config.trace) if self.config.trace else {}
+        self._lock = threading.Lock()
+        self._window: deque = deque()   # request timestamps of the last minute, for rpm
+        self.reset_stats()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+        self.base_url = f"http://{host}:{self._httpd.server_address[1]}/v1"
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {"requests": {k: 0 for k in KINDS}, "status": {}, "in_flight": 0, "peak_in_flight": 0,
+                           "streams": 0, "streams_cancelled": 0}
+            self._latencies: List[float] = []
+            self._inspections: Dict[str, int] = {}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = json.loads(json.dumps(self._stats))
+            stats["service_latencies"] = list(self._latencies)
+        stats["total_requests"] = sum(stats["requests"].values())
+        return stats
+
+    def _throttle(self) -> float | None:
+        # returns the retry-after in seconds if this request should get a 429
+        with self._lock:
+            if self.config.rpm is not None:
+                now = time.monotonic()
+                while self._window and now - self._window[0] > 60:
+                    self._window.popleft()
+                if len(self._window) >= self.config.rpm:
+                    return 60 - (now - self._window[0])
+                self._window.append(now)
+            if self._rng.random() < self.config.rate_limit_rate:
+                return self._rng.uniform(0.05, 0.5)
+        return None
+
+    def _answer(self, kind: str, messages: List[Dict[str, Any]]) -> str:
+        text = "\n".join(str(m.get("content", "")) for m in messages)
+        if kind == "clarifier":
+            m = _USER_REQUEST.search(text)
+            return f"Perform the request: {m.group(1) if m else text[-80:]}"
+        if kind == "composer":
+            m = _ALTERNATIVE.search(text)
+            return ALTERNATIVES[(int(m.group(1)) - 1) % len(ALTERNATIVES)] if m else "ls -l"
+        m = _TASK.search(text)
+        task = m.group(1) if m else text
+        if kind in ("inspector", "batch_inspector"):
+            with self._lock:
+                seen = self._inspections.get(task, 0)
+                self._inspections[task] = seen + 1
+        if kind == "batch_inspector":
+            # scripted like the inspector; once it passes, only the last candidate is correct
+            ids = _CANDIDATE_ID.findall(text)
+            return json.dumps({cid: "CORRECT" if seen >= self.config.inspector_incorrect and cid == ids[-1]
+                               else "INCORRECT: use the long listing format" for cid in ids})
+        if kind == "inspector":
+            verdict = "INCORRECT: use the long listing format" if seen < self.config.inspector_incorrect else "CORRECT"
+            if "CONFIDENCE:" in text:
+                # the cheap stage of CascadeInspector also reports a confidence
+                with self._lock:
+                    verdict += f"\nCONFIDENCE: {self._rng.uniform(0.5, 1.0):.2f}"
+            return verdict
+        if kind == "evaluator_packed":
+            return json.dumps({pid: self._rng.randint(5, 10) for pid in _PAIR_ID.findall(text)})
+        return str(self._rng.randint(5, 10))
+
+    def _plan(self, kind: str, messages: List[Dict[str, Any]], answer: str) -> Tuple[float, Tuple[int, int, int]]:
+        # latency and usage of one request, from the replayed trace or the latency model
+        with self._lock:
+            recorded = self._replay.get(kind)
+            if recorded:
+                latency, inp, out, cached = self._rng.choice(recorded)
+                return latency, (inp, out, cached)
+            latency = self.config.latency.get(kind, self.config.latency["default"]).sample(self._rng)
+        # ~4 characters per token
+        inp = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        return latency, (inp, max(1, len(answer) // 4), 0)
+
+    @staticmethod
+    def _stream_events(body: Dict[str, Any], text: str) -> List[Dict[str, Any]]:
+        # the events of a streamed answer: created, one delta per ~4 characters, completed
+        item_id = body["output"][0]["id"]
+        events = [{"type": "response.created", "response": {**body, "status": "in_progress", "output": []}}]
+        for i in range(0, len(text), 4):
+            events.append({"type": "response.output_text.delta", "item_id": item_id, "output_index": 0,
+                           "content_index": 0, "delta": text[i:i + 4], "logprobs": []})
+        events.append({"type": "response.completed", "response": body})
+        for n, event in enumerate(events):
+            event["sequence_number"] = n
+        return events
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send(self, status: int, body: Dict[str, Any], headers: Dict[str, str] | None = None) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client gave up, e.g. its request timeout expired
+                    self.close_connection = True
+                with server._lock:
+                    server._stats["status"][str(status)] = server._stats["status"].get(str(status), 0) + 1
+
+            def _send_stream(self, body: Dict[str, Any], text: str, latency: float) -> None:
+                events = server._stream_events(body, text)
+                deltas = sum(e["type"] == "response.output_text.delta" for e in events)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                with server._lock:
+                    server._stats["status"]["200"] = server._stats["status"].get("200", 0) + 1
+                    server._stats["streams"] += 1
+                try:
+                    time.sleep(latency * server.config.ttft_share)
+                    for event in events:
+                        data = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                        if event["type"] == "response.output_text.delta":
+                            time.sleep(latency * (1 - server.config.ttft_share) / deltas)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client stopped reading early
+                    self.close_connection = True
+                    with server._lock:
+                        server._stats["streams_cancelled"] += 1
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                req = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/responses"):
+                    self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                    return
+
+                messages = req.get("input", [])
+                if isinstance(messages, str):
+                    messages = [{"role": "user", "content": messages}]
+                kind = classify(messages)
+                start = time.perf_counter()
+                with server._lock:
+                    server._stats["requests"][kind] += 1
+                    server._stats["in_flight"] += 1
+                    server._stats["peak_in_flight"] = max(server._stats["peak_in_flight"], server._stats["in_flight"])
+                try:
+                    wait = server._throttle()
+                    if wait is not None:
+                        self._send(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests",
+                                                   "code": "rate_limit_exceeded"}},
+                                   {"retry-after-ms": str(int(wait * 1000)), "x-ratelimit-remaining-requests": "0",
+                                    "x-ratelimit-reset-requests": f"{wait:.3f}s"})
+                        return
+                    if server._rng.random() < server.config.error_rate:
+                        self._send(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+                        return
+
+                    answer = server._answer(kind, messages)
+                    latency, usage = server._plan(kind, messages, answer)
+                    body = _response_body(req.get("model", "mock"), answer, usage)
+                    if req.get("stream"):
+                        self._send_stream(body, answer, latency)
+                        return
+                    time.sleep(latency)
+                    self._send(200, body)
+                finally:
+                    with server._lock:
+                        server._stats["in_flight"] -= 1
+                        server._latencies.append(time.perf_counter() - start)
+
+        return Handler
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    # serve until Ctrl-C: python -m nl2sh.bench.mock_server
+    with MockServer(MockConfig(inspector_incorrect=1), port=8765) as s:
+        print(f"Mock OpenAI server on {s.base_url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from nl2sh.bench.mock_server import Latency, MockConfig, MockServer
+
+"""
+Offline load test of Inference and Evaluator against the local mock server.
+It runs the pipeline over a matrix of concurrency levels and recompose limits, and the evaluator over a list of
+worker counts, and reports throughput, latency percentiles and the number of API requests.
+    python -m nl2sh.bench.run_bench --concurrency 1 8 32 --recompose 0 2 --tasks 64 --out bench.json
+    python -m nl2sh.bench.run_bench ... --baseline bench.json --tolerance 0.2   # exit 1 on a throughput regression
+"""
+
+
+def _point_sdk_at(server: MockServer) -> None:
+    # the SDK reads OPENAI_BASE_URL when a client is built, so drop the pooled clients first
+    from nl2sh.agents.client_pool import reset_pool
+
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    reset_pool()
+
+
+def bench_inference(server: MockServer, concurrency: int, max_recompose: int, n_tasks: int,
+                    runner: str = "async", pre_inspect: bool = False) -> Dict[str, Any]:
+    """
+    One cell of the matrix: generate commands for `n_tasks` synthetic tasks.
+    Args:
+        runner (str): "async" for Inference.agen_eval_commands, "stage" for StageScheduler.
+    Returns:
+        Dict[str, Any]: tasks/s, task latency percentiles (from the tracer) and mock server request counts.
+    """
+    from nl2sh.inference import Inference
+    from nl2sh.scheduler import StageScheduler
+    from nl2sh.tracing import Tracer, percentile
+
+    tasks = [f"bench task {i}: list the files in directory d{i}" for i in range(n_tasks)]
+    tracer = Tracer()
+    server.reset_stats()
+    # the pipeline prints a report per task; keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        inference = Inference(pre_inspect=pre_inspect, tracer=tracer)
+        start = time.perf_counter()
+        if runner == "stage":
+            asyncio.run(StageScheduler(inference, max_in_flight=concurrency).run(tasks, max_recompose))
+        else:
+            asyncio.run(inference.agen_eval_commands(tasks, max_recompose, max_concurrency=concurrency))
+        elapsed = time.perf_counter() - start
+
+    # task latency: from the first span of a task to the end of its last one
+    bounds: Dict[str, List[float]] = {}
+    for s in tracer.spans:
+        b = bounds.setdefault(s["task"], [s["start_s"], s["start_s"] + s["wall_s"]])
+        b[0] = min(b[0], s["start_s"])
+        b[1] = max(b[1], s["start_s"] + s["wall_s"])
+    latencies = [end - begin for begin, end in bounds.values()]
+    stats = server.stats()
+    return {
+        "target": f"inference/{runner}",
+        "concurrency": concurrency,
+        "max_recompose": max_recompose,
+        "items": n_tasks,
+        "wall_s": elapsed,
+        "items_per_s": n_tasks / elapsed,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "requests": stats["total_requests"],
+        "throttled": stats["status"].get("429", 0),
+        "peak_in_flight": stats["peak_in_flight"],
+    }
+
+
+def bench_evaluator(server: MockServer, num_workers: int, n_pairs: int, pack_size: int = 1,
+                    adaptive: bool = False) -> Dict[str, Any]:
+    """
+    Judge `n_pairs` synthetic pairs with Evaluator.eval_batch.
+    Returns:
+        Dict[str, Any]: pairs/s, request latency percentiles (as seen by the server) and request counts.
+    """
+    from nl2sh.evaluator.evaluator import Evaluator
+    from nl2sh.tracing import percentile
+
+    pairs = [(f"bench task {i}", f"ls -l d{i}", 0) for i in range(n_pairs)]
+    server.reset_stats()
+    with contextlib.redirect_stdout(io.StringIO()):
+        evaluator = Evaluator()
+        start = time.perf_counter()
+        evaluator.eval_batch(pairs, num_workers=num_workers, pack_size=pack_size, adaptive=adaptive)
+        elapsed = time.perf_counter() - start
+
+    stats = server.stats()
+    latencies = stats["service_latencies"]
+    return {
+        "target": f"evaluator/pack{pack_size}" + ("+adaptive" if adaptive else ""),
+        "concurrency": num_workers,
+        "max_recompose": None,
+        "items": n_pairs,
+        "wall_s": elapsed,
+        "items_per_s": n_pairs / elapsed,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "requests": stats["total_requests"],
+        "throttled": stats["status"].get("429", 0),
+        "peak_in_flight": stats["peak_in_flight"],
+    }
+
+
+def run_matrix(config: MockConfig, concurrency: List[int], recompose: List[int], n_tasks: int,
+               runner: str = "async", pre_inspect: bool = False, eval_workers: List[int] | None = None,
+               pack_sizes: List[int] | None = None) -> List[Dict[str, Any]]:
+    rows = []
+    with MockServer(config) as server:
+        _point_sdk_at(server)
+        for c in concurrency:
+            for r in recompose:
+                rows.append(bench_inference(server, c, r, n_tasks, runner, pre_inspect))
+                print_rows(rows[-1:], header=len(rows) == 1)
+        for w in eval_workers or []:
+            for k in pack_sizes or [1]:
+                rows.append(bench_evaluator(server, w, n_tasks, k))
+                print_rows(rows[-1:], header=not rows[:-1])
+    return rows
+
+
+def print_rows(rows: List[Dict[str, Any]], header: bool = True) -> None:
+    if header:
+        print(f"{'target':<22}{'conc':>6}{'recomp':>8}{'items':>7}{'items/s':>10}{'p50':>8}{'p95':>8}{'p99':>8}"
+              f"{'reqs':>7}{'429':>6}{'peak':>6}")
+    for r in rows:
+        print(f"{r['target']:<22}{r['concurrency']:>6}{str(r['max_recompose']):>8}{r['items']:>7}"
+              f"{r['items_per_s']:>10.2f}{r['p50_s']:>8.3f}{r['p95_s']:>8.3f}{r['p99_s']:>8.3f}"
+              f"{r['requests']:>7}{r['throttled']:>6}{r['peak_in_flight']:>6}")
+
+
+def compare(rows: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    Compare the throughput with a baseline run.
+    Returns:
+        List[str]: One message per cell that is more than `tolerance` (a fraction) slower than the baseline.
+    """
+    def key(r: Dict[str, Any]) -> tuple:
+        return r["target"], r["concurrency"], r["max_recompose"], r["items"]
+
+    base = {key(r): r for r in baseline}
+    regressions = []
+    for r in rows:
+        b = base.get(key(r))
+        if b is not None and r["items_per_s"] < b["items_per_s"] * (1 - tolerance):
+            regressions.append(f"{r['target']} conc={r['concurrency']} recompose={r['max_recompose']}: "
+                               f"{r['items_per_s']:.2f}/s vs {b['items_per_s']:.2f}/s baseline")
+    return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test against a local mock OpenAI server")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--recompose", type=int, nargs="+", default=[0, 2])
+    parser.add_argument("--tasks", type=int, default=64)
+    parser.add_argument("--runner", choices=["async", "stage"], default="async")
+    parser.add_argument("--pre-inspect", action="store_true")
+    parser.add_argument("--eval-workers", type=int, nargs="*", default=[5, 32])
+    parser.add_argument("--pack-sizes", type=int, nargs="+", default=[1])
+    parser.add_argument("--latency", nargs=3, metavar=("KIND", "A", "B"), default=["lognormal", "0.2", "0.5"],
+                        help="default latency distribution, e.g. lognormal 0.2 0.5 (median, sigma)")
+    parser.add_argument("--inspector-latency", nargs=3, metavar=("KIND", "A", "B"), default=None)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None)
+    parser.add_argument("--inspector-incorrect", type=int, default=0,
+                        help="the inspector says INCORRECT this many times per task before CORRECT")
+    parser.add_argument("--replay", default=None, help="Tracer JSONL file whose latencies and tokens are replayed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write the rows as JSON")
+    parser.add_argument("--baseline", default=None, help="JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    latency = {"default": Latency(args.latency[0], float(args.latency[1]), float(args.latency[2]))}
+    if args.inspector_latency:
+        kind, a, b = args.inspector_latency
+        latency["inspector"] = Latency(kind, float(a), float(b))
+    config = MockConfig(latency=latency, rate_limit_rate=args.rate_limit_rate, error_rate=args.error_rate,
+                        rpm=args.rpm, inspector_incorrect=args.inspector_incorrect, trace=args.replay,
+                        seed=args.seed)
+
+    # progress bars of the pipeline would interleave with the table
+    os.environ.setdefault("TQDM_DISABLE", "1")
+    rows = run_matrix(config, args.concurrency, args.recompose, args.tasks, args.runner, args.pre_inspect,
+                      args.eval_workers, args.pack_sizes)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"Saved {len(rows)} rows to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(rows, json.load(f), args.tolerance)
+        for msg in regressions:
+            print(f"[REGRESSION] {msg}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
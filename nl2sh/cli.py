@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterator, List
+
+"""
+Thin client of the NL2Sh daemon (nl2sh/daemon.py), installed as `smart-terminal`.
+It only imports the standard library, so a call costs an interpreter start plus one round trip to the daemon,
+which keeps a warm Inference, pooled connections and caches. If no daemon is running, it starts one.
+    smart-terminal "list the files in the current folder by size"
+    smart-terminal --status | --stop
+"""
+
+
+def socket_path() -> str:
+    """
+    The daemon socket: $NL2SH_SOCKET, else nl2sh-<uid>.sock in $XDG_RUNTIME_DIR (or /tmp).
+    """
+    path = os.environ.get("NL2SH_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, f"nl2sh-{os.getuid()}.sock")
+
+
+def _connect(path: str, timeout: float | None = None) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(path)
+    return sock
+
+
+def request(path: str, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Send one JSON-line request and yield the JSON-line events of the answer until the daemon closes the stream.
+    """
+    with _connect(path) as sock:
+        sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def start_daemon(path: str, args: List[str] | None = None, wait: float = 30.0) -> None:
+    """
+    Start the daemon in the background and wait until it accepts connections.
+    Its output goes to <socket>.log.
+    """
+    log = open(path + ".log", "ab")
+    subprocess.Popen([sys.executable, "-m", "nl2sh.daemon", "--socket", path, *(args or [])],
+                     stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        try:
+            _connect(path, timeout=1.0).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"the daemon did not come up within {wait:.0f}s, see {path}.log")
+
+
+def _is_running(path: str) -> bool:
+    try:
+        _connect(path, timeout=1.0).close()
+        return True
+    except OSError:
+        return False
+
+
+def cli(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="smart-terminal", description="Translate a task into a bash command")
+    parser.add_argument("task", nargs="*", help="the task in natural language (read from stdin if omitted)")
+    parser.add_argument("--max-recompose", type=int, default=2)
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="seconds after which the best command so far is returned")
+    parser.add_argument("--socket", default=None, help="daemon socket (default: $NL2SH_SOCKET or a per-user path)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the FSM steps on stderr")
+    parser.add_argument("--no-autostart", action="store_true", help="fail instead of starting a daemon")
+    parser.add_argument("--status", action="store_true", help="print the daemon status")
+    parser.add_argument("--stop", action="store_true", help="stop the daemon")
+    args = parser.parse_args(argv)
+    path = args.socket or socket_path()
+
+    if args.stop or args.status:
+        if not _is_running(path):
+            print("nl2sh daemon is not running", file=sys.stderr)
+            return 1
+        for event in request(path, {"op": "shutdown" if args.stop else "status"}):
+            print(json.dumps(event))
+        return 0
+
+    task = " ".join(args.task).strip() or sys.stdin.read().strip()
+    if not task:
+        parser.error("no task given")
+
+    if not _is_running(path):
+        if args.no_autostart:
+            print(f"nl2sh daemon is not running on {path}", file=sys.stderr)
+            return 1
+        start_daemon(path)
+
+    payload = {"op": "run", "task": task, "max_recompose": args.max_recompose}
+    if args.deadline is not None:
+        payload["deadline_s"] = args.deadline
+    for event in request(path, payload):
+        kind = event.get("event")
+        if kind == "step" and args.verbose:
+            print(f"[{event['agent']}] -> {event['state']}", file=sys.stderr)
+        elif kind == "result":
+            if event.get("state") == "timed_out":
+                print("[nl2sh] deadline reached, this is the best command so far", file=sys.stderr)
+            elif event.get("state") != "done":
+                print(f"[nl2sh] the inspector did not pass this command ({event.get('state')})", file=sys.stderr)
+            if not event.get("command"):
+                print("[nl2sh] no command generated", file=sys.stderr)
+                return 1
+            print(event["command"])
+            return 0
+        elif kind == "error":
+            print(f"[nl2sh] {event.get('message')}", file=sys.stderr)
+            return 1
+    print("[nl2sh] the daemon closed the connection", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,175 @@
+import marshal
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List
+
+"""
+The per-task state of the FSM.
+TaskContext stores the keys every agent uses in slots instead of a dict, and optionally keeps only the last few
+entries of the histories (the agents only read the last one). It still behaves like the dict the agents were written
+against: context["state"], "clarifier" in context, context.get("candidates") and context["x"] = ... all work, and
+keys that are not fields are kept in a small side dict. A field that is None counts as missing, like an absent key.
+    context = TaskContext("list files by size", max_history=2)
+    context["composer_history"].append("ls -S")
+    TaskContext.from_bytes(context.to_bytes()) == context
+"""
+
+# bumped when the layout of to_bytes changes
+_FORMAT = 1
+_FIELDS = ("usr_input", "clarifier", "composer_history", "inspector_history", "state",
+           "candidates", "speculation", "retrieval")
+_FIELD_SET = frozenset(_FIELDS)
+_HISTORIES = frozenset(("composer_history", "inspector_history"))
+
+
+class History(list):
+    """
+    A list that keeps only its last `maxlen` entries. A collections.deque would do the same, but an empty deque
+    takes ten times the memory of an empty list, and histories are short.
+    """
+    __slots__ = ("maxlen",)
+
+    def __init__(self, items: Iterable[Any] = (), maxlen: int | None = None) -> None:
+        super().__init__(items)
+        self.maxlen = maxlen
+        self._trim()
+
+    def _trim(self) -> None:
+        if self.maxlen is not None and len(self) > self.maxlen:
+            del self[:len(self) - self.maxlen]
+
+    def append(self, item: Any) -> None:
+        super().append(item)
+        self._trim()
+
+    def extend(self, items: Iterable[Any]) -> None:
+        super().extend(items)
+        self._trim()
+
+    def __reduce__(self):
+        return History, (list(self), self.maxlen)
+
+
+class TaskContext(MutableMapping):
+    """
+    Slotted FSM context with a dict interface.
+    Attributes:
+        usr_input (str): The NL task.
+        clarifier (str | None): The clarified task; None (missing) makes the composer use usr_input.
+        composer_history (List[str]), inspector_history (List[str]): The composed commands and the inspector verdicts.
+        state (str): The FSM state.
+        candidates (List[str] | None), speculation (Dict | None), retrieval (Dict | None): Set by the agents of the
+            optional modes.
+        max_history (int | None): How many entries of each history are kept, None for all of them.
+    Methods:
+        copy() -> TaskContext: A copy with its own histories.
+        to_dict() -> Dict[str, Any]: The context as a plain dict.
+        to_bytes() -> bytes, from_bytes(data) -> TaskContext: Compact binary form for checkpoints and IPC. It uses
+            marshal, so it is only readable by the same Python version, and all values must be plain data.
+    """
+    __slots__ = _FIELDS + ("max_history", "_extra")
+
+    def __init__(self, usr_input: str, clarifier: str | None = "", state: str = "init",
+                 composer_history: Iterable[str] = (), inspector_history: Iterable[str] = (),
+                 max_history: int | None = None, **extra: Any) -> None:
+        self.max_history = max_history
+        self.usr_input = usr_input
+        self.clarifier = clarifier
+        self.composer_history = self._history(composer_history)
+        self.inspector_history = self._history(inspector_history)
+        self.state = state
+        self.candidates = None
+        self.speculation = None
+        self.retrieval = None
+        self._extra: Dict[str, Any] | None = None
+        for key, value in extra.items():
+            self[key] = value
+
+    def _history(self, items: Iterable[str]) -> List[str]:
+        return list(items) if self.max_history is None else History(items, self.max_history)
+
+    # the dict interface of the agents
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _HISTORIES:
+            # e.g. context["composer_history"] = [cmd]: keep the bound
+            value = self._history(value)
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _FIELD_SET and getattr(self, key) is not None:
+            setattr(self, key, None)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in _FIELD_SET:
+            return getattr(self, key) is not None
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for key in _FIELDS:
+            if getattr(self, key) is not None:
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"TaskContext({self.to_dict()!r})"
+
+    def copy(self) -> "TaskContext":
+        other = TaskContext(self.usr_input, self.clarifier, self.state, self.composer_history,
+                            self.inspector_history, self.max_history)
+        other.candidates = self.candidates
+        other.speculation = self.speculation
+        other.retrieval = self.retrieval
+        if self._extra is not None:
+            other._extra = dict(self._extra)
+        return other
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: list(value) if key in _HISTORIES else value for key, value in self.items()}
+
+    # binary form
+
+    def to_bytes(self) -> bytes:
+        return marshal.dumps((
+            _FORMAT, self.usr_input, self.clarifier, list(self.composer_history), list(self.inspector_history),
+            self.state, self.candidates, self.speculation, self.retrieval, self.max_history, self._extra,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TaskContext":
+        fmt, *values = marshal.loads(data)
+        if fmt != _FORMAT:
+            raise ValueError(f"unsupported TaskContext format {fmt}")
+        (usr_input, clarifier, composer_history, inspector_history, state,
+         candidates, speculation, retrieval, max_history, extra) = values
+        context = cls(usr_input, clarifier, state, composer_history, inspector_history, max_history)
+        context.candidates = candidates
+        context.speculation = speculation
+        context.retrieval = retrieval
+        context._extra = extra
+        return context
+
+    def __reduce__(self):
+        # pickling (e.g. multiprocessing) goes through the compact form
+        return TaskContext.from_bytes, (self.to_bytes(),)
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from nl2sh.agents.client_pool import get_async_client, pool_stats
+from nl2sh.agents.llm_service import api_key
+from nl2sh.agents.response_cache import ResponseCache
+from nl2sh.cli import socket_path
+from nl2sh.inference import Inference
+from nl2sh.singleflight import SingleFlight
+
+"""
+Long-lived NL2Sh daemon. It keeps one warm Inference (agents, pooled HTTP connections, response cache) and serves
+tasks over a Unix domain socket, so a shell user only pays for the LLM round trips, not for interpreter startup
+and imports. The protocol is one JSON line per request and a stream of JSON-line events per answer:
+    -> {"op": "run", "task": "...", "max_recompose": 2, "deadline_s": 10}
+    <- {"event": "step", "agent": "clarifier", "state": "clarified"}  ... one per FSM step
+    <- {"event": "result", "command": "...", "state": "done", "retry_times": 0, "elapsed_s": 1.2}
+    -> {"op": "status"} / {"op": "ping"} / {"op": "shutdown"}
+Run it with python -m nl2sh.daemon, or let the `smart-terminal` client start it.
+"""
+
+
+class Daemon:
+    """
+    Serves Inference.arun_single over a Unix domain socket.
+    Attributes:
+        path (str): The socket path.
+        inference (Inference): The warm pipeline shared by all requests.
+        flights (SingleFlight): Coalesces identical tasks that are in flight at the same time.
+        served (int): Number of tasks served.
+    Methods:
+        serve(): Run until a shutdown request or SIGTERM / SIGINT.
+    """
+
+    def __init__(self, path: str, inference: Inference) -> None:
+        self.path = path
+        self.inference = inference
+        self.flights = SingleFlight(inference)
+        self.served = 0
+        self.started = time.time()
+        self._stop: asyncio.Event | None = None
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, event: Dict[str, Any]) -> None:
+        writer.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    async def _run(self, req: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        task = str(req.get("task", "")).strip()
+        if not task:
+            await self._send(writer, {"event": "error", "message": "empty task"})
+            return
+
+        start = time.perf_counter()
+        last = {"state": None}
+
+        def on_step(agent: str, context: Dict[str, Any]) -> None:
+            # called on the event loop; the buffered events are flushed by the next drain
+            last["state"] = context["state"]
+            writer.write((json.dumps({"event": "step", "agent": agent, "state": context["state"]}) + "\n")
+                         .encode("utf-8"))
+
+        # users often send the same task at once; they share one FSM run
+        res = await self.flights.arun(task, req.get("max_recompose", 2), on_step=on_step,
+                                      deadline_s=req.get("deadline_s"))
+        command, retry_times = res if res else ("", 0)
+        self.served += 1
+        await self._send(writer, {
+            "event": "result",
+            "command": command,
+            "state": last["state"],
+            "retry_times": retry_times,
+            "elapsed_s": round(time.perf_counter() - start, 3),
+        })
+
+    def _status(self) -> Dict[str, Any]:
+        status = {
+            "event": "status",
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started),
+            "served": self.served,
+            "coalescing": dict(self.flights.stats),
+            "pool": pool_stats(),
+        }
+        cache = self.inference.composer.instance.cache
+        if cache is not None:
+            status["cache"] = cache.stats()
+        return status
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            line = await reader.readline()
+            try:
+                req = json.loads(line or b"{}")
+            except json.JSONDecodeError as e:
+                await self._send(writer, {"event": "error", "message": f"bad request: {e}"})
+                return
+
+            op = req.get("op", "run")
+            if op == "run":
+                await self._run(req, writer)
+            elif op == "ping":
+                await self._send(writer, {"event": "pong"})
+            elif op == "status":
+                await self._send(writer, self._status())
+            elif op == "shutdown":
+                await self._send(writer, {"event": "bye"})
+                self._stop.set()
+            else:
+                await self._send(writer, {"event": "error", "message": f"unknown op: {op}"})
+        except Exception as e:
+            # one failing task must not take the daemon down
+            with contextlib.suppress(Exception):
+                await self._send(writer, {"event": "error", "message": str(e)})
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    def _claim_socket(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            # a stale socket from a daemon that died
+            os.unlink(self.path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"another nl2sh daemon is already listening on {self.path}")
+
+    async def serve(self) -> None:
+        self._stop = asyncio.Event()
+        self._claim_socket()
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        # the socket runs commands with the user's API key, so only the user may connect
+        os.chmod(self.path, 0o600)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stop.set)
+
+        # build the pooled async client now, so the first request does not pay for it
+        get_async_client(api_key())
+        print(f"nl2sh daemon (pid {os.getpid()}) listening on {self.path}", file=sys.stderr, flush=True)
+        try:
+            async with server:
+                await self._stop.wait()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+            print("nl2sh daemon stopped", file=sys.stderr, flush=True)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="NL2Sh daemon")
+    parser.add_argument("--socket", default=None)
+    parser.add_argument("--cache", default=str(Path.home() / ".cache" / "nl2sh" / "responses.sqlite"),
+                        help="response cache file")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--pre-inspect", action="store_true")
+    parser.add_argument("--cascade", action="store_true")
+    parser.add_argument("--use-finetune", action="store_true")
+    parser.add_argument("--stream", action="store_true", help="stream the composer and inspector answers")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="default per-task deadline in seconds (a request may set its own)")
+    parser.add_argument("--retrieval", action="store_true",
+                        help="answer near-duplicates of vetted pairs from a retrieval index")
+    parser.add_argument("--retrieval-index", default=str(Path.home() / ".cache" / "nl2sh" / "retrieval"),
+                        help="where the index is saved; it is only rebuilt when the corpus changes")
+    parser.add_argument("--corpus", action="append", default=None,
+                        help="JSONL file of vetted pairs (repeatable, default: the fine-tune data)")
+    parser.add_argument("--retrieval-verify", action="store_true", help="let the inspector check direct matches")
+    parser.add_argument("--few-shot", type=int, default=0, help="retrieved examples for the composer")
+    parser.add_argument("--sandbox", action="store_true",
+                        help="run every composed command on a fixture file system before the inspector")
+    parser.add_argument("--sandbox-accept", action="store_true", help="accept clean sandbox runs without the inspector")
+    parser.add_argument("--verbose", action="store_true", help="keep the per-task reports in the log")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if not args.no_cache:
+        Path(args.cache).parent.mkdir(parents=True, exist_ok=True)
+        cache = ResponseCache(args.cache)
+
+    index = None
+    if args.retrieval or args.few_shot > 0:
+        from nl2sh.retrieval import DEFAULT_CORPUS, RetrievalIndex
+
+        index = RetrievalIndex.load_or_build(args.retrieval_index, args.corpus or DEFAULT_CORPUS)
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            # the pipeline prints a report per task; the daemon log only needs its own messages
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        inference = Inference(use_finetune=args.use_finetune, cache=cache,
+                              pre_inspect=args.pre_inspect, cascade=args.cascade, stream=args.stream,
+                              deadline_s=args.deadline, few_shot=args.few_shot,
+                              retrieval=index, retrieval_threshold=0.9 if args.retrieval else None,
+                              retrieval_verify=args.retrieval_verify, sandbox=args.sandbox,
+                              sandbox_accept=args.sandbox_accept)
+        asyncio.run(Daemon(args.socket or socket_path(), inference).serve())
+    if cache is not None:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
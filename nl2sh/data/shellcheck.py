@@ -0,0 +1,154 @@
+import json
+import os
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+"""
+ShellCheck helpers shared by the data pipeline (dataloader) and the local pre-inspection of the FSM.
+This module does not import any heavy dependency, and does not require shellcheck at import time.
+"""
+
+
+def run_shellcheck(bash_cmd: str) -> List[Dict[str, Any]] | None:
+    """
+    Run shellcheck on a single bash command.
+    Args:
+        bash_cmd (str): The command to check. A bash shebang is prepended.
+    Returns:
+        List[Dict[str, Any]] | None: The list of issues reported by shellcheck (each one has a 'level',
+            'code' and 'message'), or None if shellcheck could not run or its output could not be parsed.
+    """
+    full_script = f"#!/bin/bash\n{bash_cmd}"
+
+    try:
+        proc = subprocess.run(
+            ["shellcheck", "-s", "bash", "--format=json", "-"],
+            input=full_script,
+            capture_output=True,
+            text=True
+        )
+    except Exception as e:
+        print(f"Shellcheck execution failed: {e}")
+        return None
+
+    if proc.returncode != 0 and not proc.stdout:
+        return None
+
+    try:
+        return json.loads(proc.stdout)
+    except json.JSONDecodeError:
+        return None
+
+
+def is_code_safe_by_shellcheck(bash_cmd):
+    issues = run_shellcheck(bash_cmd)
+    if issues is None:
+        return False
+
+    if not issues:
+        return True
+
+    for issue in issues:
+        level = issue.get('level')  # 'error', 'warning', 'info', 'style'
+
+        if level in ['error', 'warning']:
+            return False
+
+    return True
+
+
+def _is_safe(issues: List[Dict[str, Any]]) -> bool:
+    # same rule as is_code_safe_by_shellcheck: any error or warning rejects the command
+    return not any(issue.get('level') in ['error', 'warning'] for issue in issues)
+
+
+def check_batch(bash_cmds: List[str]) -> List[bool]:
+    """
+    Check many commands with a single shellcheck process. Each command is written to its own
+    file in a temporary directory, and the issues are mapped back to the commands through the 'file' field.
+    Args:
+        bash_cmds (List[str]): The commands to check.
+    Returns:
+        List[bool]: For each command, the same verdict as is_code_safe_by_shellcheck.
+    """
+    if not bash_cmds:
+        return []
+
+    with tempfile.TemporaryDirectory(prefix="nl2sh_sc_") as tmp:
+        names = []
+        for i, cmd in enumerate(bash_cmds):
+            name = f"{i}.sh"
+            with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                f.write(f"#!/bin/bash\n{cmd}")
+            names.append(name)
+
+        try:
+            proc = subprocess.run(
+                ["shellcheck", "-s", "bash", "--format=json", *names],
+                cwd=tmp,
+                capture_output=True,
+                text=True
+            )
+            issues = json.loads(proc.stdout)
+        except Exception as e:
+            # e.g. a file shellcheck could not read; fall back to one process per command.
+            print(f"Batched shellcheck failed, checking one by one: {e}")
+            return [is_code_safe_by_shellcheck(cmd) for cmd in bash_cmds]
+
+    by_file: Dict[str, List[Dict[str, Any]]] = {}
+    for issue in issues:
+        by_file.setdefault(issue.get('file'), []).append(issue)
+    return [_is_safe(by_file.get(name, [])) for name in names]
+
+
+def filter_safe(bash_cmds: Iterable[str],
+                target_count: int | None = None,
+                batch_size: int = 64,
+                num_workers: int | None = None) -> Iterator[Tuple[int, bool]]:
+    """
+    Check a stream of commands with batched shellcheck calls spread over a process pool.
+    Verdicts are yielded in input order, so the result is the same as a sequential scan.
+    Once `target_count` commands passed, the remaining batches are cancelled.
+    Args:
+        bash_cmds (Iterable[str]): The commands, consumed lazily.
+        target_count (int | None): Stop after this many safe commands. None checks everything.
+        batch_size (int): Number of commands per shellcheck process.
+        num_workers (int | None): Number of worker processes. Defaults to the number of CPUs.
+    Yields:
+        Tuple[int, bool]: (input index, is safe), in input order.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    max_pending = num_workers * 2   # keep every worker busy, but do not read the whole input ahead
+    it = iter(bash_cmds)
+    kept, next_index = 0, 0
+
+    with ProcessPoolExecutor(max_workers=num_workers) as ex:
+        pending = deque()
+
+        def submit() -> bool:
+            nonlocal next_index
+            batch = list(islice(it, batch_size))
+            if not batch:
+                return False
+            pending.append((next_index, ex.submit(check_batch, batch)))
+            next_index += len(batch)
+            return True
+
+        while len(pending) < max_pending and submit():
+            pass
+
+        while pending:
+            start, fut = pending.popleft()
+            for offset, safe in enumerate(fut.result()):
+                yield start + offset, safe
+                kept += int(safe)
+                if target_count is not None and kept >= target_count:
+                    # early stop: drop every batch that has not started yet
+                    for _, rest in pending:
+                        rest.cancel()
+                    return
+            submit()
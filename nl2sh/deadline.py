@@ -0,0 +1,66 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+"""
+Per-task deadlines for the inference FSM.
+Inference opens a scope with the absolute deadline of a task; the LLM services read the remaining time from a
+contextvar (like the tracing span) and send it as the request timeout, so no agent signature has to change.
+Deadlines are time.monotonic() values. Nested scopes keep the earlier deadline.
+"""
+
+_DEADLINE: contextvars.ContextVar[float | None] = contextvars.ContextVar("nl2sh_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised by request_timeout() when the task has no time left for another LLM call.
+    """
+
+
+def after(seconds: float | None) -> float | None:
+    """
+    The absolute deadline `seconds` from now, None for no deadline.
+    """
+    return None if seconds is None else time.monotonic() + seconds
+
+
+@contextmanager
+def scope(until: float | None) -> Iterator[float | None]:
+    """
+    Run the block under the deadline `until` (see after()). None keeps the enclosing deadline, if any.
+    """
+    outer = _DEADLINE.get()
+    if until is None or (outer is not None and outer < until):
+        until = outer
+    token = _DEADLINE.set(until)
+    try:
+        yield until
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining() -> float | None:
+    """
+    Seconds left before the current deadline (may be negative), None if there is no deadline.
+    """
+    until = _DEADLINE.get()
+    return None if until is None else until - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def request_timeout() -> float | None:
+    """
+    The timeout for the next request: the time left, or None without a deadline.
+    Raises:
+        DeadlineExceeded: If the deadline has already passed.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("task deadline exceeded")
+    return left
@@ -1,14 +1,27 @@
 # we use gpt-5.1 as the judge: cheap while powerful
 from __future__ import annotations
 
+import json
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Any, Dict, List, Tuple
 
 from nl2sh.agents.llm_service import LLMService
-from nl2sh.prompts.eval_pmpt import eval_prompt
-from typing import Dict, Any, List, Tuple
-import json
-from tqdm.auto import tqdm
+from nl2sh.agents.response_cache import ResponseCache
+from nl2sh.evaluator.rate_control import (
+    AIMDLimiter,
+    RateBudget,
+    backoff_delay,
+    error_headers,
+    is_throttle,
+    retry_after,
+)
+from nl2sh.evaluator.result_log import ResultLog
+from nl2sh.prompts.eval_pmpt import eval_packed_prompt, eval_pair_block, eval_prompt
+from nl2sh.sandbox import Sandbox
+
 
 class Evaluator:
     """
@@ -19,23 +32,96 @@ class Evaluator:
         model (str): The LLM model to use for evaluation.
         template (str): The prompt template for evaluation.
         instance (LLMService): An instance of the LLM service for making requests.
+            Pass a ResponseCache to reuse the judgments of earlier runs.
+        max_attempts (int): How many times a throttled (429 / 5xx) request is tried before it is scored -1.
+        sandbox (Sandbox | None): If given, every pair is first run on a fixture file system. A command whose run shows
+            it is broken (time-out, syntax or usage error) scores 0, and one whose run matches the run of the
+            reference command of its task (`references`, task -> command) scores 10, both without a judging request.
+            The other pairs, including runs that failed for reasons of this host, are judged by the LLM as usual.
+        functional_stats (Dict[str, int]): Pairs run in the sandbox, and how many of them scored 0 / 10 by their run.
     Methods:
         eval_batch: Evaluate a batch of (task, command) pairs using multiple workers.
         eval_from_file: Evaluate (task, command) pairs read from an input file generated by `Inference` class and write results to an output file.
         _eval_one: Evaluate a single (task, command) pair and return the score.
+        _eval_pack: Evaluate several pairs with one request (packed mode).
+        functional_score: The execution-based score of a pair, or None if its run does not decide it.
+        load_references: Read the reference commands of the functional score.
+        calibrate: Compare packed and single-pair scores on the same pairs.
+        _call: Send one request through a concurrency limiter and rate budget, retrying throttled requests.
+    The limiter and the budget belong to one eval_batch (or pipeline) call and are passed down to _call, so
+    concurrent batches on the same Evaluator do not share or overwrite them.
     """
 
-    def __init__(self, model: str = 'gpt-5.1'):
+    def __init__(self, model: str = 'gpt-5.1', cache: ResponseCache | None = None,
+                 max_attempts: int = 6, sandbox: Sandbox | None = None,
+                 references: Dict[str, str] | None = None):
         self.model = model
         self.template = eval_prompt
-        self.instance = LLMService(model)
+        self.instance = LLMService(model, cache=cache)
+        self.max_attempts = max_attempts
+        self.packed_template = eval_packed_prompt
+        # number of judging requests sent, e.g. to compare packed and single-pair mode
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.sandbox = sandbox
+        self.references = references or {}
+        self.functional_stats = {"run": 0, "failed": 0, "matched": 0}
 
-    def _eval_one(self, task: str, command: str) -> float:
+    def _call(self, prompt_set: List[Dict[str, Any]], limiter: AIMDLimiter | None = None,
+              budget: RateBudget | None = None) -> str:
+        """
+        Send one judging request through the concurrency limiter and the rate budget.
+        Throttled requests (429, 5xx, timeouts) are retried with jittered backoff instead of being scored.
+        Args:
+            prompt_set (List[Dict[str, Any]]): The chat messages.
+            limiter (AIMDLimiter | None), budget (RateBudget | None): The rate control of the calling batch.
+                Without them the request is sent directly, with the SDK retries.
+        Returns:
+            str: The text of the response.
+        """
+        with self._lock:
+            self.requests += 1
+
+        if limiter is None or budget is None:
+            # not inside eval_batch
+            return self.instance.chat(prompt_set)
+
+        # a rough estimate for the TPM budget: ~4 characters per token, plus a short answer
+        est_tokens = sum(len(m["content"]) for m in prompt_set) // 4 + 16
+
+        for attempt in range(self.max_attempts):
+            budget.acquire(est_tokens)
+            limiter.acquire()
+            start = time.monotonic()
+            try:
+                # the SDK would retry 429s silently; we want to see them to adapt the concurrency
+                res, meta = self.instance.chat_with_meta(prompt_set, max_retries=0)
+            except Exception as e:
+                throttled = is_throttle(e)
+                limiter.release(time.monotonic() - start, throttled=throttled)
+                budget.record(est_tokens, 0)
+                if not throttled or attempt == self.max_attempts - 1:
+                    raise
+                headers = error_headers(e)
+                budget.update_from_headers(headers)
+                time.sleep(backoff_delay(attempt, retry_after(headers)))
+                continue
+
+            limiter.release(time.monotonic() - start)
+            budget.record(est_tokens, meta["total_tokens"])
+            budget.update_from_headers(meta["headers"])
+            return res
+
+        raise RuntimeError("unreachable")
+
+    def _eval_one(self, task: str, command: str, limiter: AIMDLimiter | None = None,
+                  budget: RateBudget | None = None) -> float:
         """
         Evaluate a single (task, command) pair and return the score.
         Args:
             task (str): The natural language task description.
             command (str): The generated bash command.
+            limiter (AIMDLimiter | None), budget (RateBudget | None): Rate control, see _call.
         Returns:
             float: The score assigned by the LLM. It is expected to be a integer in [0, 10], but to be safe we use float.
         """
@@ -47,76 +133,296 @@ class Evaluator:
         prompt_set = [
             {"role": "user", "content": prompt},
         ]
-        res = self.instance.chat(prompt_set)
+        res = self._call(prompt_set, limiter, budget)
         if not res:
             raise ValueError("The LLM said nothing")
         return float(res.strip())
 
+    def _eval_pack(self, items: List[Tuple[int, str, str]], limiter: AIMDLimiter | None = None,
+                   budget: RateBudget | None = None) -> Dict[int, float]:
+        """
+        Evaluate several (task, command) pairs with one request. The rubric is sent once, and the LLM answers with
+        a JSON object of scores keyed by pair id.
+        Args:
+            items (List[Tuple[int, str, str]]): (input index, task, command) tuples.
+            limiter (AIMDLimiter | None), budget (RateBudget | None): Rate control, see _call.
+        Returns:
+            Dict[int, float]: Scores keyed by input index. Pairs missing from a malformed answer are left out.
+        """
+        blocks = [
+            eval_pair_block
+            .replace("{{PAIR_ID}}", str(k))
+            .replace("{{TASK_DESCRIPTION}}", task)
+            .replace("{{BASH_COMMAND}}", command)
+            for k, (_, task, command) in enumerate(items, start=1)
+        ]
+        prompt = self.packed_template.replace("{{PAIRS}}", "\n".join(blocks))
+        res = self._call([{"role": "user", "content": prompt}], limiter, budget)
+        if not res:
+            raise ValueError("The LLM said nothing")
+
+        # tolerate a markdown fence around the JSON
+        text = res.strip().strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(obj, dict):
+            return {}
+
+        scores: Dict[int, float] = {}
+        for k, (idx, _, _) in enumerate(items, start=1):
+            try:
+                score = float(obj[str(k)])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= score <= 10:
+                scores[idx] = score
+        return scores
+
+    def functional_score(self, task: str, command: str) -> float | None:
+        """
+        Score a pair by running it in the sandbox: 0 if the run shows the command is broken (time-out, syntax or usage
+        error), 10 if it behaves like the reference command of the task (same output and side effects), None if the
+        run does not decide it, e.g. when a tool is missing on this host.
+        """
+        reference = self.references.get(task)
+        futures = [self.sandbox.submit(task, command)]
+        if reference:
+            futures.append(self.sandbox.submit(task, reference))
+        result = futures[0].result()
+        if result["skipped"]:
+            return None
+
+        score = None
+        if self.sandbox.failure(result) is not None:
+            score = 0.0
+        elif reference and self.sandbox.equivalent(result, futures[1].result()):
+            score = 10.0
+        with self._lock:
+            self.functional_stats["run"] += 1
+            self.functional_stats["failed"] += int(score == 0.0)
+            self.functional_stats["matched"] += int(score == 10.0)
+        return score
+
+    def _judge_unit(self, items: List[Tuple[int, str, str]], functional: bool = True,
+                    limiter: AIMDLimiter | None = None, budget: RateBudget | None = None) -> Dict[int, float]:
+        """
+        Judge one unit of work: a single pair, or a pack of pairs. If a packed answer is malformed or misses
+        some ids, the missing pairs are split into two smaller packs and judged again, down to single pairs.
+        Pairs that cannot be judged get -1.
+        Args:
+            items (List[Tuple[int, str, str]]): (input index, task, command) tuples.
+            functional (bool): Score the pairs that the sandbox can decide by their run first (if there is a sandbox).
+            limiter (AIMDLimiter | None), budget (RateBudget | None): Rate control of the calling batch, see _call.
+        Returns:
+            Dict[int, float]: Scores keyed by input index.
+        """
+        if functional and self.sandbox is not None:
+            scores: Dict[int, float] = {}
+            for idx, task, cmd in items:
+                try:
+                    score = self.functional_score(task, cmd)
+                except Exception as e:
+                    print(f"[WARN] sandbox run failed for cmd: {cmd!r}, err: {e}")
+                    score = None
+                if score is not None:
+                    scores[idx] = score
+            items = [item for item in items if item[0] not in scores]
+            if not items:
+                return scores
+            return {**scores, **self._judge_unit(items, False, limiter, budget)}
+
+        if len(items) == 1:
+            idx, task, cmd = items[0]
+            try:
+                return {idx: self._eval_one(task, cmd, limiter, budget)}
+            except Exception as e:
+                print(f"[WARN] judging failed for task: {task!r}, cmd: {cmd!r}, err: {e}")
+                return {idx: -1}
+
+        try:
+            scores = self._eval_pack(items, limiter, budget)
+        except Exception as e:
+            print(f"[WARN] packed judging failed for {len(items)} pairs, splitting: {e}")
+            scores = {}
+
+        missing = [item for item in items if item[0] not in scores]
+        if missing:
+            half = (len(missing) + 1) // 2
+            for part in (missing[:half], missing[half:]):
+                if part:
+                    scores.update(self._judge_unit(part, False, limiter, budget))
+        return scores
+
     def eval_batch(
             self,
             pairs: List[Tuple[str, str, int]],
             num_workers: int = 5,
             ofile: str | Path | None = None,
+            resume: bool = False,
+            ordered: bool = False,
+            adaptive: bool = False,
+            max_workers: int = 64,
+            rpm: int | None = None,
+            tpm: int | None = None,
+            target_latency: float | None = None,
+            pack_size: int = 1,
     ) -> list[tuple[str, str, int]] | tuple[list[tuple[str, str, int]], float]:
         """
         Evaluate a batch of (task, command) pairs using multiple workers.
+        Results are appended to `ofile` and flushed as each pair is judged, with a sidecar checkpoint
+        (<ofile>.ckpt), so a crash or Ctrl-C only loses the pairs that were in flight.
         Args:
             pairs (List[Tuple[str, str, int]]): A list of (task, command, dummy_score) tuples to evaluate.
             num_workers (int): The number of parallel workers to use for evaluation.
             ofile (str | Path | None): Optional output file path to save the results.
+            resume (bool): If True, keep the records already in `ofile` and only judge the missing pairs and the
+                pairs whose earlier judgment failed (-1).
+            ordered (bool): If True, the returned list and `ofile` follow the input order instead of the completion order.
+            adaptive (bool): If True, `num_workers` is only the starting concurrency. It grows (AIMD) while requests
+                succeed and shrinks on 429 / 5xx responses, up to `max_workers`.
+            max_workers (int): Upper bound of the concurrency in adaptive mode.
+            rpm (int | None): Requests-per-minute budget. None leaves it to the provider's rate-limit headers.
+            tpm (int | None): Tokens-per-minute budget.
+            target_latency (float | None): In adaptive mode, requests slower than this (seconds) also shrink the concurrency.
+            pack_size (int): Number of pairs judged per request. With K > 1 the rubric is sent once per K pairs;
+                malformed answers are re-split into smaller packs automatically.
         Returns:
             List[Tuple[str, str, int]]: A list of (task, command, score) tuples with the evaluated scores.
+                Pairs that could not be judged get a score of -1; they are not counted in the average.
         """
         results: List[Tuple[str, str, int]] = []    # (task, cmd, score)
         total_score = 0     # total score accumulator
         if not pairs:
             return results
 
+        log = ResultLog(ofile, resume=resume) if ofile is not None else None
+        scores: Dict[int, Tuple[str, str, int]] = {}    # input index -> (task, cmd, score)
+        todo = []
+        retried = 0
+        for idx, (task, cmd, _) in enumerate(pairs):
+            rec = log.done.get(idx) if log is not None else None
+            if rec is not None and rec.get("task") == task and rec.get("command") == cmd:
+                if rec.get("score", -1) >= 0:
+                    # judged in an earlier run
+                    scores[idx] = (task, cmd, rec["score"])
+                    continue
+                # a failed judgment (-1) is judged again; its new record replaces the old one
+                retried += 1
+            todo.append((idx, task, cmd))
+        if scores or retried:
+            print(f"Resuming: {len(scores)} pairs already judged, {len(todo)} to go "
+                  f"({retried} failed judgments retried)")
+        results.extend(scores.values())
+
+        # the limiter decides how many requests are in flight; without `adaptive` it stays at num_workers.
+        if adaptive:
+            limiter = AIMDLimiter(num_workers, max_limit=max_workers, target_latency=target_latency)
+        else:
+            limiter = AIMDLimiter(num_workers, min_limit=num_workers, max_limit=num_workers)
+        budget = RateBudget(rpm=rpm, tpm=tpm)
+        pool_size = max_workers if adaptive else num_workers
+        start = time.monotonic()
+
+        from tqdm.auto import tqdm
+
         # use ThreadPoolExecutor for parallel evaluation to accelerate the process. LLM calls are mostly API IO-bound, so it's not limited by GIL.
-        with ThreadPoolExecutor(max_workers=num_workers) as ex:
-            future_to_pair = {
-                ex.submit(self._eval_one, task, cmd): (task, cmd)
-                for (task, cmd, _) in pairs
+        ex = ThreadPoolExecutor(max_workers=pool_size)
+        try:
+            # a unit is one request: a single pair, or a pack of `pack_size` pairs
+            pack_size = max(1, pack_size)
+            units = [todo[i:i + pack_size] for i in range(0, len(todo), pack_size)]
+            future_to_unit = {
+                ex.submit(self._judge_unit, unit, True, limiter, budget): unit
+                for unit in units
             }
 
-            for fut in tqdm(
-                    as_completed(future_to_pair),
-                    total=len(future_to_pair),
-                    desc=f"Judging commands (workers={num_workers})",
+            with tqdm(
+                    total=len(todo),
+                    desc=f"Judging commands (workers={num_workers}{'+' if adaptive else ''}"
+                         f"{f', pack={pack_size}' if pack_size > 1 else ''})",
                     unit="case",
-            ):
-                task, cmd = future_to_pair[fut]
-                try:
-                    score = fut.result()
-                except Exception as e:
-                    print(f"[WARN] judging failed for task: {task!r}, cmd: {cmd!r}, err: {e}")
-                    score = -1
-                results.append((task, cmd, score))
-                total_score+=score
+            ) as pbar:
+                for fut in as_completed(future_to_unit):
+                    unit_scores = fut.result()
+                    for idx, task, cmd in future_to_unit[fut]:
+                        score = unit_scores.get(idx, -1)
+                        scores[idx] = (task, cmd, score)
+                        results.append((task, cmd, score))
+                        if log is not None:
+                            # stream the record to disk right away
+                            log.append(idx, {"task": task, "command": cmd, "score": score})
+                    pbar.update(len(future_to_unit[fut]))
+        finally:
+            # on Ctrl-C or a crash, do not start the pairs that are still queued
+            ex.shutdown(wait=True, cancel_futures=True)
+            if log is not None:
+                log.finalize(total=len(pairs), ordered=ordered)
+                log.close()
+
+        if ordered:
+            results = [scores[i] for i in sorted(scores)]
+        # failed judgments (-1) must not drag the average down
+        judged = [score for _, _, score in results if score >= 0]
+        total_score = sum(judged)
+        avg_score = total_score / len(judged) if judged else 0.0
+
+        elapsed = time.monotonic() - start
+        print(f"Judged {len(todo)} pairs in {elapsed:.1f}s ({len(todo) / max(elapsed, 1e-9) * 60:.0f} pairs/min), "
+              f"final concurrency {int(limiter.limit)} (peak {int(limiter.peak_limit)}), "
+              f"throttled responses: {limiter.throttled}, failed: {len(results) - len(judged)}")
+        if self.sandbox is not None:
+            stats = self.functional_stats
+            print(f"Sandbox: {stats['run']} pairs run, {stats['failed']} scored 0 (broken), "
+                  f"{stats['matched']} scored 10 (same behaviour as the reference) without a judging request")
 
-        # if ofile is given, save the results to the file.
+        # if ofile is given, the results are already saved to the file.
         if ofile is not None:
-            ofile = Path(ofile)
-            with ofile.open("w", encoding="utf-8") as f:
-                for task, cmd, score in results:
-                    rec: Dict[str, Any] = {
-                        "task": task,
-                        "command": cmd,
-                        "score": score,
-                    }
-                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-                # f.write(f"Total score: {total_score}, avg_score = {total_score / len(results)}\n")
-            print(f"total score: {total_score}, avg_score = {total_score / len(results)}")
+            print(f"total score: {total_score}, avg_score = {avg_score}")
             print(f"Saved {len(results)} judged records to {ofile}")
 
         # no matter of ofile, we return the results and average score
-        return results, total_score/len(results)
+        return results, avg_score
+
+    @staticmethod
+    def _load_pairs(infile: str | Path) -> List[Tuple[str, str, int]]:
+        # read the (task, command) pairs of a file generated by `Inference`
+        infile = Path(infile)
+        pairs: List[Tuple[str, str, int]] = []
+
+        with infile.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                obj = json.loads(line)
+                task = obj.get("task", "")
+                cmd = obj.get("command", "")
+                if task and cmd:
+                    pairs.append((task, cmd, 0))
+        return pairs
+
+    @staticmethod
+    def load_references(path: str | Path) -> Dict[str, str]:
+        """
+        Reference commands (task -> command) for the functional score, from a JSONL file of chat messages (like
+        nl2sh/data/nl2bash_validation_50.jsonl) or of {"task", "command"} records.
+        """
+        from nl2sh.retrieval import load_pairs
+
+        return dict(load_pairs([path]))
 
     def eval_from_file(
             self,
             infile: str | Path,
             outfile: str | Path,
             num_workers: int = 5,
+            resume: bool = False,
+            ordered: bool = False,
+            pack_size: int = 1,
     ) -> list[tuple[str, str, int]] | tuple[list[tuple[str, str, int]], float]:
         """
             Evaluate (task, command) pairs read from an input file generated by `Inference` class and write results to an output file.
@@ -124,26 +430,73 @@ class Evaluator:
                 infile (str | Path): The input file path containing (task, command) pairs in JSON lines format.
                 outfile (str | Path): The output file path to save the evaluation results.
                 num_workers (int): The number of parallel workers to use for evaluation.
+                resume (bool): If True, skip the pairs already judged in `outfile` (see eval_batch).
+                ordered (bool): If True, write `outfile` in input order.
+                pack_size (int): Number of pairs judged per request (see eval_batch).
             Returns:
                 List[Tuple[str, str, int]]: A list of (task, command, score) tuples with the evaluated scores.
         """
+        pairs = self._load_pairs(infile)
+        return self.eval_batch(pairs, num_workers=num_workers, ofile=outfile, resume=resume,
+                               ordered=ordered, pack_size=pack_size)
 
-        infile = Path(infile)
-        pairs: List[Tuple[str, str, int]] = []
+    def calibrate(
+            self,
+            infiles: List[str | Path],
+            pack_size: int = 5,
+            num_workers: int = 5,
+    ) -> Dict[str, Any]:
+        """
+        Judge the same pairs in single-pair and in packed mode, and compare the scores.
+        Args:
+            infiles (List[str | Path]): Files generated by `Inference` (e.g. the ones in gened_files/).
+            pack_size (int): The pack size to calibrate.
+            num_workers (int): The number of parallel workers.
+        Returns:
+            Dict[str, Any]: Number of pairs, average scores, mean absolute difference, exact / within-1 agreement,
+                Pearson correlation, and the number of requests of both modes.
+        """
+        pairs = [p for infile in infiles for p in self._load_pairs(infile)]
+        if not pairs:
+            raise ValueError("No pairs to calibrate on")
 
-        with infile.open("r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                obj = json.loads(line)
-                task = obj.get("task", "")
-                cmd = obj.get("command", "")
-                if task and cmd:
-                    pairs.append((task, cmd, 0))
+        before = self.requests
+        single, _ = self.eval_batch(pairs, num_workers=num_workers, ordered=True)
+        single_requests = self.requests - before
+
+        before = self.requests
+        packed, _ = self.eval_batch(pairs, num_workers=num_workers, ordered=True, pack_size=pack_size)
+        packed_requests = self.requests - before
+
+        # only compare pairs judged in both modes
+        both = [(a[2], b[2]) for a, b in zip(single, packed) if a[2] >= 0 and b[2] >= 0]
+        n = len(both)
+        xs = [a for a, _ in both]
+        ys = [b for _, b in both]
+        mx = sum(xs) / n if n else 0.0
+        my = sum(ys) / n if n else 0.0
+        cov = sum((x - mx) * (y - my) for x, y in both)
+        vx = sum((x - mx) ** 2 for x in xs)
+        vy = sum((y - my) ** 2 for y in ys)
 
-        return self.eval_batch(pairs, num_workers=num_workers, ofile=outfile)
+        report = {
+            "pairs": n,
+            "pack_size": pack_size,
+            "avg_single": mx,
+            "avg_packed": my,
+            "mean_abs_diff": sum(abs(x - y) for x, y in both) / n if n else 0.0,
+            "exact_agreement": sum(x == y for x, y in both) / n if n else 0.0,
+            "within_1_agreement": sum(abs(x - y) <= 1 for x, y in both) / n if n else 0.0,
+            "pearson": cov / (vx * vy) ** 0.5 if vx and vy else float("nan"),
+            "requests_single": single_requests,
+            "requests_packed": packed_requests,
+        }
 
+        print("=" * 64 + "\n Packed Judging Calibration\n" + "=" * 64)
+        for k, v in report.items():
+            print(f"{k:<20}: {v:.3f}" if isinstance(v, float) else f"{k:<20}: {v}")
+        print("=" * 64)
+        return report
 
 if __name__ == "__main__":
     q = "print the number of processors"
@@ -0,0 +1,211 @@
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Mapping
+
+"""
+Rate-limit-aware concurrency control for Evaluator.eval_batch.
+- AIMDLimiter: how many requests may be in flight. Additive increase while requests succeed fast,
+  multiplicative decrease on HTTP 429 / 5xx or when latency climbs past a target.
+- RateBudget: requests-per-minute and tokens-per-minute budgets, updated from the provider's
+  x-ratelimit-* response headers.
+- backoff_delay: jittered exponential backoff that honors retry-after.
+"""
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(text: str | None) -> float | None:
+    """
+    Parse the reset durations used in rate-limit headers, e.g. "1s", "6m0s", "20ms" or a plain number of seconds.
+    """
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(text)
+    if not parts:
+        return None
+    return sum(float(n) * _UNITS[u] for n, u in parts)
+
+
+def retry_after(headers: Mapping[str, str] | None) -> float | None:
+    # retry-after-ms is more precise, when the provider sends it
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+def backoff_delay(attempt: int, hint: float | None = None, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    Full-jitter exponential backoff. If the server told us when to retry, wait at least that long.
+    Args:
+        attempt (int): 0 for the first retry.
+        hint (float | None): retry-after from the server, in seconds.
+    Returns:
+        float: Seconds to sleep.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if hint is not None:
+        delay = max(delay, hint) + random.uniform(0, base)
+    return delay
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit (additive increase, multiplicative decrease).
+    Attributes:
+        limit (float): Current number of requests allowed in flight.
+        min_limit (int), max_limit (int): Bounds of the limit.
+        target_latency (float | None): Successful requests slower than this also shrink the limit. None disables it.
+        in_flight (int): Requests currently in flight.
+        throttled (int): Number of 429 / 5xx responses seen.
+    Methods:
+        acquire(): Block until a slot is free.
+        release(latency: float, throttled: bool): Free the slot and adapt the limit.
+    """
+
+    def __init__(self, initial: int = 5, min_limit: int = 1, max_limit: int = 64,
+                 target_latency: float | None = None, decrease: float = 0.5) -> None:
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.decrease = decrease
+        self.in_flight = 0
+        self.throttled = 0
+        self.peak_limit = self.limit
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            slow = self.target_latency is not None and latency > self.target_latency
+            if throttled:
+                self.throttled += 1
+            if throttled or slow:
+                # decrease at most once per round trip, so one burst of 429s does not collapse the limit
+                if now - self._last_decrease > latency:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                # +1 per `limit` successes, i.e. about +1 per round trip
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self.peak_limit = max(self.peak_limit, self.limit)
+            self._cond.notify_all()
+
+
+class RateBudget:
+    """
+    Requests-per-minute and tokens-per-minute budgets. The configured budgets are enforced with a
+    sliding one-minute window, and the x-ratelimit-* headers pause all workers when the provider
+    says a budget is used up.
+    Attributes:
+        rpm (int | None): Requests per minute. None means no local budget.
+        tpm (int | None): Tokens per minute. None means no local budget.
+    Methods:
+        acquire(tokens: int): Block until the request fits into the budgets.
+        record(estimated: int, actual: int): Replace the token estimate of a finished request by its actual usage.
+        update_from_headers(headers): Honor the provider's rate-limit headers.
+        observed() -> Dict[str, float]: Requests and tokens of the last minute.
+    """
+
+    def __init__(self, rpm: int | None = None, tpm: int | None = None) -> None:
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests: deque = deque()     # timestamps
+        self._tokens: deque = deque()       # (timestamp, tokens)
+        self._token_sum = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        while self._requests and now - self._requests[0] > 60:
+            self._requests.popleft()
+        while self._tokens and now - self._tokens[0][0] > 60:
+            self._token_sum -= self._tokens.popleft()[1]
+
+    def acquire(self, tokens: int = 0) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._trim(now)
+                wait = self._paused_until - now
+                if wait <= 0 and self.rpm is not None and len(self._requests) >= self.rpm:
+                    wait = 60 - (now - self._requests[0])
+                if wait <= 0 and self.tpm is not None and self._tokens and self._token_sum + tokens > self.tpm:
+                    wait = 60 - (now - self._tokens[0][0])
+                if wait <= 0:
+                    self._requests.append(now)
+                    # reserve the estimate, record() corrects it
+                    self._tokens.append((now, tokens))
+                    self._token_sum += tokens
+                    return
+            time.sleep(min(wait, 1.0))
+
+    def record(self, estimated: int, actual: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens.append((now, actual - estimated))
+            self._token_sum += actual - estimated
+
+    def update_from_headers(self, headers: Mapping[str, str] | None) -> None:
+        if not headers:
+            return
+        pause = 0.0
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                if remaining is not None and int(float(remaining)) <= 0:
+                    pause = max(pause, parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) or 1.0)
+            except ValueError:
+                continue
+        hint = retry_after(headers)
+        if hint:
+            pause = max(pause, hint)
+        if pause:
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def observed(self) -> Dict[str, float]:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {"rpm": len(self._requests), "tpm": self._token_sum}
+
+
+def is_throttle(err: Exception) -> bool:
+    """
+    Whether an exception is worth a retry: 429, 5xx, timeouts and connection errors.
+    """
+    import openai
+
+    if isinstance(err, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(err, openai.APIStatusError):
+        return err.status_code == 429 or err.status_code >= 500
+    return False
+
+
+def error_headers(err: Exception) -> Dict[str, Any]:
+    response = getattr(err, "response", None)
+    return dict(response.headers) if response is not None else {}
@@ -0,0 +1,124 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List
+
+"""
+Crash-safe JSONL result log for Evaluator.eval_batch.
+Every judged record is appended and flushed as soon as it is ready. A sidecar checkpoint (<ofile>.ckpt) keeps
+the byte offset of the last complete record, so a torn write from a crash is cut off when the log is reopened.
+"""
+
+
+class ResultLog:
+    """
+    Append-only JSONL log with a sidecar checkpoint.
+    Attributes:
+        path (Path): The output file.
+        ckpt_path (Path): The checkpoint file, <path>.ckpt.
+        done (Dict[int, Dict[str, Any]]): Records already in the log, keyed by input index. If an index was
+            appended twice (e.g. a failed judgment retried on resume), the later record wins.
+        replaced (int): How many records of the log have been superseded by a later record of the same index.
+    Methods:
+        append(index: int, record: Dict[str, Any]): Append one record, flush it and move the checkpoint.
+        finalize(total: int, ordered: bool): Rewrite the log in input order, or with one record per index if records
+            were replaced, and drop the checkpoint when complete.
+        close(): Close the file.
+    """
+
+    def __init__(self, path: str | Path, resume: bool = False) -> None:
+        self.path = Path(path)
+        self.ckpt_path = self.path.with_name(self.path.name + ".ckpt")
+        self.done: Dict[int, Dict[str, Any]] = {}
+        self.replaced = 0
+
+        offset = 0
+        if resume and self.path.exists():
+            offset = self._load()
+        else:
+            self.ckpt_path.unlink(missing_ok=True)
+
+        self._f = self.path.open("a+b")
+        # cut off anything after the last complete record (e.g. half a line from a crash)
+        self._f.truncate(offset)
+        self._f.seek(offset)
+        self._offset = offset
+
+    def _load(self) -> int:
+        """
+        Read back the records of an earlier run.
+        Returns:
+            int: The byte offset of the end of the last complete record.
+        """
+        limit = None
+        if self.ckpt_path.exists():
+            try:
+                limit = json.loads(self.ckpt_path.read_text(encoding="utf-8"))["offset"]
+            except (json.JSONDecodeError, KeyError, OSError) as e:
+                print(f"[WARN] unreadable checkpoint {self.ckpt_path}, scanning the log instead: {e}")
+
+        offset = 0
+        with self.path.open("rb") as f:
+            for line in f:
+                if limit is not None and offset + len(line) > limit:
+                    break
+                if not line.endswith(b"\n"):
+                    # torn write
+                    break
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if "index" in rec:
+                    self._keep(rec)
+                offset += len(line)
+        return offset
+
+    def append(self, index: int, record: Dict[str, Any]) -> None:
+        record = {"index": index, **record}
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self._f.write(line)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._offset += len(line)
+        self._keep(record)
+        self._write_ckpt()
+
+    def _keep(self, record: Dict[str, Any]) -> None:
+        # a replaced record moves to the end, so the completion order follows the latest records
+        if self.done.pop(record["index"], None) is not None:
+            self.replaced += 1
+        self.done[record["index"]] = record
+
+    def _write_ckpt(self) -> None:
+        tmp = self.ckpt_path.with_name(self.ckpt_path.name + ".tmp")
+        tmp.write_text(json.dumps({"offset": self._offset, "records": len(self.done)}), encoding="utf-8")
+        # atomic on POSIX, so the checkpoint is either the old one or the new one
+        os.replace(tmp, self.ckpt_path)
+
+    def records(self, ordered: bool = True) -> List[Dict[str, Any]]:
+        if ordered:
+            return [self.done[i] for i in sorted(self.done)]
+        return list(self.done.values())
+
+    def finalize(self, total: int, ordered: bool = False) -> None:
+        if ordered or self.replaced:
+            # rewrite with one record per index (the last one) next to the log, then swap it in
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                for rec in self.records(ordered=ordered):
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._f.close()
+            os.replace(tmp, self.path)
+            self._f = self.path.open("a+b")
+            self._offset = self.path.stat().st_size
+            self._f.seek(self._offset)
+            self.replaced = 0
+            self._write_ckpt()
+
+        if len(self.done) >= total:
+            # nothing left to resume
+            self.ckpt_path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self._f.close()
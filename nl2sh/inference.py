@@ -1,12 +1,29 @@
+import asyncio
+import contextvars
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
-from typing import List, Any
-
-from tqdm import tqdm
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List
 
+from nl2sh import deadline
+from nl2sh.agents.candidates import BatchInspector, CandidateComposer
+from nl2sh.agents.cascade_inspector import CascadeInspector
 from nl2sh.agents.clarifier import Clarifier
 from nl2sh.agents.composer import Composer
 from nl2sh.agents.inspector import Inspector
+from nl2sh.agents.pre_inspector import PreInspector
+from nl2sh.agents.response_cache import ResponseCache
+from nl2sh.agents.retriever import Retriever
+from nl2sh.agents.sandbox_inspector import SandboxInspector
+from nl2sh.context import TaskContext
+from nl2sh.tracing import Tracer
+
+if TYPE_CHECKING:
+    # numpy is only imported by whoever builds the index
+    from nl2sh.retrieval import RetrievalIndex
 
 
 # States
@@ -14,7 +31,11 @@ INIT = 'init'
 CLARIFIED = 'clarified'
 COMPOSED = 'composed'
 NOT_PASS = 'not_passed'
+PRE_CHECKED = 'pre_checked'
+EXECUTED = 'executed'
+CANDIDATES = 'candidates'
 DONE = 'done'
+TIMED_OUT = 'timed_out'
 
 # finetuned model for composer
 FT_MD = 'ft:gpt-4o-mini-2024-07-18:personal:dl-prj-2-1k-filtered:CeTXCBeh'
@@ -23,20 +44,18 @@ FT_MD = 'ft:gpt-4o-mini-2024-07-18:personal:dl-prj-2-1k-filtered:CeTXCBeh'
 MD = 'gpt-4o-mini'
 
 
-def load_evaluation_nl(path: str | Path = "nl2sh/data/nl2bash_eval_50.jsonl",
-                       ) -> List[str]:
+def iter_evaluation_nl(path: str | Path = "nl2sh/data/nl2bash_eval_50.jsonl") -> Iterator[str]:
     """
-    Load evaluation NL tasks from a JSONL file. Each line in the file should be a JSON object
-    containing a "messages" field, which is a list of message objects. The function extracts
-    the content of the first message with the role "user" from each JSON object.
+    Lazily read evaluation NL tasks from a JSONL file, one line at a time, so a file of any size can be streamed.
+    Each line in the file should be a JSON object containing a "messages" field, which is a list of message
+    objects. The content of the first message with the role "user" of each JSON object is yielded.
     Args:
         path (str | Path): Path to the JSONL file containing evaluation tasks.
-    Returns:
-        List[str]: A list of NL-to-shell tasks extracted from the file.
+    Yields:
+        str: The NL-to-shell tasks of the file, in file order.
     """
 
     path = Path(path)
-    nl_list: List[str] = []
 
     with path.open("r", encoding="utf-8") as f:
         for line_no, line in enumerate(f, start=1):
@@ -61,9 +80,19 @@ def load_evaluation_nl(path: str | Path = "nl2sh/data/nl2bash_eval_50.jsonl",
                 print(f"[WARN] line {line_no}: no user message found")
                 continue
 
-            nl_list.append(user_msgs[0])
+            yield user_msgs[0]
 
-    return nl_list
+
+def load_evaluation_nl(path: str | Path = "nl2sh/data/nl2bash_eval_50.jsonl",
+                       ) -> List[str]:
+    """
+    Load evaluation NL tasks from a JSONL file into a list, see iter_evaluation_nl.
+    Args:
+        path (str | Path): Path to the JSONL file containing evaluation tasks.
+    Returns:
+        List[str]: A list of NL-to-shell tasks extracted from the file.
+    """
+    return list(iter_evaluation_nl(path))
 
 
 class Inference:
@@ -74,91 +103,200 @@ class Inference:
         clarifier (Clarifier): The Clarifier agent for refining user input.
         inspector (Inspector): The Inspector agent for validating generated commands.
         sched (dict): A scheduling dictionary mapping states to agents to implement the finite state machine.
+        speculative (bool): If True, the composer starts on the raw user input at the same time as the clarifier,
+            and the clarified path is only used when the speculative command fails inspection.
+        speculation_stats (dict): Number of speculative tasks, hits, and total latency saved in seconds.
+        pre_inspector (PreInspector | None): Local syntax/ShellCheck/binary check that runs before the Inspector
+            when pre_inspect=True, and rejects obviously broken commands without an LLM call.
+        sandbox_inspector (SandboxInspector | None): With sandbox=True, every composed command is run on a throwaway
+            fixture file system (nl2sh/sandbox.py) before the Inspector. A run that shows the command is broken goes
+            straight back to the composer; with sandbox_accept=True a clean run is accepted without the Inspector.
+        tracer (Tracer | None): If given, every agent execution is recorded as a span (latency, TTFB, tokens).
+        cascade (bool): If True, the inspector is a CascadeInspector: gpt-4o-mini judges first, and gpt-5.1 is only
+            asked for INCORRECT, unparseable or low-confidence (< cascade_threshold) verdicts. It cannot be combined
+            with inspect_abltn, whose inspector is gpt-4o-mini alone.
+        candidates (int): If > 1, the first composition produces this many candidates with parallel calls, and a
+            BatchInspector judges them all in one request; the suggestion-driven recompose loop is the fallback.
+            With pre_inspect / sandbox, broken candidates are dropped before that request.
+        stream (bool): If True, the Composer and the Inspector stream their answers: a fenced command is handed off
+            at its closing fence, and a first line of exactly CORRECT ends the inspector call.
+        deadline_s (float | None): Per-task wall-clock budget. The time left is sent as the timeout of every LLM
+            request; when it runs out, the task ends in TIMED_OUT with the best command produced so far.
+        failures (List[tuple[str, str]]): (task, error) of the tasks that failed in the batch runners. A failing
+            task gets an empty command instead of aborting the batch.
+        retriever (Retriever | None): With a retrieval index, a task that nearly duplicates a vetted pair
+            (score >= retrieval_threshold) is answered with its command before any LLM call; with
+            retrieval_verify=True the Inspector still checks it. retrieval_threshold=None turns this off.
+            few_shot > 0 gives the Composer (and the CandidateComposer) that many similar pairs of the index as
+            examples.
+        max_history (int | None): If set, every task context keeps only this many entries of its composer and
+            inspector histories (the agents only read the last one), which bounds the memory of long recompose
+            loops when many contexts are in flight. The contexts are TaskContext objects (nl2sh/context.py).
     Methods:
-        run_single(task: str, max_recompose: int | None = None) -> tuple[str | Any, int] | str:
+        run_single(task: str, max_recompose: int | None = None, deadline_s: float | None = None) -> tuple[str | Any, int] | str:
             Runs the inference pipeline for a single NL task.
         gen_eval_commands(tasks: List[str], max_recompose: int | None = None, ofile: str|None = None) -> List[tuple[str, str, int]]:
             Generates shell commands for a list of NL tasks and optionally saves the results to a file. 
+        arun_single / agen_eval_commands:
+            Asyncio versions of the two methods above. agen_eval_commands runs many tasks concurrently
+            under a concurrency limit and returns the results in input order.
     Finite State Machine States:
         INIT: Initial state before any processing.
         CLARIFIED: State after the Clarifier has refined the user input.
         COMPOSED: State after the Composer has generated a shell command.
         NOT_PASS: State when the Inspector does not approve the generated command.
+        PRE_CHECKED: State after the PreInspector found no hard error (only with pre_inspect=True).
+        EXECUTED: State after the SandboxInspector ran the command without a failure (only with sandbox=True).
+        CANDIDATES: State after the CandidateComposer produced several candidates (only with candidates > 1).
         DONE: Final state indicating successful completion of the pipeline.
+        TIMED_OUT: Final state when the task deadline ran out; the last command composed is returned.
     State Transitions:
         init -> clarifier -> clarified
+        (retrieval: init -> retriever -> done / composed on a direct match, else the usual init)
+        (speculative: init -> clarifier || composer -> inspector -> done, or clarified on a miss)
         clarified -> composer -> composed
+        (candidates: clarified -> candidate_composer -> candidates -> batch_inspector -> done / not_pass / composed)
         [composed -> inspector -> done / not_pass
+         (pre_inspect: composed -> pre_inspector -> pre_checked / not_pass, pre_checked -> inspector)
+         (sandbox: composed / pre_checked -> sandbox_inspector -> executed / not_pass / done, executed -> inspector)
         not_pass -> composer -> composed] repeat until done
+        any state -> timed_out once the task deadline has passed
     """
 
-    def __init__(self, use_finetune: bool=False, inspect_abltn: bool=False):
-        self.composer = Composer(model = FT_MD) if use_finetune else Composer()
-        self.clarifier = Clarifier()
-        self.inspector = Inspector(MD) if inspect_abltn else Inspector()
+    def __init__(self, use_finetune: bool=False, inspect_abltn: bool=False,
+                 cache: ResponseCache | None = None, speculative: bool = False,
+                 pre_inspect: bool = False, tracer: Tracer | None = None,
+                 cascade: bool = False, cascade_threshold: float = 0.8, candidates: int = 0,
+                 stream: bool = False, deadline_s: float | None = None,
+                 retrieval: "RetrievalIndex | None" = None, retrieval_threshold: float | None = 0.9,
+                 retrieval_verify: bool = False, few_shot: int = 0, max_history: int | None = None,
+                 sandbox: bool = False, sandbox_accept: bool = False):
+        if cascade and inspect_abltn:
+            # the ablation measures the cheap inspector alone; a cascade would still escalate to gpt-5.1
+            raise ValueError("cascade=True cannot be combined with inspect_abltn=True")
+        # the same (optional) response cache is shared by all three agents.
+        self.composer = Composer(model=FT_MD if use_finetune else MD, cache=cache, stream=stream,
+                                 index=retrieval if few_shot > 0 else None, few_shot=few_shot)
+        self.clarifier = Clarifier(cache=cache)
+        if cascade:
+            # the cascade reads the whole answer for its CONFIDENCE line, so it is never streamed.
+            self.inspector = CascadeInspector(cheap_model=MD, threshold=cascade_threshold, cache=cache)
+        else:
+            self.inspector = Inspector(MD if inspect_abltn else 'gpt-5.1', cache=cache, stream=stream)
         self.sched = {
             INIT: self.clarifier,
             CLARIFIED: self.composer,
             COMPOSED: self.inspector,
             NOT_PASS: self.composer,
         }
+        # local pre-inspection: composed -> pre_inspector -> pre_checked -> inspector, or straight to not_passed.
+        self.pre_inspector = PreInspector() if pre_inspect else None
+        if self.pre_inspector is not None:
+            self.sched[COMPOSED] = self.pre_inspector
+            self.sched[PRE_CHECKED] = self.inspector
+        # execution-based inspection, after the cheaper static checks if both are on:
+        # ... -> sandbox_inspector -> executed -> inspector, or straight to not_passed (or done with sandbox_accept).
+        self.sandbox_inspector = SandboxInspector(accept=sandbox_accept) if sandbox else None
+        if self.sandbox_inspector is not None:
+            self.sched[PRE_CHECKED if self.pre_inspector is not None else COMPOSED] = self.sandbox_inspector
+            self.sched[EXECUTED] = self.inspector
+        # multi-candidate mode: clarified -> candidate_composer -> candidates -> batch_inspector.
+        self.batch_inspector = None
+        if candidates > 1:
+            self.candidate_composer = CandidateComposer(model=self.composer.model, n=candidates, cache=cache,
+                                                        index=self.composer.index, few_shot=few_shot)
+            self.batch_inspector = BatchInspector(
+                MD if inspect_abltn else 'gpt-5.1', pre_inspector=self.pre_inspector, cache=cache,
+                sandbox=self.sandbox_inspector.sandbox if self.sandbox_inspector is not None else None)
+            self.sched[CLARIFIED] = self.candidate_composer
+            self.sched[CANDIDATES] = self.batch_inspector
+        # retrieval fast path: runs once before the FSM, see run_single.
+        self.retriever = None
+        if retrieval is not None and retrieval_threshold is not None:
+            self.retriever = Retriever(retrieval, retrieval_threshold, retrieval_verify)
+        # speculative mode: compose on the raw input while the clarifier runs, see _speculate.
+        self.speculative = speculative
+        self.speculation_stats = {"tasks": 0, "hits": 0, "saved_s": 0.0}
+        self.tracer = tracer
+        self.deadline_s = deadline_s
+        self.failures: List[tuple[str, str]] = []
+        self.max_history = max_history
         print(f"Current model settings: \n {'='*64} \n"
               f"Composer = {self.composer.model} \n"
               f"Clarifier = {self.clarifier.model} \n"
               f"Inspector = {self.inspector.model}")
 
-    def run_single(self, task: str, max_recompose: int | None = None) -> tuple[str | Any, int] | str:
+    def _init_context(self, task: str) -> TaskContext:
+        # init the context
+        return TaskContext(task, clarifier="", state=INIT, max_history=self.max_history)
+
+    def _next_agent(self, context: Dict[str, Any], recompose_cnt: int,
+                    max_recompose: int | None) -> tuple[Any, int]:
         """
-        Run the inference pipeline for a single NL task.
+        One step of the scheduler: pick the agent for the current state.
         Args:
-            task (str): The NL task to be processed.
-            max_recompose (int | None): Maximum number of recomposition attempts if the inspector does not pass.
+            context (Dict[str, Any]): The current context.
+            recompose_cnt (int): The number of recomposition attempts so far.
+            max_recompose (int | None): Maximum number of recomposition attempts.
         Returns:
-            tuple[str | Any, int] | str: The final generated shell command and the number of recomposition attempts or an empty string if no command was generated.
+            tuple[Any, int]: The next agent (None if the recompose budget is used up) and the updated recompose counter.
         """
+        # get current state
+        curr_state = context["state"]
 
-        print(f"Current Task: {task} \n {'='*64}")
-
-        # init the context
-        context = {
-            "usr_input": task,
-            "clarifier": "",
-            "composer_history": [],
-            "inspector_history": [],
-            "state": INIT,
-        }
-        
-        # recompose counter
-        recompose_cnt = 0
-
-        # main loop
-        while context["state"] != DONE:
-
-            # get current state
-            curr_state = context["state"]
-
-            # check max recompose attempts
-            if curr_state == NOT_PASS and max_recompose is not None:
-                if recompose_cnt >= max_recompose:
-                    print("\n[Warning] Maximum recomposition attempts reached")
-                    break
-                recompose_cnt += 1
-
-            # retrieve next agent
-            next_agent = self.sched[curr_state]
+        # check max recompose attempts
+        if curr_state == NOT_PASS and max_recompose is not None:
+            if recompose_cnt >= max_recompose:
+                print("\n[Warning] Maximum recomposition attempts reached")
+                return None, recompose_cnt
+            recompose_cnt += 1
 
-            # print state info
-            print(
-                f"\n[State]   {curr_state}\n"
-                f"[Next]    {next_agent.name}\n"
-                f"{'-' * 64}"
-            )
-            try:
-                # based on the design, each agent has an execute function
-                context = next_agent.execute(context)
-            except Exception as e:
-                raise RuntimeError(f"something wrong with the inference: {e}")
+        # retrieve next agent
+        next_agent = self.sched[curr_state]
 
+        # print state info
+        print(
+            f"\n[State]   {curr_state}\n"
+            f"[Next]    {next_agent.name}\n"
+            f"{'-' * 64}"
+        )
+        return next_agent, recompose_cnt
+
+    def _span(self, agent: Any, context: Dict[str, Any], recompose_cnt: int = 0):
+        if self.tracer is None:
+            return nullcontext({})
+        return self.tracer.span(agent, context, recompose_cnt)
+
+    def _exec(self, agent: Any, context: Dict[str, Any], recompose_cnt: int = 0) -> Dict[str, Any]:
+        # run one agent, traced if a tracer is set
+        with self._span(agent, context, recompose_cnt) as span:
+            context = agent.execute(context)
+            span["to_state"] = context["state"]
+        return context
+
+    async def _aexec(self, agent: Any, context: Dict[str, Any], recompose_cnt: int = 0) -> Dict[str, Any]:
+        with self._span(agent, context, recompose_cnt) as span:
+            context = await agent.aexecute(context)
+            span["to_state"] = context["state"]
+        return context
+
+    def _time_out(self, context: Dict[str, Any], fallback: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        """
+        End a task whose deadline passed. The last composed command is kept as the answer; without one, the
+        speculative command (fallback) or the first candidate is used.
+        """
+        print("\n[Warning] Task deadline reached, returning the best command so far")
+        if not context["composer_history"]:
+            if fallback is not None and fallback["composer_history"]:
+                context["composer_history"] = list(fallback["composer_history"])
+                context["inspector_history"] = list(fallback["inspector_history"])
+            elif context.get("candidates"):
+                context["composer_history"] = [context["candidates"][0]]
+        context["state"] = TIMED_OUT
+        return context
+
+    def _report(self, context: Dict[str, Any], recompose_cnt: int,
+                max_recompose: int | None) -> tuple[str | Any, int] | str:
         # final report
         if context["composer_history"]:
             final_cmd = context["composer_history"][-1]
@@ -169,6 +307,8 @@ class Inference:
             state_note = "SUCCESS"
         elif context["state"] == NOT_PASS:
             state_note = "INCOMPLETE (inspector did not pass)"
+        elif context["state"] == TIMED_OUT:
+            state_note = "TIMED OUT (best command so far)"
         else:
             state_note = "INTERRUPTED"
 
@@ -184,6 +324,9 @@ class Inference:
             + (f" / {max_recompose}" if max_recompose is not None else "")
             + "\n"
             f"Final Command     : {final_cmd}\n"
+            + (self._speculation_note(context["speculation"]) if "speculation" in context else "")
+            + (f"Retrieved         : {context['retrieval']['task']} (score {context['retrieval']['score']:.2f})\n"
+               if "retrieval" in context else "")
             + "=" * 64
         )
 
@@ -192,30 +335,345 @@ class Inference:
         else:
             return ""
 
+    def _spec_context(self, context: Dict[str, Any]) -> TaskContext:
+        # a separate context without the clarifier key, so the composer and inspector work on the raw input.
+        return TaskContext(context["usr_input"], clarifier=None, state=INIT, max_history=self.max_history)
+
+    def _inspect(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        # inspect a composed context, through the pre-inspector and the sandbox if they are enabled.
+        if self.pre_inspector is not None:
+            context = self._exec(self.pre_inspector, context)
+            if context["state"] != PRE_CHECKED:
+                return context
+        if self.sandbox_inspector is not None:
+            context = self._exec(self.sandbox_inspector, context)
+            if context["state"] != EXECUTED:
+                return context
+        return self._exec(self.inspector, context)
+
+    async def _ainspect(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        if self.pre_inspector is not None:
+            context = await self._aexec(self.pre_inspector, context)
+            if context["state"] != PRE_CHECKED:
+                return context
+        if self.sandbox_inspector is not None:
+            context = await self._aexec(self.sandbox_inspector, context)
+            if context["state"] != EXECUTED:
+                return context
+        return await self._aexec(self.inspector, context)
+
+    def _merge_speculation(self, context: Dict[str, Any], spec_ctx: Dict[str, Any] | None,
+                           clar_ctx: Dict[str, Any] | None, clar_time: float | None,
+                           spec_time: float, elapsed: float) -> Dict[str, Any]:
+        """
+        Decide between the speculative and the clarified path and record the outcome in context["speculation"].
+        Args:
+            context (Dict[str, Any]): The task context, still in INIT.
+            spec_ctx (Dict[str, Any] | None): The speculative context, or None if speculation failed with an error.
+            clar_ctx (Dict[str, Any] | None): The clarified context, or None if the clarifier has not finished (hit only).
+            clar_time (float | None): Wall time of the clarifier, None if it has not finished.
+            spec_time (float): Wall time of the speculative compose + inspect.
+            elapsed (float): Time since the speculation started.
+        Returns:
+            Dict[str, Any]: The context to continue the FSM with.
+        """
+        hit = spec_ctx is not None and spec_ctx["state"] == DONE
+        spec_cmd = spec_ctx["composer_history"][-1] if spec_ctx and spec_ctx["composer_history"] else None
+
+        if hit:
+            # the non-speculative path would have waited for the clarifier first.
+            # if it is still running, the time so far is a lower bound of the saving.
+            saved = clar_time if clar_time is not None else elapsed
+            context["composer_history"] = spec_ctx["composer_history"]
+            context["inspector_history"] = spec_ctx["inspector_history"]
+            if clar_ctx is not None:
+                context["clarifier"] = clar_ctx["clarifier"]
+            context["state"] = DONE
+        else:
+            # the speculative work only cost the time it ran past the clarifier.
+            saved = -max(0.0, spec_time - (clar_time or 0.0))
+            context = clar_ctx
 
-    def gen_eval_commands(self, tasks: List[str],
-                          max_recompose: int | None = None,
-                          ofile: str|None = None) -> List[tuple[str, str, int]]:
+        context["speculation"] = {"hit": hit, "command": spec_cmd, "saved_s": saved}
+        self.speculation_stats["tasks"] += 1
+        self.speculation_stats["hits"] += int(hit)
+        self.speculation_stats["saved_s"] += saved
+        return context
+
+    def _speculate(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Generate shell commands in batch for a list of NL tasks and optionally save the results to a file.
+        Run the clarifier in a background thread while the composer and inspector work on the raw input.
+        On a hit the clarifier is cancelled if it has not started yet; a running one cannot be interrupted, so it is
+        abandoned: its result is dropped and its span is marked as cancelled, like the cancelled task of _aspeculate.
         Args:
-            tasks (List[str]): A list of NL tasks to be processed.
+            context (Dict[str, Any]): The task context in INIT state.
+        Returns:
+            Dict[str, Any]: DONE context if the speculative command passed, otherwise the CLARIFIED context.
+        """
+        print(f"\n[State]   {INIT}\n"
+              f"[Next]    {self.clarifier.name} + {self.composer.name} (speculative)\n"
+              f"{'-' * 64}")
+
+        abandoned = threading.Event()
+
+        def _clarify(ctx: Dict[str, Any]) -> tuple[Dict[str, Any], float]:
+            t = time.perf_counter()
+            with self._span(self.clarifier, ctx) as span:
+                ctx = self.clarifier.execute(ctx)
+                span["to_state"] = ctx["state"]
+                if abandoned.is_set():
+                    span["error"] = "cancelled: the speculative command passed first"
+            return ctx, time.perf_counter() - t
+
+        start = time.perf_counter()
+        ex = ThreadPoolExecutor(max_workers=1)
+        # the thread runs in a copy of our contextvars, so the clarifier sees the task deadline
+        clar_fut = ex.submit(contextvars.copy_context().run, _clarify, context.copy())
+        # the agents update it in place, so a command composed before a failure is kept for _time_out
+        partial = self._spec_context(context)
+        try:
+            spec_ctx = self._inspect(self._exec(self.composer, partial))
+        except Exception as e:
+            print(f"[WARN] speculative composition failed, falling back: {e}")
+            spec_ctx = None
+        spec_time = time.perf_counter() - start
+        # do not wait for the clarifier if we do not need it.
+        ex.shutdown(wait=False)
+
+        if spec_ctx is not None and spec_ctx["state"] == DONE:
+            if clar_fut.done() and not clar_fut.cancelled() and not clar_fut.exception():
+                clar_ctx, clar_time = clar_fut.result()
+            else:
+                abandoned.set()
+                clar_fut.cancel()
+                clar_ctx, clar_time = None, None
+        else:
+            try:
+                clar_ctx, clar_time = clar_fut.result()
+            except Exception:
+                if deadline.expired():
+                    return self._time_out(context, partial)
+                raise
+        context = self._merge_speculation(context, spec_ctx, clar_ctx, clar_time,
+                                          spec_time, time.perf_counter() - start)
+        if context["state"] != DONE and deadline.expired():
+            return self._time_out(context, partial)
+        return context
+
+    async def _aspeculate(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async version of _speculate. The clarifier runs as a separate task and is cancelled on a hit.
+        """
+        print(f"\n[State]   {INIT}\n"
+              f"[Next]    {self.clarifier.name} + {self.composer.name} (speculative)\n"
+              f"{'-' * 64}")
+
+        async def _clarify(ctx: Dict[str, Any]) -> tuple[Dict[str, Any], float]:
+            t = time.perf_counter()
+            ctx = await self._aexec(self.clarifier, ctx)
+            return ctx, time.perf_counter() - t
+
+        async def _compose_inspect() -> Dict[str, Any]:
+            return await self._ainspect(await self._aexec(self.composer, partial))
+
+        start = time.perf_counter()
+        clar_task = asyncio.create_task(_clarify(context.copy()))
+        partial = self._spec_context(context)
+        try:
+            try:
+                spec_ctx = await asyncio.wait_for(_compose_inspect(), deadline.remaining())
+            except Exception as e:
+                print(f"[WARN] speculative composition failed, falling back: {e}")
+                spec_ctx = None
+            spec_time = time.perf_counter() - start
+
+            if spec_ctx is not None and spec_ctx["state"] == DONE:
+                if clar_task.done() and not clar_task.cancelled() and not clar_task.exception():
+                    clar_ctx, clar_time = clar_task.result()
+                else:
+                    clar_task.cancel()
+                    clar_ctx, clar_time = None, None
+            else:
+                try:
+                    clar_ctx, clar_time = await asyncio.wait_for(clar_task, deadline.remaining())
+                except Exception:
+                    if deadline.expired():
+                        return self._time_out(context, partial)
+                    raise
+        finally:
+            # never leave the clarifier running behind us, e.g. after a failure
+            if not clar_task.done():
+                clar_task.cancel()
+        context = self._merge_speculation(context, spec_ctx, clar_ctx, clar_time,
+                                          spec_time, time.perf_counter() - start)
+        if context["state"] != DONE and deadline.expired():
+            return self._time_out(context, partial)
+        return context
+
+    @staticmethod
+    def _speculation_note(spec: Dict[str, Any]) -> str:
+        if spec["hit"]:
+            return f"Speculation       : HIT (saved {spec['saved_s']:.2f}s)\n"
+        return f"Speculation       : MISS (cost {-spec['saved_s']:.2f}s, speculative command: {spec['command']})\n"
+
+    def _print_summary(self) -> None:
+        # batch-level stats of the optional stages
+        stats = self.speculation_stats
+        if stats["tasks"]:
+            print(f"Speculation hit rate: {stats['hits']}/{stats['tasks']} "
+                  f"({stats['hits'] / stats['tasks']:.1%}), latency saved: {stats['saved_s']:.2f}s in total")
+        if self.retriever is not None and self.retriever.lookups:
+            print(f"Retrieval: {self.retriever.hits}/{self.retriever.lookups} tasks matched a vetted pair "
+                  f"({self.retriever.hit_rate():.1%})")
+        if self.pre_inspector is not None and self.pre_inspector.checked:
+            print(f"Pre-inspection: {self.pre_inspector.rejected}/{self.pre_inspector.checked} inspector calls avoided "
+                  f"({self.pre_inspector.avoided_rate():.1%})")
+        if self.sandbox_inspector is not None and self.sandbox_inspector.checked:
+            sandbox = self.sandbox_inspector
+            print(f"Sandbox: {sandbox.rejected + sandbox.accepted}/{sandbox.checked} inspector calls avoided "
+                  f"({sandbox.avoided_rate():.1%}; {sandbox.rejected} failed runs, {sandbox.accepted} accepted)")
+        if isinstance(self.inspector, CascadeInspector) and self.inspector.stats["inspections"]:
+            stats = self.inspector.stats
+            print(f"Inspector cascade: {stats['escalations']}/{stats['inspections']} escalated to "
+                  f"{self.inspector.strong.model} ({self.inspector.escalation_rate():.1%}, reasons: {stats['reasons']}), "
+                  f"cheap/strong agreement: {stats['agreed']}/{stats['compared']} ({self.inspector.agreement_rate():.1%})")
+        if self.batch_inspector is not None and self.batch_inspector.stats["batches"]:
+            stats = self.batch_inspector.stats
+            print(f"Candidates: {stats['accepted']}/{stats['batches']} tasks accepted a candidate in one round "
+                  f"(by rank: {dict(sorted(stats['accepted_rank'].items()))}), {stats['none_correct']} fell back to "
+                  f"recompose, {stats['unparseable']} to the inspector; candidates dropped by the local checks: "
+                  f"{stats['pre_rejected']} pre-inspection, {stats['sandbox_rejected']} sandbox "
+                  f"(skipped for {stats['sandbox_skipped']} tasks short of time)")
+        if self.failures:
+            print(f"Failed tasks: {len(self.failures)} (empty command in the results)")
+            for task, error in self.failures:
+                print(f"  {task[:60]!r}: {error}")
+        if self.tracer is not None and self.tracer.spans:
+            self.tracer.print_summary()
+
+    def run_single(self, task: str, max_recompose: int | None = None,
+                   deadline_s: float | None = None) -> tuple[str | Any, int] | str:
+        """
+        Run the inference pipeline for a single NL task.
+        Args:
+            task (str): The NL task to be processed.
             max_recompose (int | None): Maximum number of recomposition attempts if the inspector does not pass.
-            ofile (str | None): Optional output file path to save the results in JSONL format.
+            deadline_s (float | None): Wall-clock budget of this task, defaults to self.deadline_s.
         Returns:
-            List[tuple[str, str, int]]: A list of tuples containing the NL task, generated shell command, and number of recomposition attempts.
+            tuple[str | Any, int] | str: The final generated shell command and the number of recomposition attempts or an empty string if no command was generated.
         """
-        results: List[tuple[str, str, int]] = []    # structure: (task, command, retry_times)
 
-        # to avoid race condition, we run sequentially here
-        for task in tqdm(tasks, desc="Evaluating tasks", unit="task"):
-            cmd, retry_times = self.run_single(task, max_recompose)
-            results.append((task, cmd, retry_times))
-        
+        print(f"Current Task: {task} \n {'='*64}")
+
+        context = self._init_context(task)
+
+        # recompose counter
+        recompose_cnt = 0
+
+        # every LLM request below gets the time left as its timeout, see nl2sh/deadline.py
+        with deadline.scope(deadline.after(deadline_s if deadline_s is not None else self.deadline_s)):
+            if self.retriever is not None:
+                # a direct match skips the clarifier and composer (and the inspector unless verify is set)
+                context = self._exec(self.retriever, context)
+
+            if self.speculative and context["state"] == INIT:
+                try:
+                    context = self._speculate(context)
+                except Exception as e:
+                    if not deadline.expired():
+                        raise RuntimeError(f"something wrong with the inference: {e}")
+                    context = self._time_out(context)
+
+            # main loop
+            while context["state"] not in (DONE, TIMED_OUT):
+                if deadline.expired():
+                    context = self._time_out(context)
+                    break
+                next_agent, recompose_cnt = self._next_agent(context, recompose_cnt, max_recompose)
+                if next_agent is None:
+                    break
+                try:
+                    # based on the design, each agent has an execute function
+                    context = self._exec(next_agent, context, recompose_cnt)
+                except Exception as e:
+                    if not deadline.expired():
+                        raise RuntimeError(f"something wrong with the inference: {e}")
+                    # the request timed out at the deadline
+                    context = self._time_out(context)
+
+        return self._report(context, recompose_cnt, max_recompose)
+
+    async def arun_single(self, task: str, max_recompose: int | None = None,
+                          on_step: Callable[[str, Dict[str, Any]], None] | None = None,
+                          deadline_s: float | None = None) -> tuple[str | Any, int] | str:
+        """
+        Async version of run_single. The FSM is the same, but each agent is awaited through its aexecute function,
+        so many tasks can move through the scheduler at once on a single event loop.
+        Args:
+            task (str): The NL task to be processed.
+            max_recompose (int | None): Maximum number of recomposition attempts if the inspector does not pass.
+            on_step (Callable[[str, Dict[str, Any]], None] | None): Called with the agent name and the context
+                after every agent execution, e.g. to stream the progress to a client.
+            deadline_s (float | None): Wall-clock budget of this task, defaults to self.deadline_s. Besides the
+                request timeouts, every step is cancelled when the deadline passes.
+        Returns:
+            tuple[str | Any, int] | str: The final generated shell command and the number of recomposition attempts or an empty string if no command was generated.
+        """
+
+        print(f"Current Task: {task} \n {'='*64}")
+
+        context = self._init_context(task)
+
+        # recompose counter
+        recompose_cnt = 0
+
+        with deadline.scope(deadline.after(deadline_s if deadline_s is not None else self.deadline_s)):
+            if self.retriever is not None:
+                context = await self._aexec(self.retriever, context)
+                if on_step is not None:
+                    on_step(self.retriever.name, context)
+
+            if self.speculative and context["state"] == INIT:
+                try:
+                    context = await self._aspeculate(context)
+                except Exception as e:
+                    if not deadline.expired():
+                        raise RuntimeError(f"something wrong with the inference: {e}")
+                    context = self._time_out(context)
+                if on_step is not None:
+                    on_step("speculation", context)
+
+            # main loop
+            while context["state"] not in (DONE, TIMED_OUT):
+                if deadline.expired():
+                    context = self._time_out(context)
+                    break
+                next_agent, recompose_cnt = self._next_agent(context, recompose_cnt, max_recompose)
+                if next_agent is None:
+                    break
+                try:
+                    # wait_for(..., None) does not time out
+                    context = await asyncio.wait_for(self._aexec(next_agent, context, recompose_cnt),
+                                                     deadline.remaining())
+                except Exception as e:
+                    if not deadline.expired():
+                        raise RuntimeError(f"something wrong with the inference: {e}")
+                    context = self._time_out(context)
+                if on_step is not None:
+                    on_step(next_agent.name, context)
+
+        return self._report(context, recompose_cnt, max_recompose)
+
+    def _fail(self, task: str, error: Exception) -> None:
+        print(f"[ERROR] task failed, continuing with the batch: {task!r}: {error}")
+        self.failures.append((task, str(error)))
+
+    @staticmethod
+    def _save_results(results: List[tuple[str, str, int]], ofile: str | None) -> None:
         # if no output file, print to console
         if not ofile:
             print(results)
-        
+
         # else, save to the specified file
         else:
             with open(ofile, "w", encoding="utf-8") as f:
@@ -223,6 +681,78 @@ class Inference:
                     record = {"task": task, "command": cmd, "retry_times": retry_times}
                     f.write(json.dumps(record, ensure_ascii=False) + "\n")
             print(f"Saved {len(results)} records to {ofile}")
+
+    def gen_eval_commands(self, tasks: List[str],
+                          max_recompose: int | None = None,
+                          ofile: str|None = None) -> List[tuple[str, str, int]]:
+        """
+        Generate shell commands in batch for a list of NL tasks and optionally save the results to a file.
+        Args:
+            tasks (List[str]): A list of NL tasks to be processed.
+            max_recompose (int | None): Maximum number of recomposition attempts if the inspector does not pass.
+            ofile (str | None): Optional output file path to save the results in JSONL format.
+        Returns:
+            List[tuple[str, str, int]]: A list of tuples containing the NL task, generated shell command, and number of recomposition attempts.
+        """
+        from tqdm import tqdm
+
+        results: List[tuple[str, str, int]] = []    # structure: (task, command, retry_times)
+
+        # to avoid race condition, we run sequentially here. see agen_eval_commands for the concurrent version.
+        for task in tqdm(tasks, desc="Evaluating tasks", unit="task"):
+            try:
+                res = self.run_single(task, max_recompose)
+            except Exception as e:
+                # one failing task must not abort the batch
+                self._fail(task, e)
+                res = ""
+            cmd, retry_times = res if res else ("", 0)
+            results.append((task, cmd, retry_times))
+
+        self._save_results(results, ofile)
+        self._print_summary()
+        return results
+
+    async def agen_eval_commands(self, tasks: List[str],
+                                 max_recompose: int | None = None,
+                                 ofile: str | None = None,
+                                 max_concurrency: int = 8) -> List[tuple[str, str, int]]:
+        """
+        Async version of gen_eval_commands. Up to `max_concurrency` task contexts move through the scheduler at once.
+        Each task owns its own context, so there is no shared state between them.
+        Args:
+            tasks (List[str]): A list of NL tasks to be processed.
+            max_recompose (int | None): Maximum number of recomposition attempts if the inspector does not pass.
+            ofile (str | None): Optional output file path to save the results in JSONL format.
+            max_concurrency (int): Maximum number of tasks in flight at the same time.
+        Returns:
+            List[tuple[str, str, int]]: A list of tuples containing the NL task, generated shell command, and number of recomposition attempts.
+                The order is the same as the input order.
+        """
+        from tqdm import tqdm
+
+        sem = asyncio.Semaphore(max_concurrency)
+        pbar = tqdm(total=len(tasks), desc=f"Evaluating tasks (concurrency={max_concurrency})", unit="task")
+
+        async def _run(task: str) -> tuple[str, str, int]:
+            async with sem:
+                try:
+                    res = await self.arun_single(task, max_recompose)
+                except Exception as e:
+                    self._fail(task, e)
+                    res = ""
+            pbar.update(1)
+            cmd, retry_times = res if res else ("", 0)
+            return task, cmd, retry_times
+
+        # gather keeps the input order, no matter which task finishes first.
+        try:
+            results = list(await asyncio.gather(*(_run(task) for task in tasks)))
+        finally:
+            pbar.close()
+
+        self._save_results(results, ofile)
+        self._print_summary()
         return results
 
 
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, List
+
+from nl2sh.evaluator.evaluator import Evaluator
+from nl2sh.evaluator.rate_control import AIMDLimiter, RateBudget
+from nl2sh.inference import Inference, iter_evaluation_nl
+
+"""
+Streaming generate-and-judge pipeline for eval sweeps.
+The batch flow reads the whole task file, runs every task, writes the commands, and only then judges the file in a
+second pass. Here the two phases overlap: tasks are read lazily, every finished (task, command) pair goes straight
+into the judge pool while other tasks are still being composed, and both output files are appended one record at a
+time. The queues between the stages are bounded, so memory does not grow with the input size, and a slow judge
+pool holds back the composers instead of piling up results.
+    tasks --> [todo queue] --> max_concurrency x arun_single --> gen file
+                                                   |
+                                             [judge queue] --> judge_workers x Evaluator --> eval file
+Records are written in completion order and keep their input index ("idx" in the gen file, as in nl2sh.sharding,
+and "index" in the eval file, as in Evaluator.eval_batch); `python -m nl2sh.sharding merge gen.jsonl --input FILE
+--out ...` writes the commands in input order.
+    python -m nl2sh.pipeline --input nl2sh/data/nl2bash_eval_50.jsonl \
+        --gen-out gened_files/base_o.jsonl --eval-out gened_files/base_eval.jsonl
+"""
+
+
+def _append(f: IO[str], record: Dict[str, Any]) -> None:
+    # one line per record, flushed, so a crash only loses the records in flight
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    f.flush()
+
+
+async def run_pipeline(
+        inference: Inference,
+        evaluator: Evaluator,
+        tasks: Iterable[str],
+        gen_file: str | Path,
+        eval_file: str | Path,
+        max_recompose: int | None = None,
+        max_concurrency: int = 8,
+        judge_workers: int = 5,
+        pack_size: int = 1,
+        queue_size: int | None = None,
+        rpm: int | None = None,
+        tpm: int | None = None,
+        deadline_s: float | None = None,
+) -> Dict[str, Any]:
+    """
+    Generate commands for `tasks` and judge them in one overlapped pass.
+    Args:
+        inference (Inference): The pipeline that generates the commands.
+        evaluator (Evaluator): The judge.
+        tasks (Iterable[str]): The NL tasks, e.g. iter_evaluation_nl(path). Consumed lazily.
+        gen_file (str | Path): Output of the generated commands: {"idx", "task", "command", "retry_times"} records.
+        eval_file (str | Path): Output of the judgments: {"index", "task", "command", "score"} records.
+        max_recompose (int | None): Maximum number of recomposition attempts if the inspector does not pass.
+        max_concurrency (int): Maximum number of tasks being generated at the same time.
+        judge_workers (int): Number of judging threads.
+        pack_size (int): Up to this many waiting pairs are judged per request (see Evaluator.eval_batch). Packs are
+            only filled from pairs that are already waiting, a judge never holds a pair back to fill a pack.
+        queue_size (int | None): Capacity of each queue between the stages, by default twice the width of the
+            stage behind it.
+        rpm (int | None), tpm (int | None): Rate budget of the judging requests.
+        deadline_s (float | None): Wall-clock budget of each task (see Inference.arun_single).
+    Returns:
+        Dict[str, Any]: tasks, judged, failed (judgments that got -1), skipped (pairs without a command, which are
+            not judged, like in Evaluator.eval_from_file), avg_score and elapsed_s.
+    """
+    from tqdm.auto import tqdm
+
+    todo: asyncio.Queue = asyncio.Queue(maxsize=queue_size or 2 * max_concurrency)
+    to_judge: asyncio.Queue = asyncio.Queue(maxsize=queue_size or 2 * judge_workers * max(1, pack_size))
+    stats = {"tasks": 0, "judged": 0, "failed": 0, "skipped": 0, "total_score": 0.0}
+    total = len(tasks) if hasattr(tasks, "__len__") else None
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+
+    # same rate control as eval_batch, with a fixed concurrency: the pool size is the limit
+    limiter = AIMDLimiter(judge_workers, min_limit=judge_workers, max_limit=judge_workers)
+    budget = RateBudget(rpm=rpm, tpm=tpm)
+    pool = ThreadPoolExecutor(max_workers=judge_workers)
+
+    with open(gen_file, "w", encoding="utf-8") as gen_f, open(eval_file, "w", encoding="utf-8") as eval_f, \
+            tqdm(total=total, desc=f"Generating (concurrency={max_concurrency})", unit="task", position=0) as gen_bar, \
+            tqdm(total=total, desc=f"Judging (workers={judge_workers})", unit="case", position=1) as judge_bar:
+
+        async def _feed() -> None:
+            for idx, task in enumerate(tasks):
+                await todo.put((idx, task))
+            for _ in range(max_concurrency):
+                await todo.put(None)
+
+        async def _generate() -> None:
+            while (item := await todo.get()) is not None:
+                idx, task = item
+                try:
+                    res = await inference.arun_single(task, max_recompose, deadline_s=deadline_s)
+                except Exception as e:
+                    # one failing task must not abort the sweep
+                    inference._fail(task, e)
+                    res = ""
+                cmd, retry_times = res if res else ("", 0)
+                _append(gen_f, {"idx": idx, "task": task, "command": cmd, "retry_times": retry_times})
+                stats["tasks"] += 1
+                gen_bar.update(1)
+                if cmd:
+                    # blocks while the judges are behind: back pressure instead of a growing backlog
+                    await to_judge.put((idx, task, cmd))
+                else:
+                    stats["skipped"] += 1
+                    judge_bar.update(1)
+
+        async def _judge() -> None:
+            finished = False
+            while not finished and (item := await to_judge.get()) is not None:
+                unit = [item]
+                while len(unit) < pack_size and not to_judge.empty():
+                    nxt = to_judge.get_nowait()
+                    if nxt is None:
+                        finished = True
+                        break
+                    unit.append(nxt)
+                scores = await loop.run_in_executor(pool, evaluator._judge_unit, unit, True, limiter, budget)
+                for idx, task, cmd in unit:
+                    score = scores.get(idx, -1)
+                    _append(eval_f, {"index": idx, "task": task, "command": cmd, "score": score})
+                    if score >= 0:
+                        stats["judged"] += 1
+                        stats["total_score"] += score
+                    else:
+                        stats["failed"] += 1
+                judge_bar.update(len(unit))
+
+        feeder = asyncio.create_task(_feed())
+        generators = [asyncio.create_task(_generate()) for _ in range(max_concurrency)]
+        judges = [asyncio.create_task(_judge()) for _ in range(judge_workers)]
+        try:
+            await asyncio.gather(feeder, *generators)
+            for _ in judges:
+                await to_judge.put(None)
+            await asyncio.gather(*judges)
+        finally:
+            # on Ctrl-C or an error, stop all stages; the records written so far stay in both files
+            for t in (feeder, *generators, *judges):
+                t.cancel()
+            await asyncio.gather(feeder, *generators, *judges, return_exceptions=True)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.monotonic() - start
+    avg_score = stats["total_score"] / stats["judged"] if stats["judged"] else 0.0
+    print(f"Generated {stats['tasks']} commands and judged {stats['judged'] + stats['failed']} in {elapsed:.1f}s "
+          f"({stats['tasks'] / max(elapsed, 1e-9) * 60:.0f} tasks/min), failed judgments: {stats['failed']}, "
+          f"not judged (no command): {stats['skipped']}")
+    print(f"total score: {stats['total_score']}, avg_score = {avg_score}")
+    print(f"Saved commands to {gen_file} and judgments to {eval_file}")
+    inference._print_summary()
+    return {"tasks": stats["tasks"], "judged": stats["judged"], "failed": stats["failed"],
+            "skipped": stats["skipped"], "avg_score": avg_score, "elapsed_s": elapsed}
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate and judge commands in one overlapped pass")
+    parser.add_argument("--input", default="nl2sh/data/nl2bash_eval_50.jsonl")
+    parser.add_argument("--gen-out", required=True, help="JSONL file of the generated commands")
+    parser.add_argument("--eval-out", required=True, help="JSONL file of the judgments")
+    parser.add_argument("--max-recompose", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8, help="tasks generated at the same time")
+    parser.add_argument("--judge-workers", type=int, default=5)
+    parser.add_argument("--pack-size", type=int, default=1)
+    parser.add_argument("--judge-model", default="gpt-5.1")
+    parser.add_argument("--rpm", type=int, default=None)
+    parser.add_argument("--tpm", type=int, default=None)
+    parser.add_argument("--deadline", type=float, default=None, help="seconds per task")
+    parser.add_argument("--use-finetune", action="store_true")
+    parser.add_argument("--pre-inspect", action="store_true")
+    parser.add_argument("--cascade", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--sandbox", action="store_true",
+                        help="run the commands on a fixture file system: in the FSM before the inspector, and in "
+                             "the judge, where broken commands and matches of a reference score without a request")
+    parser.add_argument("--references", default=None,
+                        help="JSONL file of reference commands for the sandbox score, e.g. nl2bash_validation_50.jsonl")
+    args = parser.parse_args(argv)
+
+    inference = Inference(use_finetune=args.use_finetune, pre_inspect=args.pre_inspect, cascade=args.cascade,
+                          stream=args.stream, sandbox=args.sandbox)
+    evaluator = Evaluator(args.judge_model)
+    if args.sandbox:
+        evaluator.sandbox = inference.sandbox_inspector.sandbox
+        evaluator.references = Evaluator.load_references(args.references) if args.references else {}
+    asyncio.run(run_pipeline(
+        inference, evaluator, iter_evaluation_nl(args.input), args.gen_out, args.eval_out,
+        max_recompose=args.max_recompose, max_concurrency=args.concurrency, judge_workers=args.judge_workers,
+        pack_size=args.pack_size, rpm=args.rpm, tpm=args.tpm, deadline_s=args.deadline,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -16,4 +16,26 @@ Scoring Rules (follow in order of priority):
 3. If the command is syntactically correct and achieves the goal: score based on quality (readability, efficiency, conciseness, etc.) from 6 to 10 points.
 
 You MUST only return a numerical score between 0 and 10. Do NOT include any other information, explanations, or text.
-"""
\ No newline at end of file
+"""
+
+eval_packed_prompt = """You are a professional bash command evaluator and judge. Your task is to score each provided bash command based on its natural language task description, following strict scoring rules.
+
+Scoring Rules (follow in order of priority):
+1. If the command has a syntax error: score ≤ 3 points.
+2. If the command is syntactically correct but cannot achieve the task goal: score ≤ 5 points.
+3. If the command is syntactically correct and achieves the goal: score based on quality (readability, efficiency, conciseness, etc.) from 6 to 10 points.
+
+Score every pair independently. Here are the task-command pairs:
+{{PAIRS}}
+
+You MUST only return a JSON object that maps every pair id to its numerical score between 0 and 10, e.g. {"1": 7, "2": 3}. Do NOT include any other information, explanations, or text.
+"""
+
+eval_pair_block = """<Pair id="{{PAIR_ID}}">
+<TaskDescription>
+{{TASK_DESCRIPTION}}
+</TaskDescription>
+<BashCommand>
+{{BASH_COMMAND}}
+</BashCommand>
+</Pair>"""
@@ -11,4 +11,37 @@ First, compare the user's command with the task goal to determine if the command
 If the command is correct, output only "CORRECT".
 If the command is incorrect, output "incorrect" followed by a **very** concise guide to correct it (do not provide the correct command directly).
 Incorrect output format: "INCORRECT: <your guide here>"
-"""
\ No newline at end of file
+"""
+
+# used by the cheap first stage of CascadeInspector: same judgment, plus a self-reported confidence.
+cascade_inspector_pmt = """You are a professional bash command evaluator. Your task is to judge whether a user-composed bash command correctly achieves the goal described in a natural language task.
+Here is the task described in natural language:
+<Task_Description>
+{{TASK_DESCRIPTION}}
+</Task_Description>
+Here is the bash command composed by the user:
+<User_Command>
+{{USER_COMMAND}}
+</User_Command>
+First, compare the user's command with the task goal to determine if the command can correctly complete the task.
+If the command is correct, output "CORRECT" on the first line.
+If the command is incorrect, output "INCORRECT: <your guide here>" on the first line, with a **very** concise guide to correct it (do not provide the correct command directly).
+On the second line, output how confident you are in your judgment as a number between 0 and 1, in the format "CONFIDENCE: <number>".
+"""
+
+
+# used by BatchInspector: all candidates of a task are judged in one request.
+batch_inspector_pmt = """You are a professional bash command evaluator. Your task is to judge, for each of several candidate bash commands, whether it correctly achieves the goal described in a natural language task.
+Here is the task described in natural language:
+<Task_Description>
+{{TASK_DESCRIPTION}}
+</Task_Description>
+Here are the candidate commands:
+{{CANDIDATES}}
+Judge every candidate independently. For a correct candidate, its value is "CORRECT". For an incorrect one, its value is "INCORRECT: <guide>" with a **very** concise guide to correct it (do not provide the correct command directly).
+You MUST only return a JSON object that maps every candidate id to its judgment, e.g. {"1": "INCORRECT: quote the file name", "2": "CORRECT"}. Do NOT include any other information, explanations, or text.
+"""
+
+batch_candidate_block = """<Candidate id="{{CANDIDATE_ID}}">
+{{USER_COMMAND}}
+</Candidate>"""
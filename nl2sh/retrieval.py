@@ -0,0 +1,237 @@
+import json
+import re
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+"""
+Retrieval index over vetted (task, command) pairs, e.g. the fine-tune corpus.
+Tasks are embedded as TF-IDF vectors of character n-grams (3-5 characters of the padded words, hashed into a
+fixed number of buckets) and stored as an inverted index, so a lookup only touches the buckets of the query's
+n-grams: cosine scores for all pairs come from one bincount, and top-k from one argpartition. A lookup takes well
+under a millisecond for a few thousand pairs.
+The index is saved as plain .npy files plus the pairs, and loaded with memory mapping, so the daemon does not
+rebuild or copy it at startup.
+    index = RetrievalIndex.load_or_build("~/.cache/nl2sh/retrieval")
+    index.search("list all files sorted by size", k=3)
+"""
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+DEFAULT_CORPUS = (DATA_DIR / "nl2bash_finetune_1000.jsonl", DATA_DIR / "nl2bash_finetune_750.jsonl")
+
+_SPACES = re.compile(r"\s+")
+_ARRAYS = ("col_ptr", "col_rows", "col_vals", "idf")
+
+
+def load_pairs(paths: Iterable[str | Path]) -> List[Tuple[str, str]]:
+    """
+    Read (task, command) pairs from JSONL files, in the chat fine-tune format ({"messages": [..., user, assistant]})
+    or as {"task": ..., "command": ...} records (the output format of gen_eval_commands). Duplicates are dropped.
+    """
+    pairs, seen = [], set()
+    for path in paths:
+        with Path(path).expanduser().open("r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    obj = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"[WARN] {path}:{line_no}: JSON decode error: {e}")
+                    continue
+                if "messages" in obj:
+                    roles = {m.get("role"): m.get("content", "") for m in obj["messages"]}
+                    task, command = roles.get("user", ""), roles.get("assistant", "")
+                else:
+                    task, command = obj.get("task", ""), obj.get("command", "")
+                task, command = task.strip(), command.strip()
+                if task and command and (task, command) not in seen:
+                    seen.add((task, command))
+                    pairs.append((task, command))
+    return pairs
+
+
+def _ngrams(text: str, ngram_range: Tuple[int, int]) -> List[str]:
+    # character n-grams inside word boundaries, like sklearn's char_wb analyzer
+    grams = []
+    lo, hi = ngram_range
+    for word in _SPACES.sub(" ", text.casefold()).strip().split(" "):
+        word = f" {word} "
+        for n in range(lo, hi + 1):
+            grams.extend(word[i:i + n] for i in range(max(1, len(word) - n + 1)))
+    return grams
+
+
+def _features(text: str, ngram_range: Tuple[int, int], dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed n-gram counts of a text: (bucket ids, sublinear tf). crc32 is stable across processes, unlike hash().
+    """
+    buckets = np.fromiter((zlib.crc32(g.encode("utf-8")) % dim for g in _ngrams(text, ngram_range)), dtype=np.int64)
+    ids, counts = np.unique(buckets, return_counts=True)
+    return ids, 1.0 + np.log(counts)
+
+
+class RetrievalIndex:
+    """
+    Inverted TF-IDF index of (task, command) pairs.
+    Attributes:
+        pairs (List[Tuple[str, str]]): The indexed (task, command) pairs; row i of the index is pairs[i].
+        ngram_range (Tuple[int, int]): Character n-gram sizes.
+        dim (int): Number of hash buckets.
+        sources (Dict[str, Any]): The corpus files with their size and mtime, used by load_or_build to detect changes.
+    Methods:
+        build(pairs, ngram_range, dim) -> RetrievalIndex: Index the given pairs.
+        from_files(paths) -> RetrievalIndex: Index the pairs of JSONL files (the fine-tune corpus by default).
+        search(task: str, k: int = 5) -> List[Dict[str, Any]]: The k most similar pairs with their cosine score.
+        save(path), load(path, mmap) -> RetrievalIndex, load_or_build(path, paths) -> RetrievalIndex: Persistence.
+    """
+
+    def __init__(self, pairs: List[Tuple[str, str]], arrays: Dict[str, np.ndarray],
+                 ngram_range: Tuple[int, int] = (3, 5), dim: int = 2 ** 18,
+                 sources: Dict[str, Any] | None = None) -> None:
+        self.pairs = pairs
+        self.ngram_range = tuple(ngram_range)
+        self.dim = dim
+        self.sources = sources or {}
+        # CSC layout: the rows (pairs) and tf-idf values of bucket j are col_rows / col_vals[col_ptr[j]:col_ptr[j + 1]]
+        self.col_ptr = arrays["col_ptr"]
+        self.col_rows = arrays["col_rows"]
+        self.col_vals = arrays["col_vals"]
+        self.idf = arrays["idf"]
+
+    @classmethod
+    def build(cls, pairs: Sequence[Tuple[str, str]], ngram_range: Tuple[int, int] = (3, 5),
+              dim: int = 2 ** 18, sources: Dict[str, Any] | None = None) -> "RetrievalIndex":
+        pairs = list(pairs)
+        if not pairs:
+            raise ValueError("No pairs to index!")
+        feats = [_features(task, ngram_range, dim) for task, _ in pairs]
+        rows = np.concatenate([np.full(len(ids), i, dtype=np.int32) for i, (ids, _) in enumerate(feats)])
+        cols = np.concatenate([ids for ids, _ in feats])
+        tf = np.concatenate([tf for _, tf in feats])
+
+        # smoothed idf, as in sklearn
+        df = np.bincount(cols, minlength=dim)
+        idf = (np.log((1 + len(pairs)) / (1 + df)) + 1).astype(np.float32)
+        vals = tf * idf[cols]
+        # l2-normalize every row, so a dot product is the cosine similarity
+        norms = np.sqrt(np.bincount(rows, weights=vals ** 2, minlength=len(pairs)))
+        vals = (vals / norms[rows]).astype(np.float32)
+
+        order = np.argsort(cols, kind="stable")
+        arrays = {
+            "col_ptr": np.concatenate([[0], np.cumsum(df)]).astype(np.int64),
+            "col_rows": rows[order],
+            "col_vals": vals[order],
+            "idf": idf,
+        }
+        return cls(pairs, arrays, ngram_range, dim, sources)
+
+    @staticmethod
+    def _signature(paths: Iterable[str | Path]) -> Dict[str, Any]:
+        sig = {}
+        for p in paths:
+            st = Path(p).expanduser().stat()
+            sig[str(Path(p).expanduser().resolve())] = [st.st_size, st.st_mtime_ns]
+        return sig
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str | Path] = DEFAULT_CORPUS, **kwargs: Any) -> "RetrievalIndex":
+        paths = list(paths)
+        return cls.build(load_pairs(paths), sources=cls._signature(paths), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def scores(self, task: str) -> np.ndarray:
+        """
+        Cosine similarity of the task to every indexed pair.
+        """
+        ids, tf = _features(task, self.ngram_range, self.dim)
+        weights = tf * self.idf[ids]
+        norm = np.sqrt(np.dot(weights, weights))
+        if norm == 0:
+            return np.zeros(len(self.pairs), dtype=np.float32)
+        starts, ends = self.col_ptr[ids], self.col_ptr[ids + 1]
+        lens = ends - starts
+        # gather all postings of the query buckets without a python loop
+        offsets = np.repeat(starts - np.cumsum(lens) + lens, lens) + np.arange(lens.sum())
+        return np.bincount(self.col_rows[offsets], weights=self.col_vals[offsets] * np.repeat(weights / norm, lens),
+                           minlength=len(self.pairs))
+
+    def search(self, task: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            List[Dict[str, Any]]: Up to k {"task", "command", "score"} dicts, best first. Pairs with no common
+                n-gram are left out.
+        """
+        scores = self.scores(task)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{"task": self.pairs[i][0], "command": self.pairs[i][1], "score": float(scores[i])}
+                for i in top if scores[i] > 0]
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path).expanduser()
+        path.mkdir(parents=True, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        with (path / "pairs.jsonl").open("w", encoding="utf-8") as f:
+            for task, command in self.pairs:
+                f.write(json.dumps({"task": task, "command": command}, ensure_ascii=False) + "\n")
+        # written last: an index without meta.json is incomplete and gets rebuilt
+        meta = {"ngram_range": list(self.ngram_range), "dim": self.dim, "size": len(self.pairs),
+                "sources": self.sources, "created": time.time()}
+        (path / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str | Path, mmap: bool = True) -> "RetrievalIndex":
+        """
+        Load a saved index. With mmap=True the arrays are memory-mapped read-only, so loading is O(1) and several
+        processes share the pages.
+        """
+        path = Path(path).expanduser()
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None) for name in _ARRAYS}
+        pairs = load_pairs([path / "pairs.jsonl"])
+        if len(pairs) != meta["size"]:
+            raise ValueError(f"corrupt retrieval index at {path}: {len(pairs)} pairs, expected {meta['size']}")
+        return cls(pairs, arrays, tuple(meta["ngram_range"]), meta["dim"], meta["sources"])
+
+    @classmethod
+    def load_or_build(cls, path: str | Path, paths: Iterable[str | Path] = DEFAULT_CORPUS,
+                      **kwargs: Any) -> "RetrievalIndex":
+        """
+        Load the index saved at `path` if it was built from the same, unchanged corpus files; otherwise
+        build it and save it there.
+        """
+        paths = list(paths)
+        path = Path(path).expanduser()
+        if (path / "meta.json").exists():
+            try:
+                index = cls.load(path)
+                if index.sources == cls._signature(paths):
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[WARN] rebuilding the retrieval index at {path}: {e}")
+        index = cls.from_files(paths, **kwargs)
+        index.save(path)
+        return index
+
+
+if __name__ == "__main__":
+    index = RetrievalIndex.from_files()
+    query = "list all files in the current directory sorted by size"
+    start = time.perf_counter()
+    for _ in range(1000):
+        hits = index.search(query, k=3)
+    print(f"{len(index)} pairs, {(time.perf_counter() - start):.3f} ms per lookup")
+    for hit in hits:
+        print(f"{hit['score']:.3f}  {hit['task']}  ->  {hit['command']}")
@@ -0,0 +1,406 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+"""
+Execution-based verification of shell commands.
+Every run gets a fresh, throwaway fixture file system in a temp dir, shaped like the one the eval set was written
+for (setup_nl2b_fs_1.sh, /workspace, /system, /testbed, ${DIRECTORY}) plus /home, /tmp and /var/log, and the files
+and directories the task itself names. The fixture roots in the command are rewritten to the temp dir, and the command
+runs under bash with a timeout, resource limits (CPU, memory, file size, open files) and, where unprivileged user
+namespaces are available, no network, no capabilities and a read-only view of everything outside the fixture.
+The result holds the exit status, the output and the side effects (files created, deleted and modified in the
+fixture).
+    sandbox = Sandbox(timeout=5)
+    result = sandbox.run("count the lines in setup_nl2b_fs_1.sh", "wc -l setup_nl2b_fs_1.sh")
+    sandbox.failure(result)    # None, or why the command is broken
+Runs go through a process pool (run_many / submit), so many verifications execute in parallel.
+Without namespace isolation nothing is executed (the result is "skipped") unless allow_unisolated=True.
+Only failures that do not depend on the machine count as broken: a time-out, a syntax error and a usage error.
+A tool that is not installed here (exit 126 / 127), no network, or a path outside the fixture is not the command's
+fault, so such runs do not decide anything.
+"""
+
+# every other absolute path stays on the host, read-only
+FIXTURE_ROOTS = ("workspace", "system", "testbed", "home", "tmp", "var/log")
+# an absolute fixture path in a command, e.g. /workspace/dir1, but not /usr/workspace or $X/workspace
+_ROOT_PATH = re.compile(r"(?<![\w.~/$}-])/(" + "|".join(FIXTURE_ROOTS) + r")(?![\w.-])")
+# a fixture path named by a task: /testbed/dir1/file.txt, testbed/dir2, /system/folder3/temp
+_TASK_PATH = re.compile(r"(?<![\w.-])/?(?:" + "|".join(FIXTURE_ROOTS) + r")(?:/[\w.-]+)+")
+_SYNTAX_ERROR = re.compile(r"syntax error|unexpected (?:EOF|end of file|token)")
+_USAGE_ERROR = re.compile(r"(?:invalid|unrecognized|illegal|unknown) (?:option|argument|predicate|primary)"
+                          r"|missing (?:file )?operand|paths must precede expression|^usage:", re.IGNORECASE | re.M)
+
+_SETUP_SCRIPT = "\n".join([
+    "#!/bin/bash",
+    "# creates the test file system of the nl2bash tasks",
+    "set -e",
+    "mkdir -p /workspace/dir1 /workspace/dir2",
+    "mkdir -p /system/folder1 /system/folder2 /system/folder3/temp /system/folder3/backup_dbg",
+    "mkdir -p /testbed/dir1/subdir1 /testbed/dir2 /testbed/dir3/subdir1/subsubdir1",
+    "echo 'hello world' > /workspace/dir1/file1.txt",
+    "echo 'foo bar' > /workspace/dir2/file2.txt",
+    "seq 1 30 > /workspace/dir1/long.txt",
+    "touch /workspace/empty.txt",
+    "echo 'old file' > /workspace/dir1/old2.txt",
+    "echo 'keep me' > /system/folder1/keep.txt",
+    "echo 'log line' > /system/folder1/app.log",
+    "echo 'SELECT 1;' > /system/folder3/backup_dbg/old.sql",
+    "printf 'line %s\\n' 1 2 3 > /testbed/dir3/subdir1/subsubdir1/textfile3.txt",
+    "echo 'print(1)' > /testbed/dir1/subdir1/script.py",
+    "echo 'a b c' > /testbed/dir2/small.txt",
+    "echo 'done'",
+]) + "\n"
+
+# relative path -> content, None for a directory. Files are 2 hours old unless listed in _OLD.
+_FIXTURE: Dict[str, str | None] = {
+    "home/.bash_profile": "export PATH=$HOME/bin:$PATH\n",
+    "home/.bashrc": "alias ll='ls -l'\n",
+    "home/newlinks": None,
+    "tmp/session.txt": "session 42\n",
+    "tmp/build.log": "build ok\n",
+    "tmp/cache/old.tmp": "stale\n",
+    "var/log/syslog": "Jan  1 00:00:00 host kernel: boot\nJan  1 00:00:01 host sshd: started\n",
+    "var/log/app.log": "INFO start\nERROR failed to connect\nINFO retry\n",
+    "var/log/old.log.1": "rotated\n",
+    "workspace/dir1/file1.txt": "hello world\n",
+    "workspace/dir1/long.txt": "".join(f"line {i}\n" for i in range(1, 31)),
+    "workspace/dir1/old2.txt": "old file\n",
+    "workspace/dir1/.hidden1": "hidden\n",
+    "workspace/dir2/file1.txt": "hello world\n",
+    "workspace/dir2/file2.txt": "foo bar\nhello again\n",
+    "workspace/results.txt": "dir1/file1.txt\ndir2/file2.txt\n",
+    "workspace/empty.txt": "",
+    "workspace/.hidden2": "",
+    "workspace/notes.md": "# notes\nfoo\n",
+    "system/text1.txt": "Text one\nwith two lines\n",
+    "system/folder1/a.txt": "alpha\n",
+    "system/folder1/keep.txt": "keep me\n",
+    "system/folder1/app.log": "log line\n",
+    "system/folder1/sub/b.txt": "beta\n",
+    "system/folder1/sub/c.log": "sub log\n",
+    "system/folder2/foo.txt": "foo\nbar foo\n",
+    "system/folder2/tiny.dat": "x",
+    "system/folder3/temp/.DS_Store": "ds",
+    "system/folder3/temp/._junk": "junk",
+    "system/folder3/temp/note.txt": "temp note\n",
+    "system/folder3/backup_dbg/old.sql": "SELECT 1;\n",
+    "system/folder3/backup_dbg/new.sql": "SELECT 2;\n",
+    "testbed/hello.txt": "hello\n",
+    "testbed/dir1/subdir1/script.py": "print(1)\n",
+    "testbed/dir1/subdir1/util.py": "def f():\n    return 2\n",
+    "testbed/dir1/notes.txt": "one two three four five six seven\n",
+    "testbed/dir2/small.txt": "a b c\n",
+    "testbed/dir2/big.txt": "".join(f"word{i} " for i in range(200)) + "\n",
+    "testbed/dir3/subdir1/subsubdir1/textfile3.txt": "".join(f"text line {i}\n" for i in range(1, 21)),
+}
+_OLD = {"workspace/dir1/old2.txt", "system/folder1/a.txt", "system/folder1/app.log",
+        "system/folder3/backup_dbg/old.sql", "system/folder3/temp/._junk", "tmp/cache/old.tmp", "var/log/old.log.1"}
+
+# run inside the new mount namespace: keep the fixture writable, make every other mount read-only, and check that
+# this worked (the parent of the fixture must not be writable) before running the command. The command itself runs
+# without any capability: root of the user namespace keeps CAP_SYS_ADMIN, which would let it remount / read-write.
+_PREAMBLE = r"""
+mount --bind "$1" "$1" 2>/dev/null || exit 125
+awk '{print $2}' /proc/self/mounts | while read -r m; do
+    m=$(printf '%b' "$m")
+    [ "$m" = "$1" ] || mount -o remount,bind,ro "$m" 2>/dev/null
+done
+if (: > "$1/../.escape") 2>/dev/null; then exit 125; fi
+cd "$1" && exec setpriv --no-new-privs --inh-caps=-all --bounding-set=-all -- bash --noprofile --norc -c "$2" bash
+"""
+_ISOLATION_FAILED = 125
+
+_isolation_lock = threading.Lock()
+_isolation: bool | None = None
+
+
+def isolation_available() -> bool:
+    """
+    Whether commands can run in an unprivileged user + mount + network namespace and drop their capabilities there
+    (util-linux unshare and setpriv).
+    """
+    global _isolation
+    with _isolation_lock:
+        if _isolation is None:
+            try:
+                _isolation = all(shutil.which(tool) for tool in ("unshare", "setpriv")) and subprocess.run(
+                    ["unshare", "-rnm", "--propagation", "private",
+                     "setpriv", "--inh-caps=-all", "--bounding-set=-all", "--", "true"],
+                    capture_output=True, timeout=10).returncode == 0
+            except (OSError, subprocess.TimeoutExpired):
+                _isolation = False
+        return _isolation
+
+
+def build_fixture(root: Path, task: str = "") -> None:
+    """
+    Materialize the fixture file system under `root`, plus every fixture path the task names (a name with a
+    suffix becomes a small text file, anything else a directory).
+    """
+    now = time.time()
+    (root / "setup_nl2b_fs_1.sh").write_text(_SETUP_SCRIPT, encoding="utf-8")
+    for rel, content in _FIXTURE.items():
+        path = root / rel
+        if content is None:
+            path.mkdir(parents=True, exist_ok=True)
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+        age = 40 * 86400 if rel in _OLD else 2 * 3600
+        os.utime(path, (now - age, now - age))
+
+    for match in _TASK_PATH.findall(task):
+        path = root / match.lstrip("/").rstrip(".")
+        if not path.resolve().is_relative_to(root.resolve()) or path.exists():
+            continue
+        if path.suffix:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f"sample content of {path.name}\nsecond line\n", encoding="utf-8")
+        else:
+            path.mkdir(parents=True, exist_ok=True)
+            (path / "sample.txt").write_text("sample\n", encoding="utf-8")
+
+
+def snapshot(root: Path) -> Dict[str, Tuple[str, int, str]]:
+    """
+    (kind, mode, content digest) of everything under root. Used to find the side effects of a run.
+    """
+    state = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.normpath(os.path.join(rel_dir, name))
+            st = os.lstat(path)
+            if os.path.islink(path):
+                state[rel] = ("link", 0, os.readlink(path))
+            elif os.path.isdir(path):
+                state[rel] = ("dir", st.st_mode & 0o7777, "")
+            else:
+                try:
+                    with open(path, "rb") as f:
+                        digest = hashlib.sha1(f.read(1 << 20)).hexdigest()
+                except OSError:
+                    digest = "?"
+                state[rel] = ("file", st.st_mode & 0o7777, f"{st.st_size}:{digest}")
+        # do not follow symlinked directories, e.g. a link to /
+        dirnames[:] = [d for d in dirnames if not os.path.islink(os.path.join(dirpath, d))]
+    return state
+
+
+class Sandbox:
+    """
+    Runs shell commands on throwaway fixture file systems.
+    Attributes:
+        timeout (float): Wall-clock limit of a run in seconds; the whole process group is killed after it.
+        memory_mb (int), max_file_mb (int), max_files (int): Address space, file size and open file limits.
+        max_output (int): Bytes of stdout / stderr kept in the result.
+        workers (int | None): Size of the process pool of run_many / submit (CPU count by default).
+        allow_unisolated (bool): Run commands even without namespace isolation (network and host file system
+            reachable). Only for trusted commands.
+        isolated (bool): Whether runs are isolated.
+    Methods:
+        run(task, command) -> Dict[str, Any]: Run one command in this process.
+        submit(task, command) -> Future, run_many(items) -> List[Dict[str, Any]]: Run through the process pool.
+        failure(result) -> str | None: Why a run shows that the command is broken (time-out, syntax or usage error),
+            None if it does not, including failures that depend on this host.
+        clean(result) -> bool: The command ran without an error and produced output or side effects.
+        equivalent(result, reference) -> bool: Two runs (e.g. of a command and of a reference command) have the
+            same output and the same side effects.
+        close(): Shut the process pool down.
+    """
+
+    def __init__(self, timeout: float = 5.0, memory_mb: int = 1024, max_file_mb: int = 16, max_files: int = 256,
+                 max_output: int = 64 * 1024, workers: int | None = None, allow_unisolated: bool = False) -> None:
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_file_mb = max_file_mb
+        self.max_files = max_files
+        self.max_output = max_output
+        self.workers = workers
+        self.allow_unisolated = allow_unisolated
+        self.isolated = isolation_available()
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # sent to the pool workers without the pool itself
+        state = dict(self.__dict__)
+        state["_pool"], state["_lock"] = None, None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _limits(self) -> None:
+        # runs in the child between fork and exec
+        cpu = int(self.timeout) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+        resource.setrlimit(resource.RLIMIT_AS, (self.memory_mb << 20, self.memory_mb << 20))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (self.max_file_mb << 20, self.max_file_mb << 20))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (self.max_files, self.max_files))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+    def _read(self, path: Path, root: Path) -> str:
+        with path.open("rb") as f:
+            text = f.read(self.max_output).decode("utf-8", errors="replace")
+        # show the paths the way the command wrote them
+        return text.replace(str(root), "")
+
+    def run(self, task: str, command: str) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: command, skipped (the reason, or None), exit_code (negative for a signal), timed_out,
+                stdout, stderr, created / deleted / modified (fixture paths), effects (what the created and
+                modified paths contain) and elapsed_s.
+        """
+        result = {"command": command, "skipped": None, "exit_code": None, "timed_out": False, "stdout": "",
+                  "stderr": "", "created": [], "deleted": [], "modified": [], "effects": {}, "elapsed_s": 0.0}
+        if not command.strip():
+            result["skipped"] = "empty command"
+            return result
+        if not self.isolated and not self.allow_unisolated:
+            result["skipped"] = "no namespace isolation on this host"
+            return result
+
+        with tempfile.TemporaryDirectory(prefix="nl2sh-sandbox-", ignore_cleanup_errors=True) as base:
+            base = Path(base)
+            root = base / "fs"
+            root.mkdir()
+            build_fixture(root, task)
+            before = snapshot(root)
+            script = _ROOT_PATH.sub(lambda m: f"{root}/{m.group(1)}", command)
+
+            env = {
+                "PATH": os.environ.get("PATH", "/usr/bin:/bin"), "HOME": str(root / "home"),
+                "TMPDIR": str(root / "tmp"), "LANG": "C.UTF-8", "LC_ALL": "C.UTF-8", "TZ": "UTC",
+                "USER": "user", "SHELL": "/bin/bash", "TERM": "dumb",
+                "DIRECTORY": str(root / "testbed"),
+                "FILES": f"{root}/testbed/dir2/small.txt {root}/testbed/dir2/big.txt",
+            }
+            if self.isolated:
+                argv = ["unshare", "-rnm", "--propagation", "private", "sh", "-c", _PREAMBLE, "sh", str(root), script]
+            else:
+                argv = ["bash", "--noprofile", "--norc", "-c", script]
+
+            start = time.monotonic()
+            with (base / "stdout").open("wb") as out, (base / "stderr").open("wb") as err:
+                proc = subprocess.Popen(argv, cwd=root, env=env, stdin=subprocess.DEVNULL, stdout=out, stderr=err,
+                                        start_new_session=True, preexec_fn=self._limits)
+                try:
+                    result["exit_code"] = proc.wait(timeout=self.timeout)
+                except subprocess.TimeoutExpired:
+                    result["timed_out"] = True
+                    os.killpg(proc.pid, signal.SIGKILL)
+                    result["exit_code"] = proc.wait()
+            result["elapsed_s"] = time.monotonic() - start
+
+            if result["exit_code"] == _ISOLATION_FAILED and self.isolated and not result["timed_out"]:
+                err = self._read(base / "stderr", root)
+                if not err.strip():
+                    # the preamble refused to run the command
+                    result["skipped"] = "could not make the host file system read-only"
+                    return result
+            result["stdout"] = self._read(base / "stdout", root)
+            result["stderr"] = self._read(base / "stderr", root)
+
+            after = snapshot(root)
+            result["created"] = sorted(set(after) - set(before))
+            result["deleted"] = sorted(set(before) - set(after))
+            result["modified"] = sorted(p for p in set(before) & set(after) if before[p] != after[p])
+            result["effects"] = {p: after[p] for p in result["created"] + result["modified"]}
+            # a read-only fixture left behind (e.g. chmod -R a-w) must not stop the cleanup
+            for dirpath, dirnames, _ in os.walk(root):
+                for d in dirnames:
+                    path = os.path.join(dirpath, d)
+                    if not os.path.islink(path):
+                        os.chmod(path, 0o700)
+        return result
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: the callers are threaded (event loop, judge pools), so do not fork them
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def submit(self, task: str, command: str) -> Future:
+        return self._executor().submit(self.run, task, command)
+
+    def run_many(self, items: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Run (task, command) pairs in parallel on the process pool. The results keep the input order.
+        """
+        futures = [self.submit(task, command) for task, command in items]
+        return [f.result() for f in futures]
+
+    @staticmethod
+    def failure(result: Dict[str, Any]) -> str | None:
+        if result["skipped"]:
+            return None
+        err = result["stderr"].strip()
+        first = err.splitlines()[0] if err else ""
+        code = result["exit_code"]
+        # the CPU limit is the time limit
+        if result["timed_out"] or code in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+            return "it did not finish within the time limit; it must not wait for input or run forever"
+        if code in (126, 127):
+            # not installed or not executable on this host, which says nothing about the command
+            return None
+        if code and _SYNTAX_ERROR.search(err):
+            return f"bash reported a syntax error: {first}"
+        if code and _USAGE_ERROR.search(err):
+            return f"a command was called with wrong options or arguments: {first}"
+        return None
+
+    @staticmethod
+    def clean(result: Dict[str, Any]) -> bool:
+        return (not result["skipped"] and result["exit_code"] == 0 and not result["stderr"].strip()
+                and bool(result["stdout"].strip() or result["created"] or result["deleted"] or result["modified"]))
+
+    @staticmethod
+    def equivalent(result: Dict[str, Any], reference: Dict[str, Any]) -> bool:
+        if result["skipped"] or reference["skipped"] or result["timed_out"] or reference["timed_out"]:
+            return False
+        if (result["exit_code"] == 0) != (reference["exit_code"] == 0):
+            return False
+        out, ref = result["stdout"].strip(), reference["stdout"].strip()
+        # the order of find / ls -U and the spacing of columns do not matter
+        same_output = (out == ref or sorted(out.splitlines()) == sorted(ref.splitlines())
+                       or out.split() == ref.split())
+        return (same_output and result["deleted"] == reference["deleted"]
+                and result.get("effects") == reference.get("effects"))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+if __name__ == "__main__":
+    sandbox = Sandbox()
+    print(f"isolated: {sandbox.isolated}")
+    for task, cmd in [("display the first 5 lines of the setup_nl2b_fs_1.sh file", "head -n 5 setup_nl2b_fs_1.sh"),
+                      ("Remove all *.log files from the /system/folder1 tree", "find /system/folder1 -name '*.log' -delete"),
+                      ("print the kernel version", "uname -r"),
+                      ("count files", "find /testbed -type f | wc -l --bogus"),
+                      ("wait", "sleep 30"),
+                      ("escape", "touch /root/escaped; echo $?")]:
+        res = sandbox.run(task, cmd)
+        print(f"{cmd!r}: exit={res['exit_code']} failure={sandbox.failure(res)} clean={sandbox.clean(res)} "
+              f"created={res['created']} deleted={res['deleted']} out={res['stdout'][:60]!r} err={res['stderr'][:60]!r}")
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List
+
+from nl2sh import deadline
+from nl2sh.inference import DONE, NOT_PASS, Inference
+
+
+class StageScheduler:
+    """
+    Continuous, stage-batched scheduler for many FSM contexts.
+    Instead of moving one context through `Inference.sched` at a time, it keeps a pool of in-flight contexts,
+    groups them by their current state, and dispatches the agent of every state for all of its waiting contexts at
+    once. New tasks join the pool as soon as others reach DONE or run out of recompose attempts, so the clarifier,
+    composer and inspector endpoints are all busy at the same time.
+    Attributes:
+        inference (Inference): The pipeline whose agents and `sched` are used.
+        max_in_flight (int): Maximum number of contexts in the pool.
+        agent_limits (Dict[str, int]): Maximum number of concurrent calls per agent name, e.g. {"inspector": 8}.
+        stats (Dict[str, Dict[str, int]]): Per agent, the number of calls and the peak number of concurrent calls.
+    Methods:
+        run(tasks: Iterable[str], max_recompose: int | None = None, deadline_s: float | None = None) -> List[tuple[str, str, int]]:
+            Runs all tasks, returns (task, command, retry_times) in input order. A task that fails is recorded in
+            inference.failures with an empty command; a task past its deadline (inference.deadline_s by default,
+            counted from its admission to the pool) leaves the pool in TIMED_OUT with its best command so far.
+        gen_eval_commands(tasks, max_recompose, ofile) -> List[tuple[str, str, int]]:
+            Synchronous wrapper with the same signature and output file as Inference.gen_eval_commands.
+    Note:
+        The scheduler runs the plain FSM; the per-task speculative mode of Inference is not used here.
+    """
+
+    def __init__(self, inference: Inference, max_in_flight: int = 64,
+                 agent_limits: Dict[str, int] | None = None) -> None:
+        self.inference = inference
+        self.max_in_flight = max_in_flight
+        self.agent_limits = agent_limits or {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+        self._active: Dict[str, int] = {}
+
+    async def _step(self, agent: Any, context: Dict[str, Any], recompose_cnt: int,
+                    until: float | None = None) -> Dict[str, Any]:
+        name = agent.name
+        sem = self._sems.get(name)
+        if sem is None and name in self.agent_limits:
+            sem = self._sems[name] = asyncio.Semaphore(self.agent_limits[name])
+
+        async def _call() -> Dict[str, Any]:
+            stat = self.stats.setdefault(name, {"calls": 0, "peak_concurrency": 0})
+            self._active[name] = self._active.get(name, 0) + 1
+            stat["calls"] += 1
+            stat["peak_concurrency"] = max(stat["peak_concurrency"], self._active[name])
+            try:
+                # through Inference, so the call is traced when the pipeline has a tracer
+                return await asyncio.wait_for(self.inference._aexec(agent, context, recompose_cnt),
+                                              deadline.remaining())
+            finally:
+                self._active[name] -= 1
+
+        # the deadline scope is per asyncio task, so every context keeps its own request timeouts
+        with deadline.scope(until):
+            if sem is None:
+                return await _call()
+            async with sem:
+                return await _call()
+
+    async def run(self, tasks: Iterable[str], max_recompose: int | None = None,
+                  deadline_s: float | None = None) -> List[tuple[str, str, int]]:
+        from tqdm import tqdm
+
+        if deadline_s is None:
+            deadline_s = self.inference.deadline_s
+        tasks = list(tasks)
+        results: List[tuple[str, str, int] | None] = [None] * len(tasks)
+        pending = iter(enumerate(tasks))
+
+        # idx -> [context, recompose_cnt, deadline]
+        in_flight: Dict[int, List[Any]] = {}
+        # state -> contexts waiting for the agent of that state
+        ready: Dict[str, Deque[int]] = {}
+        # asyncio task -> idx
+        running: Dict[asyncio.Task, int] = {}
+        pbar = tqdm(total=len(tasks), desc=f"Evaluating tasks (in flight<={self.max_in_flight})", unit="task")
+
+        def finish(idx: int, failed: bool = False) -> None:
+            context, recompose_cnt, _ = in_flight.pop(idx)
+            cmd = context["composer_history"][-1] if context["composer_history"] and not failed else ""
+            results[idx] = (context["usr_input"], cmd, recompose_cnt)
+            pbar.update(1)
+
+        try:
+            while True:
+                # 1. admit new contexts into the pool
+                while len(in_flight) < self.max_in_flight:
+                    nxt = next(pending, None)
+                    if nxt is None:
+                        break
+                    idx, task = nxt
+                    context = self.inference._init_context(task)
+                    in_flight[idx] = [context, 0, deadline.after(deadline_s)]
+                    if self.inference.retriever is not None:
+                        # local and sub-millisecond, so it runs inline at admission
+                        context = self.inference._exec(self.inference.retriever, context)
+                        if context["state"] == DONE:
+                            finish(idx)
+                            continue
+                    ready.setdefault(context["state"], deque()).append(idx)
+
+                # 2. dispatch every waiting context, grouped by state
+                for state, queue in ready.items():
+                    while queue:
+                        idx = queue.popleft()
+                        entry = in_flight[idx]
+                        if entry[2] is not None and entry[2] <= time.monotonic():
+                            self.inference._time_out(entry[0])
+                            finish(idx)
+                            continue
+                        if state == NOT_PASS and max_recompose is not None:
+                            if entry[1] >= max_recompose:
+                                # out of recompose attempts, leave the pool
+                                finish(idx)
+                                continue
+                            entry[1] += 1
+                        agent = self.inference.sched[state]
+                        running[asyncio.create_task(self._step(agent, entry[0], entry[1], entry[2]))] = idx
+
+                if not running:
+                    break
+
+                # 3. wait for any agent call to return, and route the contexts to their next state
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    idx = running.pop(fut)
+                    entry = in_flight[idx]
+                    try:
+                        context = fut.result()
+                    except Exception as e:
+                        if entry[2] is not None and entry[2] <= time.monotonic():
+                            self.inference._time_out(entry[0])
+                            finish(idx)
+                        else:
+                            # one failing task leaves the pool, the others go on
+                            self.inference._fail(entry[0]["usr_input"], e)
+                            finish(idx, failed=True)
+                        continue
+                    entry[0] = context
+                    if context["state"] == DONE:
+                        finish(idx)
+                    else:
+                        ready.setdefault(context["state"], deque()).append(idx)
+        finally:
+            for fut in running:
+                fut.cancel()
+            pbar.close()
+
+        return results
+
+    def gen_eval_commands(self, tasks: List[str],
+                          max_recompose: int | None = None,
+                          ofile: str | None = None) -> List[tuple[str, str, int]]:
+        results = asyncio.run(self.run(tasks, max_recompose))
+        self.inference._save_results(results, ofile)
+        for name, stat in self.stats.items():
+            print(f"{name:<14}: {stat['calls']} calls, peak concurrency {stat['peak_concurrency']}")
+        if self.inference.failures:
+            print(f"Failed tasks: {len(self.inference.failures)} (empty command in the results)")
+        if self.inference.tracer is not None:
+            self.inference.tracer.print_summary()
+        return results
+
+
+if __name__ == "__main__":
+    from nl2sh.inference import load_evaluation_nl
+
+    s = StageScheduler(Inference(), max_in_flight=32, agent_limits={"inspector": 8})
+    s.gen_eval_commands(load_evaluation_nl(), max_recompose=2, ofile='./gened_files/base_o.txt')
@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import contextlib
+import fcntl
+import json
+import multiprocessing
+import os
+import socket
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from nl2sh.inference import Inference, iter_evaluation_nl, load_evaluation_nl
+
+"""
+Scale-out batch inference. Two ways to split a task file over many processes or machines:
+1. Static shards: worker i of n takes the tasks with index % n == i and writes shard-<i>-of-<n>.jsonl.
+2. A work queue in a directory on a shared file system: the tasks are cut into small chunks, and every worker
+   claims the next chunk under an flock()ed state file, so fast workers simply take more chunks and a few slow
+   tasks do not hold back a whole shard. A chunk whose lease expired without a result (dead or stuck worker)
+   is claimed again by the next worker that runs out of work; a worker with nothing to claim keeps polling
+   while other chunks are still leased, so the chunk of a crashed worker is always re-run.
+Either way every output record keeps the input index, and merge() writes one ordered file in the format of
+Inference.gen_eval_commands. A shard file starts with a header line (its shard index, the shard count and the input
+size), and the queue state holds the input size, so merge() knows how many tasks and shards to expect.
+    python -m nl2sh.sharding init  --queue /shared/q --input nl2sh/data/nl2bash_eval_50.jsonl --chunk-size 8
+    python -m nl2sh.sharding work  --queue /shared/q --processes 4      # on every node
+    python -m nl2sh.sharding merge --queue /shared/q --out gened_files/base_o.txt
+    python -m nl2sh.sharding merge gened_files/shards --out gened_files/base_o.txt
+flock() needs a file system with working POSIX locks (local disks, NFSv4, Lustre, ...).
+"""
+
+
+def shard(tasks: List[str], index: int, count: int) -> List[Tuple[int, str]]:
+    """
+    The (input index, task) pairs of shard `index` of `count`. Strided, so every shard gets a mix of the file.
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"shard index {index} out of range for {count} shards")
+    return [(i, task) for i, task in enumerate(tasks) if i % count == index]
+
+
+def _write_records(path: Path, records: List[Dict[str, Any]]) -> None:
+    # write to a temp file and rename, so readers never see a partial file
+    tmp = path.with_name(f".{path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def run_tasks(inference: Inference, items: List[Tuple[int, str]], max_recompose: int | None = None,
+              max_in_flight: int = 16) -> List[Dict[str, Any]]:
+    """
+    Run (index, task) pairs through the StageScheduler. A failing task gets an empty command (see Inference.failures).
+    Returns:
+        List[Dict[str, Any]]: {"idx", "task", "command", "retry_times"} records.
+    """
+    from nl2sh.scheduler import StageScheduler
+
+    # the per-task reports of thousands of tasks would drown the worker log
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = asyncio.run(StageScheduler(inference, max_in_flight).run([t for _, t in items], max_recompose))
+    return [{"idx": idx, "task": task, "command": cmd, "retry_times": retry_times}
+            for (idx, _), (task, cmd, retry_times) in zip(items, results)]
+
+
+def run_shard(inference: Inference, path: str | Path, index: int, count: int, out_dir: str | Path,
+              max_recompose: int | None = None, max_in_flight: int = 16) -> Path:
+    """
+    Run one static shard of a task file and write out_dir/shard-<index>-of-<count>.jsonl: a
+    {"shard", "count", "size"} header line, then the records.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out = out_dir / f"shard-{index}-of-{count}.jsonl"
+    tasks = load_evaluation_nl(path)
+    header = {"shard": index, "count": count, "size": len(tasks)}
+    _write_records(out, [header] + run_tasks(inference, shard(tasks, index, count), max_recompose, max_in_flight))
+    return out
+
+
+class WorkQueue:
+    """
+    A chunked task queue in a shared directory:
+        tasks.jsonl        {"idx", "task"} per line
+        state.json         number of chunks, the next unclaimed chunk, and the leases {chunk: [worker, claimed_at]}
+        state.lock         flock()ed around every read-modify-write of state.json
+        results/<chunk>.jsonl   written by the worker that finished the chunk
+    Attributes:
+        path (Path): The queue directory.
+        lease_s (float): Seconds after which a claimed chunk without a result may be claimed by another worker.
+    Methods:
+        create(path, tasks, chunk_size) -> WorkQueue: Create a queue for the tasks.
+        claim(worker) -> Tuple[int, List[Tuple[int, str]]] | None: Claim the next chunk, None when all are taken.
+        complete(chunk, records): Store the results of a chunk and release its lease.
+        progress() -> Dict[str, int]: Number of tasks and chunks, claimed and finished chunks, and leased chunks
+            that have no result yet.
+    """
+
+    def __init__(self, path: str | Path, lease_s: float = 900.0) -> None:
+        self.path = Path(path)
+        self.lease_s = lease_s
+        self._tasks: List[Tuple[int, str]] | None = None
+
+    @classmethod
+    def create(cls, path: str | Path, tasks: List[str], chunk_size: int = 8, **kwargs: Any) -> "WorkQueue":
+        queue = cls(path, **kwargs)
+        if (queue.path / "state.json").exists():
+            raise FileExistsError(f"a work queue already exists at {queue.path}")
+        (queue.path / "results").mkdir(parents=True, exist_ok=True)
+        _write_records(queue.path / "tasks.jsonl", [{"idx": i, "task": t} for i, t in enumerate(tasks)])
+        state = {"size": len(tasks), "chunk_size": chunk_size,
+                 "chunks": (len(tasks) + chunk_size - 1) // chunk_size, "next": 0, "leases": {}}
+        (queue.path / "state.json").write_text(json.dumps(state), encoding="utf-8")
+        return queue
+
+    @contextlib.contextmanager
+    def _state(self) -> Iterator[Dict[str, Any]]:
+        # exclusive lock, read the state, let the caller change it, write it back
+        with (self.path / "state.lock").open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = json.loads((self.path / "state.json").read_text(encoding="utf-8"))
+                yield state
+                tmp = self.path / f".state.{socket.gethostname()}.{os.getpid()}.tmp"
+                tmp.write_text(json.dumps(state), encoding="utf-8")
+                os.replace(tmp, self.path / "state.json")
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _result_path(self, chunk: int) -> Path:
+        return self.path / "results" / f"{chunk:06d}.jsonl"
+
+    def _chunk(self, chunk: int, chunk_size: int) -> List[Tuple[int, str]]:
+        if self._tasks is None:
+            with (self.path / "tasks.jsonl").open("r", encoding="utf-8") as f:
+                self._tasks = [(r["idx"], r["task"]) for r in map(json.loads, f)]
+        return self._tasks[chunk * chunk_size:(chunk + 1) * chunk_size]
+
+    def claim(self, worker: str) -> Tuple[int, List[Tuple[int, str]]] | None:
+        now = time.time()
+        with self._state() as state:
+            chunk = None
+            if state["next"] < state["chunks"]:
+                chunk = state["next"]
+                state["next"] += 1
+            else:
+                # nothing new left: take over a chunk whose worker died or stalls
+                for key, (_, claimed_at) in sorted(state["leases"].items(), key=lambda kv: kv[1][1]):
+                    if now - claimed_at > self.lease_s and not self._result_path(int(key)).exists():
+                        chunk = int(key)
+                        break
+            if chunk is None:
+                return None
+            state["leases"][str(chunk)] = [worker, now]
+            chunk_size = state["chunk_size"]
+        return chunk, self._chunk(chunk, chunk_size)
+
+    def complete(self, chunk: int, records: List[Dict[str, Any]]) -> None:
+        _write_records(self._result_path(chunk), records)
+        with self._state() as state:
+            state["leases"].pop(str(chunk), None)
+
+    def progress(self) -> Dict[str, int]:
+        with self._state() as state:
+            # a worker that died between writing its result and releasing the lease left a finished chunk behind
+            leased = sum(not self._result_path(int(key)).exists() for key in state["leases"])
+            return {"size": state["size"], "chunks": state["chunks"], "claimed": state["next"],
+                    "done": len(list((self.path / "results").glob("*.jsonl"))), "leased": leased}
+
+
+def work(queue: WorkQueue, inference: Inference, max_recompose: int | None = None,
+         max_in_flight: int = 16, poll_s: float = 10.0) -> int:
+    """
+    Claim and run chunks until every chunk has a result. When nothing can be claimed but other workers still hold
+    leases, poll every poll_s seconds: their chunks are finished by them, or re-claimed here once a lease expires.
+    Returns the number of chunks this worker finished.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    while True:
+        claimed = queue.claim(worker)
+        if claimed is None:
+            if queue.progress()["leased"] == 0:
+                break
+            time.sleep(min(poll_s, queue.lease_s))
+            continue
+        chunk, items = claimed
+        start = time.perf_counter()
+        queue.complete(chunk, run_tasks(inference, items, max_recompose, max_in_flight))
+        done += 1
+        print(f"[{worker}] chunk {chunk}: {len(items)} tasks in {time.perf_counter() - start:.1f}s", flush=True)
+    return done
+
+
+def merge(inputs: List[str | Path], ofile: str | Path, size: int | None = None) -> List[Tuple[str, str, int]]:
+    """
+    Merge shard or chunk result files (or directories of them) into one file ordered by input index, in the
+    format of Inference.gen_eval_commands. The number of tasks is `size`, or else the one in the shard headers.
+    Raises:
+        ValueError: If the number of tasks is unknown (no size and no shard header), the shard headers disagree, a
+            shard or an index below the number of tasks is missing, or a shard or record is duplicated.
+    """
+    files: List[Path] = []
+    for item in map(Path, inputs):
+        files.extend(sorted(item.glob("*.jsonl")) if item.is_dir() else [item])
+    records: Dict[int, Dict[str, Any]] = {}
+    headers: Dict[int, Dict[str, Any]] = {}
+    for path in files:
+        with path.open("r", encoding="utf-8") as f:
+            for record in map(json.loads, filter(str.strip, f)):
+                if "shard" in record:
+                    if record["shard"] in headers:
+                        raise ValueError(f"shard {record['shard']} appears twice ({path})")
+                    headers[record["shard"]] = record
+                    continue
+                if record["idx"] in records:
+                    raise ValueError(f"task {record['idx']} appears twice ({path})")
+                records[record["idx"]] = record
+
+    if headers:
+        runs = {(h["count"], h["size"]) for h in headers.values()}
+        if len(runs) > 1:
+            raise ValueError(f"the shard files come from different runs (shard count, size): {sorted(runs)}")
+        count, shard_size = runs.pop()
+        if size is not None and size != shard_size:
+            raise ValueError(f"the shards were run on {shard_size} tasks, not {size}")
+        size = shard_size
+        missing_shards = sorted(set(range(count)) - set(headers))
+        if missing_shards:
+            raise ValueError(f"{len(missing_shards)} of {count} shards are missing, e.g. shard {missing_shards[0]}")
+    if size is None:
+        # the highest index seen says nothing about tasks lost at the end of the input
+        raise ValueError("the number of tasks is unknown: pass size (--size or --input)")
+    missing = sorted(set(range(size)) - set(records))
+    if missing:
+        raise ValueError(f"{len(missing)} tasks have no result, e.g. index {missing[0]}")
+
+    results = [(r["task"], r["command"], r["retry_times"]) for _, r in sorted(records.items())]
+    Inference._save_results(results, str(ofile))
+    return results
+
+
+def _inference(args: argparse.Namespace) -> Inference:
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return Inference(use_finetune=args.use_finetune, pre_inspect=args.pre_inspect, cascade=args.cascade)
+
+
+def _work_process(args: argparse.Namespace) -> int:
+    # one process of `work --processes N`; every process has its own Inference and event loop
+    return work(WorkQueue(args.queue, lease_s=args.lease), _inference(args), args.max_recompose, args.max_in_flight)
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Sharded / work-queue batch inference")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_init = sub.add_parser("init", help="create a work queue from a task file")
+    p_init.add_argument("--queue", required=True)
+    p_init.add_argument("--input", required=True)
+    p_init.add_argument("--chunk-size", type=int, default=8)
+
+    p_merge = sub.add_parser("merge", help="merge the results into one ordered file")
+    p_merge.add_argument("--queue", help="a work queue directory")
+    p_merge.add_argument("inputs", nargs="*", help="shard result files or directories")
+    p_merge.add_argument("--out", required=True)
+    p_merge.add_argument("--size", type=int, help="number of tasks, for files without a shard header")
+    p_merge.add_argument("--input", help="the task file, to count the tasks instead of --size")
+
+    for name, help_ in (("work", "claim and run chunks of a work queue"), ("shard", "run one static shard")):
+        p = sub.add_parser(name, help=help_)
+        p.add_argument("--max-recompose", type=int, default=2)
+        p.add_argument("--max-in-flight", type=int, default=16)
+        p.add_argument("--use-finetune", action="store_true")
+        p.add_argument("--pre-inspect", action="store_true")
+        p.add_argument("--cascade", action="store_true")
+        if name == "work":
+            p.add_argument("--queue", required=True)
+            p.add_argument("--processes", type=int, default=1)
+            p.add_argument("--lease", type=float, default=900.0, help="seconds before a stuck chunk is re-claimed")
+        else:
+            p.add_argument("--input", required=True)
+            p.add_argument("--index", type=int, required=True)
+            p.add_argument("--count", type=int, required=True)
+            p.add_argument("--out-dir", default="gened_files/shards")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "init":
+        queue = WorkQueue.create(args.queue, load_evaluation_nl(args.input), args.chunk_size)
+        print(f"Work queue at {queue.path}: {queue.progress()}")
+    elif args.cmd == "work":
+        if args.processes > 1:
+            with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+                chunks = sum(pool.map(_work_process, [args] * args.processes))
+        else:
+            chunks = _work_process(args)
+        print(f"Finished {chunks} chunks; queue: {WorkQueue(args.queue).progress()}")
+    elif args.cmd == "shard":
+        out = run_shard(_inference(args), args.input, args.index, args.count, args.out_dir,
+                        args.max_recompose, args.max_in_flight)
+        print(f"Saved shard {args.index}/{args.count} to {out}")
+    else:
+        size = sum(1 for _ in iter_evaluation_nl(args.input)) if args.input else args.size
+        if args.queue:
+            merge([Path(args.queue) / "results", *args.inputs], args.out, WorkQueue(args.queue).progress()["size"])
+        else:
+            merge(args.inputs, args.out, size)
+
+
+if __name__ == "__main__":
+    main()
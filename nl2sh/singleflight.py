@@ -0,0 +1,128 @@
+import asyncio
+import re
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+from nl2sh.inference import Inference
+
+"""
+Request coalescing ("single flight") in front of Inference.run_single / arun_single.
+When several callers submit the same task at the same time, only the first one runs the FSM; the others attach to
+that execution and get the same result. A task is only shared while it is in flight: once it finishes, the next
+request runs the FSM again, so no answer is ever served from a stale cache.
+    sf = SingleFlight(Inference())
+    cmd, retry_times = await sf.arun("list files by size", max_recompose=2)
+"""
+
+_SPACES = re.compile(r"\s+")
+# sentence punctuation at the end of a word. Punctuation inside a word is kept: "*.log" and "log" are different tasks.
+_TRAILING_PUNCT = re.compile(r"[.,;:!?]+(?=\s|$)")
+
+
+def normalize(task: str, fold_case: bool = True) -> str:
+    """
+    The key under which requests are coalesced: collapsed whitespace, no sentence punctuation, and case-folded
+    unless fold_case is False (e.g. when file names in the tasks differ only by case).
+    """
+    key = _TRAILING_PUNCT.sub("", task)
+    key = _SPACES.sub(" ", key).strip()
+    return key.casefold() if fold_case else key
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight tasks of one Inference.
+    Attributes:
+        inference (Inference): The pipeline that runs the tasks.
+        fold_case (bool): Whether tasks that differ only by case are coalesced.
+        stats (Dict[str, int]): requests, executions (FSM runs) and coalesced (requests served by another run).
+    Methods:
+        run(task, max_recompose, deadline_s) -> tuple[str | Any, int] | str: Coalesced Inference.run_single, thread-safe.
+        arun(task, max_recompose, on_step, deadline_s) -> tuple[str | Any, int] | str: Coalesced Inference.arun_single.
+        coalesced_rate() -> float: Fraction of requests that did not need their own FSM run.
+    Note:
+        Requests only share a run if they also ask for the same max_recompose. The deadline of the first request
+        applies to the shared run.
+    """
+
+    def __init__(self, inference: Inference, fold_case: bool = True) -> None:
+        self.inference = inference
+        self.fold_case = fold_case
+        self.stats = {"requests": 0, "executions": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+        self._flights: Dict[Tuple[str, int | None], Future] = {}
+        # event loop -> {key: {"task": asyncio.Task, "listeners": [...], "last": (agent, context) | None}}
+        self._aflights = weakref.WeakKeyDictionary()
+
+    def _count(self, leader: bool) -> None:
+        # called with self._lock held
+        self.stats["requests"] += 1
+        self.stats["executions" if leader else "coalesced"] += 1
+
+    def run(self, task: str, max_recompose: int | None = None,
+            deadline_s: float | None = None) -> tuple[str | Any, int] | str:
+        key = (normalize(task, self.fold_case), max_recompose)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+            self._count(leader)
+
+        if not leader:
+            # the leader's exception is raised here too
+            return flight.result()
+
+        try:
+            flight.set_result(self.inference.run_single(task, max_recompose, deadline_s=deadline_s))
+        except BaseException as e:
+            flight.set_exception(e)
+        finally:
+            # done: later requests start a new run
+            with self._lock:
+                del self._flights[key]
+        return flight.result()
+
+    async def arun(self, task: str, max_recompose: int | None = None,
+                   on_step: Callable[[str, Dict[str, Any]], None] | None = None,
+                   deadline_s: float | None = None) -> tuple[str | Any, int] | str:
+        """
+        Async version of run. Every attached caller gets the on_step events of the shared run from the moment it
+        attached, starting with the latest step so far. Cancelling one caller does not cancel the shared run.
+        """
+        key = (normalize(task, self.fold_case), max_recompose)
+        flights = self._aflights.setdefault(asyncio.get_running_loop(), {})
+        flight = flights.get(key)
+        if flight is not None and flight["task"].done():
+            # finished, only its done callback has not run yet
+            flight = None
+        with self._lock:
+            self._count(flight is None)
+
+        if flight is None:
+            flight = flights[key] = {"listeners": [], "last": None}
+
+            def _fan_out(agent: str, context: Dict[str, Any]) -> None:
+                flight["last"] = (agent, context)
+                for listener in list(flight["listeners"]):
+                    listener(agent, context)
+
+            # the run is its own task, so it survives the cancellation of the caller that started it
+            flight["task"] = asyncio.create_task(
+                self.inference.arun_single(task, max_recompose, on_step=_fan_out, deadline_s=deadline_s))
+            flight["task"].add_done_callback(lambda _, done=flight: flights.get(key) is done and flights.pop(key))
+        elif on_step is not None and flight["last"] is not None:
+            on_step(*flight["last"])
+
+        if on_step is not None:
+            flight["listeners"].append(on_step)
+        try:
+            return await asyncio.shield(flight["task"])
+        finally:
+            if on_step is not None:
+                flight["listeners"].remove(on_step)
+
+    def coalesced_rate(self) -> float:
+        return self.stats["coalesced"] / self.stats["requests"] if self.stats["requests"] else 0.0
@@ -0,0 +1,247 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+"""
+Structured tracing for the inference FSM.
+Every agent execution becomes one span: agent, model, state transition, wall time, time-to-first-byte,
+input/output/cached tokens and recompose index. The span of the running agent lives in a contextvar, so the
+LLM services and the pooled HTTP transport can add to it without passing it through every call; this works for
+threads, asyncio tasks and asyncio.to_thread alike. When no Tracer is used, the hooks are a single contextvar lookup.
+"""
+
+_CURRENT: contextvars.ContextVar[Dict[str, Any] | None] = contextvars.ContextVar("nl2sh_span", default=None)
+
+
+def current_span() -> Dict[str, Any] | None:
+    return _CURRENT.get()
+
+
+def note_ttfb(seconds: float) -> None:
+    """
+    Called by the pooled transport when the response headers of a request arrived.
+    """
+    span = _CURRENT.get()
+    if span is not None:
+        span["ttfb_s"] += seconds
+
+
+def note_ttft(seconds: float) -> None:
+    """
+    Called by the streaming LLM calls when the first text delta arrived. Keeps the first value of the span.
+    """
+    span = _CURRENT.get()
+    if span is not None and span["ttft_s"] is None:
+        span["ttft_s"] = seconds
+
+
+def note_decision(seconds: float) -> None:
+    """
+    Called by a streaming agent when its result was settled, e.g. the composer had a complete command line or
+    the inspector knew its verdict. Measured from the start of the agent call.
+    """
+    span = _CURRENT.get()
+    if span is not None:
+        span["decision_s"] = seconds
+
+
+def record_llm_call(usage: Any, network_s: float, cached: bool = False) -> None:
+    """
+    Called by the LLM services after every call, with the `usage` object of the Responses API (or None).
+    Args:
+        usage (Any): resp.usage, None for a response-cache hit.
+        network_s (float): Time spent waiting for the API, including the body download.
+        cached (bool): Whether the answer came from the response cache.
+    """
+    span = _CURRENT.get()
+    if span is None:
+        return
+    span["llm_calls"] += 1
+    span["network_s"] += network_s
+    span["response_cache_hits"] += int(cached)
+    if usage is None:
+        return
+    span["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+    span["output_tokens"] += getattr(usage, "output_tokens", 0) or 0
+    details = getattr(usage, "input_tokens_details", None)
+    span["cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Linear-interpolated percentile, q in [0, 100].
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+class Tracer:
+    """
+    Collects one span per agent execution.
+    Attributes:
+        spans (List[Dict[str, Any]]): The finished spans, in completion order.
+        prices (Dict[str, tuple[float, float, float]] | None): Optional USD prices per 1M tokens per model,
+            as (input, cached input, output). Used for the cost column of summary().
+    Methods:
+        span(agent, context: Dict[str, Any], recompose: int): Context manager around one agent execution.
+        summary() -> Dict[str, Dict[str, float]]: Per-agent latency percentiles, tokens, cost and CPU/network split.
+        print_summary(): Prints summary() as a table.
+        to_jsonl(path), to_chrome_trace(path): Export the spans.
+        clear(): Drop all spans.
+    """
+
+    def __init__(self, prices: Dict[str, tuple[float, float, float]] | None = None) -> None:
+        self.spans: List[Dict[str, Any]] = []
+        self.prices = prices
+        self._lock = threading.Lock()
+        # wall-clock origin, so spans of different threads and tasks share one timeline
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def span(self, agent: Any, context: Dict[str, Any], recompose: int = 0) -> Iterator[Dict[str, Any]]:
+        span = {
+            "agent": agent.name,
+            "model": agent.model,
+            "task": context.get("usr_input", ""),
+            "recompose": recompose,
+            "from_state": context.get("state"),
+            "to_state": None,
+            "start_s": time.perf_counter() - self._t0,
+            "wall_s": 0.0,
+            "ttfb_s": 0.0,
+            "ttft_s": None,
+            "decision_s": None,
+            "network_s": 0.0,
+            "cpu_s": 0.0,
+            "llm_calls": 0,
+            "response_cache_hits": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cached_tokens": 0,
+            "thread": threading.get_ident(),
+            "error": None,
+        }
+        token = _CURRENT.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = repr(e)
+            raise
+        finally:
+            _CURRENT.reset(token)
+            span["wall_s"] = time.perf_counter() - start
+            # everything that is not waiting for the API: our own code, local checks, and queueing on the loop
+            span["cpu_s"] = max(0.0, span["wall_s"] - span["network_s"])
+            if span["to_state"] is None:
+                # agents usually update the context in place; callers set to_state when they get a new one
+                span["to_state"] = context.get("state")
+            with self._lock:
+                self.spans.append(span)
+
+    def _cost(self, span: Dict[str, Any]) -> float:
+        price = (self.prices or {}).get(span["model"])
+        if price is None:
+            return 0.0
+        inp, cached, out = price
+        fresh = span["input_tokens"] - span["cached_tokens"]
+        return (fresh * inp + span["cached_tokens"] * cached + span["output_tokens"] * out) / 1e6
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            spans = list(self.spans)
+        by_agent: Dict[str, List[Dict[str, Any]]] = {}
+        for s in spans:
+            by_agent.setdefault(s["agent"], []).append(s)
+
+        out = {}
+        for agent, group in by_agent.items():
+            wall = [s["wall_s"] for s in group]
+            ttfb = [s["ttfb_s"] for s in group if s["llm_calls"] and not s["response_cache_hits"]]
+            ttft = [s["ttft_s"] for s in group if s["ttft_s"] is not None]
+            decision = [s["decision_s"] for s in group if s["decision_s"] is not None]
+            network = sum(s["network_s"] for s in group)
+            cpu = sum(s["cpu_s"] for s in group)
+            out[agent] = {
+                "count": len(group),
+                "p50_s": percentile(wall, 50),
+                "p95_s": percentile(wall, 95),
+                "p99_s": percentile(wall, 99),
+                "ttfb_p50_s": percentile(ttfb, 50),
+                "ttfb_p95_s": percentile(ttfb, 95),
+                # only for streaming calls
+                "ttft_p50_s": percentile(ttft, 50),
+                "decision_p50_s": percentile(decision, 50),
+                "network_s": network,
+                "cpu_s": cpu,
+                "network_share": network / (network + cpu) if network + cpu else 0.0,
+                "input_tokens": sum(s["input_tokens"] for s in group),
+                "output_tokens": sum(s["output_tokens"] for s in group),
+                "cached_tokens": sum(s["cached_tokens"] for s in group),
+                "cost_usd": sum(self._cost(s) for s in group),
+                "errors": sum(1 for s in group if s["error"]),
+            }
+        return out
+
+    def print_summary(self) -> None:
+        summary = self.summary()
+        print(f"{'agent':<14}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'ttfb50':>9}{'ttft50':>9}{'decide50':>9}"
+              f"{'net%':>7}{'in_tok':>10}{'cached':>9}{'out_tok':>9}" + (f"{'cost$':>10}" if self.prices else ""))
+        for agent, s in summary.items():
+            print(f"{agent:<14}{s['count']:>7}{s['p50_s']:>9.3f}{s['p95_s']:>9.3f}{s['p99_s']:>9.3f}"
+                  f"{s['ttfb_p50_s']:>9.3f}{s['ttft_p50_s']:>9.3f}{s['decision_p50_s']:>9.3f}{s['network_share']:>7.0%}{s['input_tokens']:>10}"
+                  f"{s['cached_tokens']:>9}{s['output_tokens']:>9}"
+                  + (f"{s['cost_usd']:>10.4f}" if self.prices else ""))
+
+    def to_jsonl(self, path: str | Path) -> None:
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, "w", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s, ensure_ascii=False) + "\n")
+        print(f"Saved {len(spans)} spans to {path}")
+
+    def to_chrome_trace(self, path: str | Path) -> None:
+        """
+        Export in the Chrome trace-event format (chrome://tracing, Perfetto). Each task gets its own row,
+        so a batch run shows up as a timeline with one bar per agent execution.
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_s"])
+        rows: Dict[str, int] = {}
+        events = []
+        pid = os.getpid()
+        for s in spans:
+            tid = rows.setdefault(s["task"], len(rows) + 1)
+            events.append({
+                "name": s["agent"],
+                "cat": s["model"],
+                "ph": "X",
+                "ts": s["start_s"] * 1e6,
+                "dur": s["wall_s"] * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {k: s[k] for k in ("from_state", "to_state", "recompose", "ttfb_s", "ttft_s", "decision_s", "network_s",
+                                           "input_tokens", "output_tokens", "cached_tokens", "error")},
+            })
+        for task, tid in rows.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": task[:80]}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Saved {len(spans)} spans of {len(rows)} tasks to {path}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+        self._t0 = time.perf_counter()
@@ -0,0 +1,4 @@
+import os
+
+# keep the progress bars of the batch runners out of the test output
+os.environ.setdefault("TQDM_DISABLE", "1")
@@ -0,0 +1,55 @@
+import contextlib
+import io
+import os
+import unittest
+
+from nl2sh.bench.mock_server import Latency, MockConfig, MockServer
+from nl2sh.bench.run_bench import _point_sdk_at
+
+"""
+Shared helpers of the tests. The LLM paths run against the mock server of nl2sh.bench, so no test needs an API key
+or the network.
+"""
+
+
+def quiet() -> contextlib.AbstractContextManager:
+    # the FSM prints every state; keep it out of the test output
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+class MockServerTestCase(unittest.TestCase):
+    """
+    Starts one mock server per test class and points the OpenAI SDK at it. The counters and the scripted inspector
+    state are cleared before every test, and the config can be changed by the test (self.server.config).
+    """
+    server: MockServer
+
+    @classmethod
+    def mock_config(cls) -> MockConfig:
+        return MockConfig(latency={"default": Latency("fixed", 0.01)}, seed=0)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._env = {k: os.environ.get(k) for k in ("OPENAI_BASE_URL", "OPENAI_API_KEY")}
+        cls.server = MockServer(cls.mock_config()).start()
+        _point_sdk_at(cls.server)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        from nl2sh.agents.client_pool import reset_pool
+
+        cls.server.stop()
+        for key, value in cls._env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        reset_pool()
+
+    def setUp(self) -> None:
+        self.server.config = self.mock_config()
+        self.server.reset_stats()
+
+    def requests(self, kind: str | None = None) -> int:
+        stats = self.server.stats()
+        return stats["total_requests"] if kind is None else stats["requests"][kind]
@@ -0,0 +1,38 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from nl2sh.ablation import PRESETS, print_report, run_matrix
+from tests.support import MockServerTestCase, quiet
+
+TASKS = [f"task {i}" for i in range(4)]
+
+
+class AblationTest(MockServerTestCase):
+
+    def test_shared_stages_are_called_once(self):
+        configs = {name: PRESETS[name] for name in ("default", "ablation")}
+        with tempfile.TemporaryDirectory() as tmp, quiet():
+            report = run_matrix(configs, TASKS, max_recompose=1, max_concurrency=2, out_dir=tmp)
+            print_report(report)
+            files = sorted(p.name for p in Path(tmp).iterdir())
+        self.assertEqual(files, ["ablation.txt", "default.txt", "judged.jsonl"])
+        self.assertEqual([(r["config"], r["inspector"]) for r in report],
+                         [("default", "gpt-5.1"), ("ablation", "gpt-4o-mini")])
+        # the clarifier and the first composer call are shared, the inspectors differ
+        self.assertEqual((self.requests("clarifier"), self.requests("composer"), self.requests("inspector")),
+                         (4, 4, 8))
+        self.assertEqual(report[0]["calls"], {"api": 16, "shared": 8, "judged_pairs": 4, "pairs": 8})
+        # both configurations produced the same commands, so every pair is judged once
+        self.assertEqual(self.requests("evaluator"), 4)
+        for row in report:
+            self.assertEqual((row["tasks"], row["judged"], row["empty"], row["same"]), (4, 4, 0, 1.0))
+        self.assertEqual(report[0]["avg_score"], report[1]["avg_score"])
+
+    def test_no_configurations(self):
+        with self.assertRaises(ValueError):
+            run_matrix({}, TASKS)
+
+
+if __name__ == "__main__":
+    unittest.main()
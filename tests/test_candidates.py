@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+
+from nl2sh.agents.candidates import NO_GUIDE, BatchInspector
+from nl2sh.agents.pre_inspector import PreInspector
+from nl2sh.inference import Inference
+from tests.support import MockServerTestCase, quiet
+
+
+def _context(candidates):
+    return {"usr_input": "t", "clarifier": "t", "candidates": candidates, "state": "candidates"}
+
+
+class BatchSelectionTest(unittest.TestCase):
+
+    def test_parse_batch(self):
+        inspector = BatchInspector()
+        self.assertEqual(inspector._parse_batch('```json\n{"1": "INCORRECT: quote it", "2": "CORRECT"}\n```', 2),
+                         [(False, "quote it"), (True, None)])
+        self.assertIsNone(inspector._parse_batch("both look fine", 2))
+        self.assertIsNone(inspector._parse_batch("[1, 2]", 2))
+
+    def test_first_correct_candidate_is_accepted(self):
+        inspector = BatchInspector()
+        context = inspector._select(_context(["a", "b", "c"]), ["a", "b", "c"],
+                                    '{"1": "INCORRECT: no", "2": "CORRECT", "3": "CORRECT"}', [])
+        self.assertEqual((context["state"], context["composer_history"]), ("done", ["b"]))
+        self.assertEqual(inspector.stats["accepted_rank"], {2: 1})
+
+    def test_none_correct_recomposes_from_the_first(self):
+        inspector = BatchInspector()
+        context = inspector._select(_context(["a", "b"]), ["a", "b"],
+                                    '{"1": "INCORRECT: use -l", "2": "INCORRECT: no"}', [])
+        self.assertEqual(context["state"], "not_passed")
+        self.assertEqual((context["composer_history"], context["inspector_history"]), (["a"], ["use -l"]))
+
+    def test_missing_verdict_never_becomes_a_suggestion(self):
+        inspector = BatchInspector()
+        context = inspector._select(_context(["a", "b"]), ["a", "b"], '{"2": "INCORRECT: use -l"}', [])
+        self.assertEqual((context["composer_history"], context["inspector_history"]), (["b"], ["use -l"]))
+        context = inspector._select(_context(["a", "b"]), ["a", "b"], '{"1": "maybe"}', [])
+        self.assertEqual(context["state"], "not_passed")
+        self.assertEqual((context["composer_history"], context["inspector_history"]), (["a"], [NO_GUIDE]))
+
+    def test_unparseable_answer_goes_to_the_inspector(self):
+        inspector = BatchInspector()
+        context = inspector._select(_context(["a", "b"]), ["a", "b"], "no idea", [])
+        self.assertEqual((context["state"], context["composer_history"]), ("composed", ["a"]))
+        self.assertEqual(inspector.stats["unparseable"], 1)
+
+    def test_pre_inspector_drops_broken_candidates(self):
+        inspector = BatchInspector(pre_inspector=PreInspector(use_shellcheck=False))
+        candidates, errors = inspector._prepare(_context(["echo 'unterminated", "ls -l"]))
+        self.assertEqual((candidates, errors != []), (["ls -l"], True))
+        context = inspector._select(_context(["echo 'unterminated"]), [], None, ["syntax error"])
+        self.assertEqual((context["state"], context["inspector_history"]), ("not_passed", ["syntax error"]))
+
+
+class CandidatesInferenceTest(MockServerTestCase):
+
+    def test_candidates_are_judged_in_one_request(self):
+        with quiet():
+            inference = Inference(candidates=3)
+            result = inference.run_single("t", max_recompose=2)
+        # the mock only accepts the last candidate
+        self.assertEqual(result, ("ls -lh", 0))
+        self.assertEqual((self.requests("composer"), self.requests("batch_inspector")), (3, 1))
+        self.assertEqual(self.requests("inspector"), 0)
+
+    def test_none_correct_falls_back_to_the_recompose_loop(self):
+        self.server.config.inspector_incorrect = 1
+        with quiet():
+            result = asyncio.run(Inference(candidates=3).arun_single("t", max_recompose=2))
+        # batch rejects all -> not_passed -> composer -> inspector (second inspection of the task passes)
+        self.assertEqual(result, ("ls -l", 1))
+        self.assertEqual((self.requests("composer"), self.requests("inspector")), (4, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
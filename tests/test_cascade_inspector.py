@@ -0,0 +1,63 @@
+import unittest
+
+from nl2sh.agents.cascade_inspector import CascadeInspector
+from nl2sh.inference import Inference
+from tests.support import MockServerTestCase, quiet
+
+
+def _context(task):
+    return {"usr_input": task, "clarifier": task, "composer_history": ["ls -l"], "inspector_history": [],
+            "state": "composed"}
+
+
+class CascadeRoutingTest(unittest.TestCase):
+
+    def test_parse_confidence(self):
+        inspector = CascadeInspector()
+        self.assertEqual(inspector._parse_cascade("CORRECT\nCONFIDENCE: 0.9"), (True, None, 0.9, "CORRECT"))
+        self.assertEqual(inspector._parse_cascade("CORRECT\nCONFIDENCE: 7")[2], 1.0)
+        self.assertIsNone(inspector._parse_cascade("CORRECT")[2])
+
+    def test_escalation_reasons(self):
+        inspector = CascadeInspector(threshold=0.8, escalate_incorrect=False)
+        self.assertIsNone(inspector._escalation_reason(True, 0.9))
+        self.assertEqual(inspector._escalation_reason(True, 0.5), "low_confidence")
+        self.assertEqual(inspector._escalation_reason(True, None), "low_confidence")
+        self.assertEqual(inspector._escalation_reason(None, 0.9), "unparseable")
+        self.assertIsNone(inspector._escalation_reason(False, 0.9))
+
+    def test_ablation_cannot_cascade(self):
+        with quiet(), self.assertRaises(ValueError):
+            Inference(cascade=True, inspect_abltn=True)
+
+
+class CascadeInspectorTest(MockServerTestCase):
+
+    def test_confident_correct_is_accepted(self):
+        inspector = CascadeInspector(threshold=0.0)
+        context = inspector.execute(_context("t"))
+        self.assertEqual(context["state"], "done")
+        self.assertEqual(self.requests("inspector"), 1)
+        self.assertEqual(inspector.escalation_rate(), 0.0)
+
+    def test_incorrect_is_escalated_and_the_strong_verdict_is_final(self):
+        self.server.config.inspector_incorrect = 1
+        inspector = CascadeInspector(threshold=0.0)
+        context = inspector.execute(_context("t"))
+        # the cheap stage said INCORRECT, the strong stage (second inspection of the task) says CORRECT
+        self.assertEqual(context["state"], "done")
+        self.assertEqual(self.requests("inspector"), 2)
+        self.assertEqual(inspector.stats["reasons"]["incorrect"], 1)
+        self.assertEqual((inspector.stats["compared"], inspector.stats["agreed"]), (1, 0))
+
+    def test_low_confidence_is_escalated(self):
+        inspector = CascadeInspector(threshold=1.01)
+        for task in ("a", "b"):
+            inspector.execute(_context(task))
+        self.assertEqual(inspector.stats["reasons"]["low_confidence"], 2)
+        self.assertEqual(inspector.escalation_rate(), 1.0)
+        self.assertEqual(inspector.agreement_rate(), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
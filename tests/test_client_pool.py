@@ -0,0 +1,55 @@
+import asyncio
+import importlib.util
+import unittest
+
+from nl2sh.agents import client_pool
+from nl2sh.agents.llm_service import AsyncLLMService, LLMService, api_key
+from tests.support import MockServerTestCase
+
+MESSAGES = [{"role": "user", "content": "<UserRequest>list files</UserRequest>"}]
+
+
+class ClientPoolTest(MockServerTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        client_pool.reset_pool()
+
+    def test_services_share_one_client(self):
+        a, b = LLMService("gpt-4o-mini"), LLMService("gpt-5.1")
+        self.assertIs(a.client, b.client)
+        self.assertIs(a.client, client_pool.get_client(api_key()))
+
+    def test_reset_pool_builds_a_new_client(self):
+        before = LLMService().client
+        client_pool.reset_pool()
+        self.assertIsNot(LLMService().client, before)
+
+    def test_sequential_requests_reuse_the_connection(self):
+        service = LLMService()
+        for _ in range(3):
+            service.chat(MESSAGES)
+        stats = client_pool.pool_stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["connections_reused"], 2)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_async_clients_are_per_event_loop(self):
+        async def _client():
+            service = AsyncLLMService()
+            await service.chat(MESSAGES)
+            return service.client, client_pool.get_async_client(api_key())
+
+        (first, same), (second, _) = asyncio.run(_client()), asyncio.run(_client())
+        self.assertIs(first, same)
+        self.assertIsNot(first, second)
+
+    @unittest.skipIf(importlib.util.find_spec("h2") is not None, "h2 is installed")
+    def test_http2_needs_h2(self):
+        with self.assertRaises(ImportError):
+            client_pool.configure_pool(http2=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import marshal
+import pickle
+import unittest
+
+from nl2sh.context import History, TaskContext
+from nl2sh.inference import Inference
+from tests.support import MockServerTestCase, quiet
+
+
+class HistoryTest(unittest.TestCase):
+
+    def test_keeps_the_last_entries(self):
+        history = History(["a", "b", "c"], maxlen=2)
+        self.assertEqual(history, ["b", "c"])
+        history.append("d")
+        history.extend(["e", "f"])
+        self.assertEqual(history, ["e", "f"])
+        self.assertEqual(pickle.loads(pickle.dumps(history)).maxlen, 2)
+        self.assertEqual(History(["a", "b"]), ["a", "b"])
+
+
+class TaskContextTest(unittest.TestCase):
+
+    def test_dict_interface(self):
+        context = TaskContext("list files", clarifier=None)
+        self.assertEqual(context["usr_input"], "list files")
+        # a None field counts as missing
+        self.assertNotIn("clarifier", context)
+        self.assertIsNone(context.get("candidates"))
+        with self.assertRaises(KeyError):
+            context["candidates"]
+        context["clarifier"] = "List the files"
+        context["custom"] = 1
+        self.assertEqual(list(context), ["usr_input", "clarifier", "composer_history", "inspector_history", "state",
+                                         "custom"])
+        self.assertEqual(len(context), 6)
+        del context["custom"]
+        del context["clarifier"]
+        self.assertEqual(context.to_dict(), {"usr_input": "list files", "composer_history": [],
+                                             "inspector_history": [], "state": "init"})
+        with self.assertRaises(KeyError):
+            del context["custom"]
+
+    def test_assigned_histories_keep_the_bound(self):
+        context = TaskContext("t", max_history=2)
+        context["composer_history"] = ["a", "b", "c"]
+        self.assertEqual(context["composer_history"], ["b", "c"])
+        context["composer_history"].append("d")
+        self.assertEqual(context["composer_history"], ["c", "d"])
+
+    def test_copy_has_its_own_histories(self):
+        context = TaskContext("t", composer_history=["a"], extra_key={"k": 1})
+        other = context.copy()
+        other["composer_history"].append("b")
+        other["extra_key"] = 2
+        self.assertEqual((context["composer_history"], context["extra_key"]), (["a"], {"k": 1}))
+
+    def test_bytes_and_pickle_round_trip(self):
+        context = TaskContext("t", clarifier="c", state="composed", composer_history=["a", "b", "c"],
+                              inspector_history=["x"], max_history=2, note="n")
+        context["candidates"] = ["a", "b"]
+        context["retrieval"] = {"task": "t", "score": 0.95}
+        for copy in (TaskContext.from_bytes(context.to_bytes()), pickle.loads(pickle.dumps(context))):
+            self.assertEqual(copy, context)
+            self.assertEqual(copy.max_history, 2)
+            self.assertIsInstance(copy["composer_history"], History)
+        with self.assertRaises(ValueError):
+            TaskContext.from_bytes(marshal.dumps((0, *marshal.loads(context.to_bytes())[1:])))
+
+
+class BoundedHistoryInferenceTest(MockServerTestCase):
+
+    def test_recompose_loop_with_bounded_history(self):
+        self.server.config.inspector_incorrect = 3
+        with quiet():
+            result = Inference(max_history=1).run_single("t", max_recompose=3)
+        self.assertEqual(result, ("ls -l", 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
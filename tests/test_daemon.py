@@ -0,0 +1,80 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from nl2sh.cli import request
+from nl2sh.daemon import Daemon
+from nl2sh.inference import Inference
+from tests.support import MockServerTestCase, quiet
+
+
+class DaemonTest(MockServerTestCase):
+
+    def _serve(self, *requests):
+        """
+        Run a daemon on a temporary socket, send the requests from client threads at the same time, shut the daemon
+        down, and return the events of every request.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "nl2sh.sock")
+            with quiet():
+                daemon = Daemon(path, Inference())
+
+            async def main():
+                served = asyncio.create_task(daemon.serve())
+                while not os.path.exists(path):
+                    await asyncio.sleep(0.01)
+                events = await asyncio.gather(*(asyncio.to_thread(lambda r=r: list(request(path, r)))
+                                                for r in requests))
+                await asyncio.to_thread(lambda: list(request(path, {"op": "shutdown"})))
+                await served
+                return events
+
+            with quiet():
+                events = asyncio.run(main())
+            self.assertFalse(os.path.exists(path))
+        return daemon, events
+
+    def test_run_streams_steps_then_the_result(self):
+        _, (events,) = self._serve({"op": "run", "task": "t", "max_recompose": 1})
+        self.assertEqual([e["state"] for e in events if e["event"] == "step"], ["clarified", "composed", "done"])
+        result = events[-1]
+        self.assertEqual((result["event"], result["command"], result["state"]), ("result", "ls -l", "done"))
+
+    def test_identical_tasks_share_one_run(self):
+        daemon, events = self._serve(*[{"op": "run", "task": "same"}] * 3)
+        self.assertEqual([e[-1]["command"] for e in events], ["ls -l"] * 3)
+        self.assertEqual(self.requests("composer"), 1)
+        self.assertEqual(daemon.served, 3)
+
+    def test_control_ops_and_errors(self):
+        _, events = self._serve({"op": "ping"}, {"op": "status"}, {"op": "nope"}, {"op": "run", "task": " "})
+        self.assertEqual(events[0], [{"event": "pong"}])
+        self.assertEqual(events[1][0]["event"], "status")
+        self.assertEqual(events[2][0], {"event": "error", "message": "unknown op: nope"})
+        self.assertEqual(events[3][0], {"event": "error", "message": "empty task"})
+
+    def test_second_daemon_on_a_live_socket_is_refused(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "nl2sh.sock")
+            with quiet():
+                first, second = Daemon(path, Inference()), Daemon(path, Inference())
+
+            async def main():
+                served = asyncio.create_task(first.serve())
+                while not os.path.exists(path):
+                    await asyncio.sleep(0.01)
+                try:
+                    with self.assertRaises(RuntimeError):
+                        second._claim_socket()
+                finally:
+                    first._stop.set()
+                    await served
+
+            with quiet():
+                asyncio.run(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
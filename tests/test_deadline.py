@@ -0,0 +1,73 @@
+import asyncio
+import time
+import unittest
+
+from nl2sh import deadline
+from nl2sh.agents.client_pool import get_client
+from nl2sh.agents.llm_service import api_key
+from nl2sh.bench.mock_server import Latency, MockConfig
+from nl2sh.inference import TIMED_OUT, Inference
+from tests.support import MockServerTestCase, quiet
+
+
+class DeadlineScopeTest(unittest.TestCase):
+
+    def test_no_deadline(self):
+        self.assertIsNone(deadline.remaining())
+        self.assertIsNone(deadline.request_timeout())
+        self.assertFalse(deadline.expired())
+
+    def test_nested_scopes_keep_the_earlier_deadline(self):
+        with deadline.scope(deadline.after(1.0)) as outer:
+            with deadline.scope(deadline.after(10.0)) as inner:
+                self.assertEqual(inner, outer)
+            with deadline.scope(None) as inner:
+                self.assertEqual(inner, outer)
+            with deadline.scope(deadline.after(0.5)) as inner:
+                self.assertLess(inner, outer)
+        self.assertIsNone(deadline.remaining())
+
+    def test_request_timeout_after_expiry(self):
+        with deadline.scope(time.monotonic() - 1):
+            self.assertTrue(deadline.expired())
+            with self.assertRaises(deadline.DeadlineExceeded):
+                deadline.request_timeout()
+
+
+class DeadlineInferenceTest(MockServerTestCase):
+
+    @classmethod
+    def mock_config(cls) -> MockConfig:
+        # everything is fast but the inspector
+        return MockConfig(latency={"default": Latency("fixed", 0.01), "inspector": Latency("fixed", 1.0)}, seed=0)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        # the SDK loads its resources on the first request; keep that out of the short deadlines below
+        get_client(api_key()).responses
+
+    def test_slow_inspector_returns_the_composed_command(self):
+        with quiet():
+            start = time.monotonic()
+            result = Inference().run_single("t", max_recompose=2, deadline_s=0.3)
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(result, ("ls -l", 0))
+
+    def test_async_steps_are_cancelled_at_the_deadline(self):
+        states = []
+        with quiet():
+            result = asyncio.run(Inference(deadline_s=0.3).arun_single(
+                "t", max_recompose=2, on_step=lambda agent, context: states.append(context["state"])))
+        self.assertEqual(result, ("ls -l", 0))
+        self.assertEqual(states, ["clarified", "composed", TIMED_OUT])
+
+    def test_nothing_composed_in_time(self):
+        self.server.config = MockConfig(latency={"default": Latency("fixed", 1.0)}, seed=0)
+        with quiet():
+            result = asyncio.run(Inference().arun_single("t", deadline_s=0.2))
+        self.assertEqual(result, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
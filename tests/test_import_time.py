@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from nl2sh.bench.import_time import BUDGETS_MS, HEAVY, parse_importtime
+
+_PROBE = """
+import sys
+import {module}
+from nl2sh.inference import Inference
+Inference()
+print("heavy:", *sorted(p for p in {heavy!r} if p in sys.modules))
+"""
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def test_parse_importtime(self):
+        stderr = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        120 |   json.decoder\n"
+                  "import time:       300 |        420 | json\n"
+                  "something else\n")
+        self.assertEqual(parse_importtime(stderr), [("json.decoder", 120, 120), ("json", 300, 420)])
+
+    def test_no_heavy_imports_before_first_use(self):
+        # building the agents does not build a client, so the SDK is still not loaded
+        for module in BUDGETS_MS:
+            with self.subTest(module=module):
+                proc = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY)],
+                                      capture_output=True, text=True, check=True)
+                self.assertEqual(proc.stdout.strip().splitlines()[-1], "heavy:")
+
+    def test_first_request_loads_the_sdk(self):
+        proc = subprocess.run([sys.executable, "-c", "import sys\nfrom nl2sh.agents.llm_service import LLMService\n"
+                               "LLMService().client\nprint('openai' in sys.modules)"],
+                              capture_output=True, text=True, check=True, env={**os.environ, "OPENAI_API_KEY": "test"})
+        self.assertEqual(proc.stdout.strip(), "True")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+
+from nl2sh.inference import DONE, NOT_PASS, Inference
+from tests.support import MockServerTestCase, quiet
+
+
+class _Failing:
+    name = "failing"
+    model = "local"
+
+    def execute(self, context):
+        raise ValueError("boom")
+
+    async def aexecute(self, context):
+        raise ValueError("boom")
+
+
+class InferenceTest(MockServerTestCase):
+
+    def test_run_single_passes_first_time(self):
+        with quiet():
+            res = Inference().run_single("list files", max_recompose=2)
+        self.assertEqual(res, ("ls -l", 0))
+        self.assertEqual(self.requests("clarifier"), 1)
+        self.assertEqual(self.requests("composer"), 1)
+        self.assertEqual(self.requests("inspector"), 1)
+
+    def test_recompose_until_the_inspector_passes(self):
+        self.server.config.inspector_incorrect = 2
+        with quiet():
+            res = Inference().run_single("list files", max_recompose=3)
+        self.assertEqual(res, ("ls -l", 2))
+        self.assertEqual(self.requests("composer"), 3)
+        self.assertEqual(self.requests("inspector"), 3)
+
+    def test_recompose_budget_keeps_the_last_command(self):
+        self.server.config.inspector_incorrect = 5
+        with quiet() as out:
+            res = Inference().run_single("list files", max_recompose=1)
+        self.assertEqual(res, ("ls -l", 1))
+        self.assertIn(f"Final State       : {NOT_PASS}", out.getvalue())
+        self.assertEqual(self.requests("composer"), 2)
+
+    def test_arun_single_matches_run_single(self):
+        self.server.config.inspector_incorrect = 1
+        with quiet() as out:
+            res = asyncio.run(Inference().arun_single("list files", max_recompose=2))
+        self.assertEqual(res, ("ls -l", 1))
+        self.assertIn(f"Final State       : {DONE}", out.getvalue())
+
+    def test_arun_single_reports_every_step(self):
+        steps = []
+        with quiet():
+            asyncio.run(Inference().arun_single("list files", 2, on_step=lambda name, ctx: steps.append(
+                (name, ctx["state"]))))
+        self.assertEqual(steps, [("clarifier", "clarified"), ("composer", "composed"), ("inspector", "done")])
+
+    def test_agen_eval_commands_keeps_input_order_and_runs_concurrently(self):
+        tasks = [f"task {i}" for i in range(6)]
+        with quiet():
+            results = asyncio.run(Inference().agen_eval_commands(tasks, max_recompose=1, max_concurrency=3))
+        self.assertEqual([task for task, _, _ in results], tasks)
+        self.assertTrue(all(cmd == "ls -l" for _, cmd, _ in results))
+        self.assertGreater(self.server.stats()["peak_in_flight"], 1)
+
+    def test_failing_task_does_not_abort_the_batch(self):
+        inference = Inference()
+        with quiet():
+            inference.sched["init"] = _Failing()
+            results = asyncio.run(inference.agen_eval_commands(["a", "b"], max_recompose=1))
+            sync_results = inference.gen_eval_commands(["c"], max_recompose=1)
+        self.assertEqual(results, [("a", "", 0), ("b", "", 0)])
+        self.assertEqual(sync_results, [("c", "", 0)])
+        self.assertEqual([task for task, _ in inference.failures], ["a", "b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
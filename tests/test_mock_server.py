@@ -0,0 +1,88 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from nl2sh.agents.llm_service import LLMService
+from nl2sh.bench.mock_server import Latency, MockConfig, classify, load_trace
+from nl2sh.bench.run_bench import bench_evaluator, bench_inference, compare
+from tests.support import MockServerTestCase
+
+
+def _msg(text):
+    return [{"role": "user", "content": text}]
+
+
+class MockUnitTest(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual(classify(_msg("<UserRequest>x</UserRequest>")), "clarifier")
+        self.assertEqual(classify(_msg("<User_Command>ls</User_Command>")), "inspector")
+        self.assertEqual(classify(_msg('<Candidate id="1">ls</Candidate>')), "batch_inspector")
+        self.assertEqual(classify(_msg("<BashCommand>ls</BashCommand>")), "evaluator")
+        self.assertEqual(classify(_msg('<Pair id="1"><BashCommand>ls</BashCommand></Pair>')), "evaluator_packed")
+        self.assertEqual(classify(_msg("write a command")), "composer")
+
+    def test_latency(self):
+        with self.assertRaises(ValueError):
+            Latency("bimodal")
+
+    def test_load_trace_skips_local_and_cached_spans(self):
+        spans = [
+            {"agent": "composer", "llm_calls": 2, "response_cache_hits": 0, "network_s": 1.0,
+             "input_tokens": 100, "output_tokens": 10, "cached_tokens": 0},
+            {"agent": "pre_inspector", "llm_calls": 0, "response_cache_hits": 0, "network_s": 0.0,
+             "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0},
+            {"agent": "inspector", "llm_calls": 1, "response_cache_hits": 1, "network_s": 0.0,
+             "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "trace.jsonl"
+            path.write_text("\n".join(json.dumps(s) for s in spans) + "\n", encoding="utf-8")
+            self.assertEqual(load_trace(path), {"composer": [(0.5, 50, 5, 0)]})
+
+    def test_compare_flags_slow_cells_only(self):
+        def row(target, rate):
+            return {"target": target, "concurrency": 8, "max_recompose": 2, "items": 64, "items_per_s": rate}
+
+        baseline = [row("inference/async", 10.0), row("evaluator/pack1", 10.0)]
+        regressions = compare([row("inference/async", 7.0), row("evaluator/pack1", 9.0), row("new", 1.0)],
+                              baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("inference/async", regressions[0])
+
+
+class MockServerTest(MockServerTestCase):
+
+    def test_scripted_inspector(self):
+        self.server.config.inspector_incorrect = 1
+        service = LLMService()
+        prompt = _msg("<Task_Description>t</Task_Description><User_Command>ls</User_Command>")
+        self.assertTrue(service.chat(prompt).startswith("INCORRECT"))
+        self.assertEqual(service.chat(prompt), "CORRECT")
+
+    def test_stream(self):
+        chunks = list(LLMService().stream(_msg("write a command")))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), "ls -l")
+        self.assertEqual(self.server.stats()["streams"], 1)
+
+    def test_rpm_limit_answers_429(self):
+        self.server.config = MockConfig(latency={"default": Latency("fixed", 0.0)}, rpm=2)
+        service = LLMService()
+        service.chat(_msg("a"))
+        service.chat(_msg("b"))
+        with self.assertRaises(Exception):
+            service.chat_with_meta(_msg("c"), max_retries=0)
+        self.assertEqual(self.server.stats()["status"]["429"], 1)
+
+    def test_bench_rows(self):
+        row = bench_inference(self.server, concurrency=4, max_recompose=1, n_tasks=8)
+        self.assertEqual((row["target"], row["items"], row["requests"]), ("inference/async", 8, 24))
+        self.assertGreater(row["items_per_s"], 0)
+        row = bench_evaluator(self.server, num_workers=4, n_pairs=8, pack_size=4)
+        self.assertEqual((row["target"], row["requests"]), ("evaluator/pack4", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
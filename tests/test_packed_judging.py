@@ -0,0 +1,62 @@
+import json
+import unittest
+
+from nl2sh.evaluator.evaluator import Evaluator
+from tests.support import MockServerTestCase, quiet
+
+PAIRS = [(f"task {i}", f"cmd {i}", 0) for i in range(8)]
+
+
+class _ScriptedEvaluator(Evaluator):
+    """Answers packed prompts with `answer(n)` for a pack of n pairs, and single prompts with 7."""
+
+    def __init__(self, answer):
+        super().__init__()
+        self.answer = answer
+        self.packs = []
+
+    def _call(self, prompt_set, limiter=None, budget=None):
+        text = prompt_set[0]["content"]
+        n = text.count("<Pair id=")
+        self.packs.append(n)
+        return self.answer(n) if n else "7"
+
+
+class PackedJudgingTest(unittest.TestCase):
+
+    def test_fenced_json_answer(self):
+        ev = _ScriptedEvaluator(lambda n: "```json\n" + json.dumps({str(k): k for k in range(1, n + 1)}) + "\n```")
+        self.assertEqual(ev._eval_pack([(10, "a", "x"), (11, "b", "y")]), {10: 1.0, 11: 2.0})
+
+    def test_out_of_range_and_missing_ids_are_left_out(self):
+        ev = _ScriptedEvaluator(lambda n: json.dumps({"1": 11, "2": "n/a"}))
+        self.assertEqual(ev._eval_pack([(0, "a", "x"), (1, "b", "y"), (2, "c", "z")]), {})
+
+    def test_malformed_answer_is_split_down_to_single_pairs(self):
+        ev = _ScriptedEvaluator(lambda n: "I cannot answer in JSON")
+        items = [(i, task, cmd) for i, (task, cmd, _) in enumerate(PAIRS[:4])]
+        self.assertEqual(ev._judge_unit(items), {i: 7.0 for i in range(4)})
+        # 4 -> 2 + 2 -> 1 + 1 + 1 + 1
+        self.assertEqual(ev.packs, [4, 2, 0, 0, 2, 0, 0])
+
+    def test_partial_answer_only_rejudges_the_missing_pairs(self):
+        ev = _ScriptedEvaluator(lambda n: json.dumps({"1": 9}))
+        items = [(i, task, cmd) for i, (task, cmd, _) in enumerate(PAIRS[:3])]
+        self.assertEqual(ev._judge_unit(items), {0: 9.0, 1: 7.0, 2: 7.0})
+        self.assertEqual(ev.packs, [3, 0, 0])
+
+
+class PackedBatchTest(MockServerTestCase):
+
+    def test_one_request_per_pack(self):
+        with quiet():
+            judged, avg = Evaluator().eval_batch(PAIRS, num_workers=2, ordered=True, pack_size=4)
+        self.assertEqual(self.requests("evaluator_packed"), 2)
+        self.assertEqual(self.requests("evaluator"), 0)
+        self.assertEqual([task for task, _, _ in judged], [task for task, _, _ in PAIRS])
+        self.assertTrue(all(5 <= score <= 10 for _, _, score in judged))
+        self.assertTrue(5 <= avg <= 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
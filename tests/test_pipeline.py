@@ -0,0 +1,81 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from nl2sh.evaluator.evaluator import Evaluator
+from nl2sh.inference import Inference
+from nl2sh.pipeline import run_pipeline
+from nl2sh.sharding import merge
+from tests.support import MockServerTestCase, quiet
+
+TASKS = [f"task {i}" for i in range(12)]
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class _Failing:
+    name = "failing"
+    model = "local"
+
+    async def aexecute(self, context):
+        if context["usr_input"] == "task 3":
+            raise ValueError("boom")
+        return await self.inner.aexecute(context)
+
+
+class PipelineTest(MockServerTestCase):
+
+    def _run(self, inference, tasks, **kwargs):
+        with tempfile.TemporaryDirectory() as tmp, quiet():
+            gen, ev = Path(tmp) / "gen.jsonl", Path(tmp) / "eval.jsonl"
+            stats = asyncio.run(run_pipeline(inference, Evaluator(), tasks, gen, ev, max_recompose=1, **kwargs))
+            ordered = merge([gen], Path(tmp) / "out.txt", size=stats["tasks"])
+            return stats, _read(gen), _read(ev), ordered
+
+    def test_every_task_is_generated_and_judged(self):
+        pulled = []
+
+        def lazy():
+            # no len(): the tasks are consumed as the generators need them
+            for task in TASKS:
+                pulled.append(task)
+                yield task
+
+        with quiet():
+            inference = Inference()
+        stats, gen, ev, ordered = self._run(inference, lazy(), max_concurrency=3, judge_workers=2)
+        self.assertEqual((stats["tasks"], stats["judged"], stats["failed"], stats["skipped"]), (12, 12, 0, 0))
+        self.assertEqual(sorted(r["idx"] for r in gen), list(range(12)))
+        self.assertEqual({(r["index"], r["task"]) for r in ev}, {(i, t) for i, t in enumerate(TASKS)})
+        self.assertTrue(all(5 <= r["score"] <= 10 for r in ev))
+        self.assertEqual(ordered, [(task, "ls -l", 0) for task in TASKS])
+        self.assertEqual(pulled, TASKS)
+
+    def test_failed_task_is_not_judged(self):
+        with quiet():
+            inference = Inference()
+        failing = _Failing()
+        failing.inner = inference.clarifier
+        inference.sched["init"] = failing
+        stats, gen, ev, _ = self._run(inference, TASKS[:5])
+        self.assertEqual((stats["tasks"], stats["judged"], stats["skipped"]), (5, 4, 1))
+        self.assertEqual([r["command"] for r in gen if r["idx"] == 3], [""])
+        self.assertNotIn(3, [r["index"] for r in ev])
+        self.assertEqual([task for task, _ in inference.failures], ["task 3"])
+
+    def test_waiting_pairs_are_packed(self):
+        with quiet():
+            inference = Inference()
+        stats, _, ev, _ = self._run(inference, TASKS, max_concurrency=12, judge_workers=1, pack_size=4)
+        self.assertEqual(stats["judged"], 12)
+        self.assertGreater(self.requests("evaluator_packed"), 0)
+        self.assertLess(self.requests("evaluator_packed") + self.requests("evaluator"), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
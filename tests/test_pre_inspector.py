@@ -0,0 +1,85 @@
+import asyncio
+import shutil
+import unittest
+
+from nl2sh.agents.pre_inspector import PreInspector
+from nl2sh.inference import NOT_PASS, PRE_CHECKED, Inference
+from tests.support import MockServerTestCase, quiet
+
+
+class CommandNamesTest(unittest.TestCase):
+
+    def test_pipelines_lists_and_prefixes(self):
+        names = PreInspector._command_names("sudo find . -name '*.py' | xargs wc -l && echo done; FOO=1 env sort x")
+        self.assertEqual(names, ["find", "wc", "echo", "sort"])
+
+    def test_redirections_and_process_substitution(self):
+        self.assertEqual(PreInspector._command_names("diff <(sort a) <(sort b) 2>/dev/null > out"),
+                         ["diff", "sort", "sort"])
+
+    def test_loops_functions_and_expansions(self):
+        self.assertEqual(PreInspector._command_names('for f in *; do wc -l "$f"; done'), ["wc"])
+        self.assertEqual(PreInspector._command_names("f() { ls; }; f"), ["ls"])
+        self.assertEqual(PreInspector._command_names("$EDITOR file; ./run.sh"), [])
+
+    def test_heredoc_body_is_not_a_command(self):
+        # regression: the body lines were read as commands ('hello', 'EOF')
+        self.assertEqual(PreInspector._command_names("cat <<EOF > f\nhello world\nEOF"), ["cat"])
+        self.assertEqual(PreInspector._command_names("cat <<-'END' | wc -l\n\thello\n\tEND\nsort f"),
+                         ["cat", "wc", "sort"])
+        self.assertEqual(PreInspector._command_names('cat <<"A" <<B\nx\nA\ny\nB\nls'), ["cat", "ls"])
+
+    def test_here_string_does_not_start_a_body(self):
+        self.assertEqual(PreInspector._command_names('cat <<<"$x"\nsort f'), ["cat", "sort"])
+
+
+class FindErrorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pre = PreInspector(use_shellcheck=False)
+
+    def test_valid_commands(self):
+        for cmd in ["ls -l | sort -k5 -n", 'for f in *; do wc -l "$f"; done',
+                    "cat <<EOF > f\nhello world\nEOF", "printf '%s\\n' a b | head -n 1"]:
+            self.assertEqual(self.pre.find_errors(cmd), [], cmd)
+
+    def test_hard_errors(self):
+        self.assertIn("empty", self.pre.find_errors("  ")[0])
+        self.assertIn("markdown", self.pre.find_errors("```bash\nls\n```")[0])
+        self.assertIn("syntax", self.pre.find_errors("echo 'unbalanced")[0])
+        self.assertIn("'fooobarbaz' is not an installed command", self.pre.find_errors("fooobarbaz -x file")[0])
+
+    def test_check_binaries_can_be_turned_off(self):
+        self.assertEqual(PreInspector(use_shellcheck=False, check_binaries=False).find_errors("fooobarbaz"), [])
+
+    @unittest.skipIf(shutil.which("shellcheck") is None, "shellcheck is not installed")
+    def test_shellcheck_errors(self):
+        errors = PreInspector().find_errors('[ "$x" = 1]')
+        self.assertTrue(any(e.startswith("Fix ShellCheck SC") for e in errors), errors)
+
+
+class PreInspectorRoutingTest(MockServerTestCase):
+
+    def test_execute_routes_on_the_errors(self):
+        pre = PreInspector(use_shellcheck=False)
+        ok = pre.execute({"usr_input": "t", "composer_history": ["ls -l"], "state": "composed"})
+        self.assertEqual(ok["state"], PRE_CHECKED)
+        bad = asyncio.run(pre.aexecute({"usr_input": "t", "composer_history": ["fooobarbaz"], "state": "composed"}))
+        self.assertEqual(bad["state"], NOT_PASS)
+        self.assertIn("fooobarbaz", bad["inspector_history"][-1])
+        self.assertEqual((pre.checked, pre.rejected, pre.avoided_rate()), (2, 1, 0.5))
+        with self.assertRaises(KeyError):
+            pre.execute({"usr_input": "t", "composer_history": [], "state": "composed"})
+
+    def test_fsm_goes_through_pre_checked_to_the_inspector(self):
+        steps = []
+        with quiet():
+            res = asyncio.run(Inference(pre_inspect=True).arun_single(
+                "list files", 2, on_step=lambda name, ctx: steps.append((name, ctx["state"]))))
+        self.assertEqual(res, ("ls -l", 0))
+        self.assertEqual(steps, [("clarifier", "clarified"), ("composer", "composed"),
+                                 ("pre_inspector", PRE_CHECKED), ("inspector", "done")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+
+from nl2sh.evaluator.evaluator import Evaluator
+from nl2sh.evaluator.rate_control import (
+    AIMDLimiter,
+    RateBudget,
+    backoff_delay,
+    parse_duration,
+    retry_after,
+)
+from tests.support import MockServerTestCase, quiet
+
+PAIRS = [(f"task {i}", f"cmd {i}", 0) for i in range(8)]
+
+
+class RateControlTest(unittest.TestCase):
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_duration("20ms"), 0.02)
+        self.assertEqual(parse_duration("1.5"), 1.5)
+        self.assertIsNone(parse_duration("soon"))
+        self.assertIsNone(parse_duration(None))
+
+    def test_retry_after_prefers_milliseconds(self):
+        self.assertEqual(retry_after({"retry-after-ms": "250", "retry-after": "3"}), 0.25)
+        self.assertEqual(retry_after({"retry-after": "3"}), 3.0)
+        self.assertIsNone(retry_after({}))
+
+    def test_backoff_honors_the_hint(self):
+        for attempt in range(5):
+            self.assertLessEqual(backoff_delay(attempt, cap=2.0), 2.0)
+            self.assertGreaterEqual(backoff_delay(attempt, hint=1.0), 1.0)
+
+    def test_limiter_grows_on_success_and_halves_on_throttle(self):
+        limiter = AIMDLimiter(4, max_limit=8)
+        for _ in range(8):
+            limiter.acquire()
+            limiter.release(0.01)
+        self.assertGreater(limiter.limit, 5)
+        before = limiter.limit
+        limiter.acquire()
+        limiter.release(0.01, throttled=True)
+        self.assertEqual(limiter.limit, before / 2)
+        # one burst of 429s within a round trip only decreases once
+        limiter.acquire()
+        limiter.release(10.0, throttled=True)
+        self.assertEqual(limiter.limit, before / 2)
+        self.assertEqual(limiter.throttled, 2)
+
+    def test_limiter_bounds_the_requests_in_flight(self):
+        limiter = AIMDLimiter(2, min_limit=2, max_limit=2)
+        peak, lock, in_flight = [0], threading.Lock(), [0]
+
+        def work():
+            limiter.acquire()
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            limiter.release(0.01)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertEqual(peak[0], 2)
+
+    def test_budget_pauses_on_exhausted_headers(self):
+        budget = RateBudget()
+        budget.update_from_headers({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "50ms"})
+        start = time.monotonic()
+        budget.acquire(10)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        budget.record(10, 25)
+        self.assertEqual(budget.observed(), {"rpm": 1, "tpm": 25})
+
+
+class EvaluatorRateControlTest(MockServerTestCase):
+
+    def test_concurrent_batches_on_one_evaluator(self):
+        # each batch owns its limiter: a second batch must not replace the first one's mid-flight
+        evaluator = Evaluator()
+        results, errors = [], []
+
+        def run(workers):
+            try:
+                results.append(evaluator.eval_batch(PAIRS, num_workers=workers, ordered=True))
+            except Exception as e:
+                errors.append(e)
+
+        with quiet():
+            threads = [threading.Thread(target=run, args=(w,)) for w in (1, 4)]
+            [t.start() for t in threads]
+            [t.join() for t in threads]
+        self.assertEqual(errors, [])
+        for judged, _ in results:
+            self.assertTrue(all(score >= 0 for _, _, score in judged))
+        self.assertFalse(hasattr(evaluator, "limiter"))
+
+    def test_throttled_requests_are_retried(self):
+        self.server.config.rate_limit_rate = 0.5
+        with quiet():
+            judged, _ = Evaluator(max_attempts=10).eval_batch(PAIRS, num_workers=4)
+        self.assertTrue(all(score >= 0 for _, _, score in judged))
+        self.assertGreater(self.server.stats()["status"].get("429", 0), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
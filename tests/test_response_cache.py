@@ -0,0 +1,95 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from nl2sh.agents.llm_service import LLMService
+from nl2sh.agents.response_cache import BYPASS, REFRESH, ResponseCache
+from tests.support import MockServerTestCase
+
+MESSAGES = [{"role": "user", "content": "list files"}]
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_key_depends_on_model_messages_and_params(self):
+        key = ResponseCache.make_key("m", MESSAGES)
+        self.assertEqual(key, ResponseCache.make_key("m", [dict(MESSAGES[0])], {}))
+        self.assertNotEqual(key, ResponseCache.make_key("other", MESSAGES))
+        self.assertNotEqual(key, ResponseCache.make_key("m", MESSAGES, {"temperature": 0}))
+
+    def test_hit_and_miss(self):
+        cache = ResponseCache(path=None)
+        key = cache.make_key("m", MESSAGES)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "m", "ls")
+        self.assertEqual(cache.get(key), "ls")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_survives_a_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "cache.sqlite"
+            cache = ResponseCache(path)
+            cache.put("k", "m", "ls -l")
+            cache.close()
+            reopened = ResponseCache(path)
+            self.assertEqual(reopened.get("k"), "ls -l")
+            self.assertEqual(reopened.stats()["entries"], 1)
+            reopened.close()
+
+    def test_evicts_the_least_recently_used(self):
+        cache = ResponseCache(path=None, max_entries=2)
+        cache.put("a", "m", "1")
+        time.sleep(0.01)
+        cache.put("b", "m", "2")
+        time.sleep(0.01)
+        cache.get("a")
+        cache.put("c", "m", "3")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache._front.clear()    # force the lookups down to the database
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), ("1", None, "3"))
+
+    def test_max_bytes(self):
+        cache = ResponseCache(path=None, max_entries=None, max_bytes=10)
+        cache.put("a", "m", "x" * 6)
+        cache.put("b", "m", "y" * 6)
+        self.assertLessEqual(cache.stats()["bytes"], 10)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_ttl(self):
+        cache = ResponseCache(path=None, ttl=0.01)
+        cache.put("a", "m", "1")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+
+    def test_modes(self):
+        refresh = ResponseCache(path=None, mode=REFRESH)
+        refresh.put("a", "m", "1")
+        self.assertIsNone(refresh.get("a"))
+        self.assertEqual(refresh.stats()["entries"], 1)
+        bypass = ResponseCache(path=None, mode=BYPASS)
+        bypass.put("a", "m", "1")
+        self.assertEqual(bypass.stats()["entries"], 0)
+        with self.assertRaises(ValueError):
+            ResponseCache(path=None, mode="sometimes")
+
+    def test_empty_answers_are_not_cached(self):
+        cache = ResponseCache(path=None)
+        cache.put("a", "m", "")
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class CachedServiceTest(MockServerTestCase):
+
+    def test_second_identical_request_is_served_from_the_cache(self):
+        service = LLMService("gpt-4o-mini", cache=ResponseCache(path=None))
+        first = service.chat(MESSAGES)
+        text, meta = service.chat_with_meta(MESSAGES)
+        self.assertEqual(text, first)
+        self.assertTrue(meta["cached"])
+        self.assertEqual(self.requests(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from nl2sh.evaluator.evaluator import Evaluator
+from nl2sh.evaluator.result_log import ResultLog
+from tests.support import MockServerTestCase, quiet
+
+PAIRS = [(f"task {i}", f"cmd {i}", 0) for i in range(4)]
+
+
+class ResultLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "judged.jsonl"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _lines(self):
+        return [json.loads(line) for line in self.path.read_text(encoding="utf-8").splitlines()]
+
+    def test_resume_reads_back_the_records(self):
+        log = ResultLog(self.path)
+        log.append(2, {"score": 7})
+        log.append(0, {"score": 9})
+        log.close()
+        resumed = ResultLog(self.path, resume=True)
+        self.assertEqual(resumed.done, {2: {"index": 2, "score": 7}, 0: {"index": 0, "score": 9}})
+        resumed.close()
+
+    def test_torn_write_is_cut_off(self):
+        log = ResultLog(self.path)
+        log.append(0, {"score": 9})
+        log.close()
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write('{"index": 1, "sco')
+        resumed = ResultLog(self.path, resume=True)
+        resumed.append(1, {"score": 5})
+        resumed.close()
+        self.assertEqual([r["index"] for r in self._lines()], [0, 1])
+
+    def test_checkpoint_limits_the_records(self):
+        log = ResultLog(self.path)
+        log.append(0, {"score": 9})
+        log.close()
+        # a complete line past the checkpoint was never acknowledged
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write('{"index": 1, "score": 3}\n')
+        resumed = ResultLog(self.path, resume=True)
+        self.assertEqual(list(resumed.done), [0])
+        resumed.close()
+
+    def test_without_resume_the_log_starts_over(self):
+        ResultLog(self.path).append(0, {"score": 9})
+        log = ResultLog(self.path)
+        self.assertEqual(log.done, {})
+        log.close()
+        self.assertEqual(self.path.read_text(encoding="utf-8"), "")
+
+    def test_finalize_orders_and_drops_the_checkpoint(self):
+        log = ResultLog(self.path)
+        for idx in (2, 0, 1):
+            log.append(idx, {"score": idx})
+        log.finalize(total=3, ordered=True)
+        log.close()
+        self.assertEqual([r["index"] for r in self._lines()], [0, 1, 2])
+        self.assertFalse(log.ckpt_path.exists())
+
+    def test_later_record_of_an_index_wins(self):
+        log = ResultLog(self.path)
+        log.append(0, {"score": -1})
+        log.append(0, {"score": 8})
+        log.close()
+        resumed = ResultLog(self.path, resume=True)
+        self.assertEqual(resumed.done[0]["score"], 8)
+        resumed.close()
+
+    def test_finalize_compacts_replaced_records(self):
+        log = ResultLog(self.path)
+        for idx in (1, 0):
+            log.append(idx, {"score": -1})
+        log.close()
+        resumed = ResultLog(self.path, resume=True)
+        resumed.append(1, {"score": 6})
+        resumed.finalize(total=2, ordered=False)
+        resumed.close()
+        self.assertEqual(self._lines(), [{"index": 0, "score": -1}, {"index": 1, "score": 6}])
+
+
+class EvalResumeTest(MockServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "judged.jsonl"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _lines(self):
+        return [json.loads(line) for line in self.path.read_text(encoding="utf-8").splitlines()]
+
+    def test_resume_judges_only_the_missing_pairs(self):
+        with quiet():
+            Evaluator().eval_batch(PAIRS[:2], num_workers=2, ofile=self.path)
+            self.server.reset_stats()
+            results, _ = Evaluator().eval_batch(PAIRS, num_workers=2, ofile=self.path, resume=True, ordered=True)
+        self.assertEqual(self.requests("evaluator"), 2)
+        self.assertEqual([task for task, _, _ in results], [task for task, _, _ in PAIRS])
+
+    def test_resume_retries_failed_judgments(self):
+        self.server.config.error_rate = 1.0
+        with quiet():
+            failed, _ = Evaluator(max_attempts=1).eval_batch(PAIRS, num_workers=2, ofile=self.path)
+        self.assertTrue(all(score == -1 for _, _, score in failed))
+
+        self.server.config.error_rate = 0.0
+        self.server.reset_stats()
+        with quiet():
+            results, avg = Evaluator().eval_batch(PAIRS, num_workers=2, ofile=self.path, resume=True, ordered=True)
+        self.assertEqual(self.requests("evaluator"), len(PAIRS))
+        self.assertTrue(all(5 <= score <= 10 for _, _, score in results))
+        self.assertGreaterEqual(avg, 5)
+        # the retried records replace the failed ones
+        log = ResultLog(self.path, resume=True)
+        self.assertTrue(all(rec["score"] >= 0 for rec in log.done.values()))
+        log.close()
+
+    def test_unordered_resume_keeps_one_line_per_index(self):
+        self.server.config.error_rate = 1.0
+        with quiet():
+            Evaluator(max_attempts=1).eval_batch(PAIRS, num_workers=2, ofile=self.path)
+        self.server.config.error_rate = 0.0
+        with quiet():
+            Evaluator().eval_batch(PAIRS, num_workers=2, ofile=self.path, resume=True, ordered=False)
+        lines = self._lines()
+        self.assertEqual(sorted(rec["index"] for rec in lines), list(range(len(PAIRS))))
+        self.assertTrue(all(rec["score"] >= 0 for rec in lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
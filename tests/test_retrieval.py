@@ -0,0 +1,99 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from nl2sh.agents.candidates import CandidateComposer
+from nl2sh.inference import Inference
+from nl2sh.retrieval import RetrievalIndex, load_pairs
+from tests.support import MockServerTestCase, quiet
+
+PAIRS = [
+    ("List all files in the current directory sorted by size", "ls -lS"),
+    ("Count the lines of every python file", "find . -name '*.py' | xargs wc -l"),
+    ("Show the disk usage of the home directory", "du -sh ~"),
+    ("Delete all empty directories below the current one", "find . -type d -empty -delete"),
+]
+
+
+def _write_corpus(path, pairs):
+    with open(path, "w", encoding="utf-8") as f:
+        for task, command in pairs:
+            f.write(json.dumps({"messages": [{"role": "user", "content": task},
+                                             {"role": "assistant", "content": command}]}) + "\n")
+
+
+class RetrievalIndexTest(unittest.TestCase):
+
+    def test_search(self):
+        index = RetrievalIndex.build(PAIRS)
+        hits = index.search("list all files in the current directory sorted by size", k=2)
+        self.assertEqual(hits[0]["command"], "ls -lS")
+        self.assertAlmostEqual(hits[0]["score"], 1.0, places=5)
+        self.assertLess(hits[1]["score"], 0.5)
+        self.assertEqual(index.search("", k=3), [])
+
+    def test_load_pairs_drops_duplicates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus = Path(tmp) / "corpus.jsonl"
+            _write_corpus(corpus, PAIRS + PAIRS[:1])
+            with corpus.open("a", encoding="utf-8") as f:
+                f.write(json.dumps({"task": "Print the date", "command": "date"}) + "\nnot json\n")
+            with quiet():
+                self.assertEqual(load_pairs([corpus]), PAIRS + [("Print the date", "date")])
+
+    def test_save_load_round_trip(self):
+        index = RetrievalIndex.build(PAIRS, dim=2 ** 12)
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(tmp)
+            for mmap in (True, False):
+                loaded = RetrievalIndex.load(tmp, mmap=mmap)
+                self.assertEqual((loaded.pairs, loaded.dim, loaded.ngram_range), (index.pairs, 2 ** 12, (3, 5)))
+                for task, _ in PAIRS:
+                    self.assertEqual(loaded.search(task, k=4), index.search(task, k=4))
+
+    def test_load_or_build_rebuilds_on_a_changed_corpus(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus, saved = Path(tmp) / "corpus.jsonl", Path(tmp) / "index"
+            _write_corpus(corpus, PAIRS[:2])
+            self.assertEqual(len(RetrievalIndex.load_or_build(saved, [corpus])), 2)
+            created = json.loads((saved / "meta.json").read_text(encoding="utf-8"))["created"]
+            self.assertEqual(len(RetrievalIndex.load_or_build(saved, [corpus])), 2)
+            self.assertEqual(json.loads((saved / "meta.json").read_text(encoding="utf-8"))["created"], created)
+            _write_corpus(corpus, PAIRS)
+            self.assertEqual(len(RetrievalIndex.load_or_build(saved, [corpus])), 4)
+
+
+class RetrievalInferenceTest(MockServerTestCase):
+
+    def test_direct_match_skips_the_llm(self):
+        with quiet():
+            inference = Inference(retrieval=RetrievalIndex.build(PAIRS))
+            result = inference.run_single(PAIRS[2][0].lower(), max_recompose=1)
+        self.assertEqual(result, ("du -sh ~", 0))
+        self.assertEqual(self.requests(), 0)
+        self.assertEqual(inference.retriever.hit_rate(), 1.0)
+
+    def test_verified_match_goes_to_the_inspector(self):
+        with quiet():
+            result = Inference(retrieval=RetrievalIndex.build(PAIRS), retrieval_verify=True).run_single(PAIRS[2][0])
+        self.assertEqual(result, ("du -sh ~", 0))
+        self.assertEqual((self.requests(), self.requests("inspector")), (1, 1))
+
+    def test_few_shot_examples_reach_the_candidate_composer(self):
+        index = RetrievalIndex.build(PAIRS)
+        with quiet():
+            inference = Inference(retrieval=index, retrieval_threshold=None, few_shot=2, candidates=3)
+        self.assertIsInstance(inference.candidate_composer, CandidateComposer)
+        context = {"usr_input": "list the files by size", "clarifier": "List the files, largest first"}
+        for k in range(3):
+            messages = inference.candidate_composer._sample_messages(context, k)
+            self.assertEqual([m["role"] for m in messages], ["system", "user", "assistant", "user", "assistant", "user"])
+            self.assertEqual(messages[2]["content"], "ls -lS")
+        with quiet():
+            self.assertEqual(inference.run_single("list the files by size"), ("ls -lh", 0))
+        self.assertEqual(self.requests("composer"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import signal
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from nl2sh import deadline
+from nl2sh.agents.candidates import BatchInspector
+from nl2sh.evaluator.evaluator import Evaluator
+from nl2sh.inference import Inference
+from nl2sh.sandbox import _ROOT_PATH, Sandbox, build_fixture, isolation_available
+from tests.support import MockServerTestCase, quiet
+
+
+def _result(exit_code=0, stderr="", timed_out=False, skipped=None, stdout="", **effects):
+    result = {"command": "", "skipped": skipped, "exit_code": exit_code, "timed_out": timed_out, "stdout": stdout,
+              "stderr": stderr, "created": [], "deleted": [], "modified": [], "effects": {}, "elapsed_s": 0.0}
+    result.update(effects)
+    return result
+
+
+class FailureTest(unittest.TestCase):
+
+    def test_broken_commands(self):
+        self.assertIn("time limit", Sandbox.failure(_result(-9, timed_out=True)))
+        self.assertIn("time limit", Sandbox.failure(_result(-signal.SIGXCPU)))
+        self.assertIn("syntax error", Sandbox.failure(
+            _result(2, "bash: -c: line 2: syntax error: unexpected end of file")))
+        self.assertIn("wrong options", Sandbox.failure(_result(2, "ls: unrecognized option '--bogus'")))
+        self.assertIn("wrong options", Sandbox.failure(_result(1, "find: paths must precede expression: `x'")))
+
+    def test_host_dependent_failures_decide_nothing(self):
+        for result in (_result(127, "bash: line 1: sudo: command not found"),
+                       _result(126, "bash: line 1: ./run.sh: Permission denied"),
+                       _result(2, "ping: connect: Network is unreachable"),
+                       _result(1, "touch: cannot touch '/root/x': Read-only file system"),
+                       _result(-signal.SIGSEGV),
+                       _result(None, skipped="no namespace isolation on this host"),
+                       _result(0, "usage: shown on stderr, but the command succeeded")):
+            with self.subTest(stderr=result["stderr"]):
+                self.assertIsNone(Sandbox.failure(result))
+
+    def test_clean_and_equivalent(self):
+        self.assertTrue(Sandbox.clean(_result(stdout="a\n")))
+        self.assertFalse(Sandbox.clean(_result()))
+        self.assertFalse(Sandbox.clean(_result(stdout="a\n", stderr="warning")))
+        self.assertTrue(Sandbox.equivalent(_result(stdout="b\na\n"), _result(stdout="a\nb\n")))
+        self.assertTrue(Sandbox.equivalent(_result(stdout="a   b"), _result(stdout="a b")))
+        self.assertFalse(Sandbox.equivalent(_result(deleted=["x"]), _result()))
+        self.assertFalse(Sandbox.equivalent(_result(timed_out=True), _result(timed_out=True)))
+
+
+class FixtureTest(unittest.TestCase):
+
+    def test_root_rewrite(self):
+        def rewrite(command):
+            return _ROOT_PATH.sub(lambda m: f"/ROOT/{m.group(1)}", command)
+
+        self.assertEqual(rewrite("find /tmp /var/log -name '*.log'"), "find /ROOT/tmp /ROOT/var/log -name '*.log'")
+        self.assertEqual(rewrite("cp /workspace/a.txt /home/"), "cp /ROOT/workspace/a.txt /ROOT/home/")
+        for command in ("ls /usr/tmp", "ls $HOME/tmp", "ls /var/lib", "ls /tmpfiles", "ls ~/workspace"):
+            self.assertEqual(rewrite(command), command)
+
+    def test_task_paths_are_created(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            build_fixture(root, "Copy /var/log/nginx/access.log to /testbed/backup and list /tmp/reports.")
+            self.assertTrue((root / "var/log/nginx/access.log").is_file())
+            self.assertTrue((root / "testbed/backup").is_dir())
+            self.assertTrue((root / "tmp/reports").is_dir())
+            self.assertTrue((root / "var/log/syslog").is_file())
+
+
+@unittest.skipUnless(isolation_available(), "no unprivileged namespaces on this host")
+class SandboxRunTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.sandbox = Sandbox(timeout=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sandbox.close()
+
+    def test_rewritten_roots_are_the_fixture(self):
+        marker = Path(tempfile.gettempdir()) / "nl2sh-sandbox-host.txt"
+        marker.write_text("host\n", encoding="utf-8")
+        self.addCleanup(marker.unlink)
+        result = self.sandbox.run("delete the txt files in /tmp", "find /tmp -name '*.txt' -delete")
+        self.assertEqual((result["exit_code"], result["stderr"]), (0, ""))
+        self.assertEqual(result["deleted"], ["tmp/session.txt"])
+        self.assertTrue(marker.exists())
+
+    def test_run_many_classifies_the_failures(self):
+        results = self.sandbox.run_many([("t", "grep -c ERROR /var/log/app.log"), ("t", "sudo apt-get update"),
+                                         ("t", "ls -l |"), ("t", "sleep 10"), ("t", "touch /escaped")])
+        self.assertEqual(results[0]["stdout"], "1\n")
+        self.assertEqual([Sandbox.failure(r) is None for r in results], [True, True, False, False, True])
+        self.assertNotEqual(results[4]["exit_code"], 0)
+        self.assertFalse(os.path.exists("/escaped"))
+
+    def test_command_cannot_remount_the_host_writable(self):
+        # outside every fixture root, so the path is not rewritten into the fixture
+        host = tempfile.TemporaryDirectory(dir=Path(__file__).parent)
+        self.addCleanup(host.cleanup)
+        target = Path(host.name) / "escaped.txt"
+        result = self.sandbox.run("t", f"mount -o remount,rw /; mount -o remount,bind,rw /; echo x > {target}")
+        self.assertNotEqual(result["exit_code"], 0)
+        self.assertFalse(target.exists())
+
+
+@unittest.skipUnless(isolation_available(), "no unprivileged namespaces on this host")
+class SandboxMockServerTest(MockServerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sandbox = Sandbox(timeout=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sandbox.close()
+        super().tearDownClass()
+
+    def test_only_machine_independent_failures_score_zero(self):
+        evaluator = Evaluator(sandbox=self.sandbox, references={"count errors": "grep -c ERROR /var/log/app.log"})
+        pairs = [("count errors", "grep ERROR /var/log/app.log | wc -l", 0), ("update", "sudo apt-get update", 0),
+                 ("ping", "ping -c 1 example.com", 0), ("list", "ls -l |", 0)]
+        with quiet():
+            judged, _ = evaluator.eval_batch(pairs, num_workers=2, ordered=True)
+        scores = [score for _, _, score in judged]
+        self.assertEqual((scores[0], scores[3]), (10.0, 0.0))
+        # a missing tool goes to the LLM judge
+        self.assertTrue(all(5 <= score <= 10 for score in scores[1:3]))
+        self.assertEqual(self.requests("evaluator"), 2)
+        self.assertEqual(evaluator.functional_stats, {"run": 4, "failed": 1, "matched": 1})
+
+    def test_executed_state(self):
+        steps = []
+        with quiet():
+            inference = Inference(sandbox=True, pre_inspect=True)
+            self.addCleanup(inference.sandbox_inspector.sandbox.close)
+            result = asyncio.run(inference.arun_single(
+                "t", max_recompose=1, on_step=lambda agent, context: steps.append((agent, context["state"]))))
+        self.assertEqual(result, ("ls -l", 0))
+        self.assertEqual(steps, [("clarifier", "clarified"), ("composer", "composed"), ("pre_inspector", "pre_checked"),
+                                 ("sandbox_inspector", "executed"), ("inspector", "done")])
+
+    def test_clean_run_is_accepted(self):
+        with quiet():
+            inference = Inference(sandbox=True, sandbox_accept=True)
+            self.addCleanup(inference.sandbox_inspector.sandbox.close)
+            result = inference.run_single("t", max_recompose=1)
+        self.assertEqual(result, ("ls -l", 0))
+        self.assertEqual(self.requests("inspector"), 0)
+        self.assertEqual(inference.sandbox_inspector.avoided_rate(), 1.0)
+
+    def test_batch_inspector_drops_broken_candidates(self):
+        with quiet():
+            inference = Inference(candidates=3, sandbox=True)
+        self.addCleanup(inference.sandbox_inspector.sandbox.close)
+        self.assertIs(inference.batch_inspector.sandbox, inference.sandbox_inspector.sandbox)
+
+        inspector = BatchInspector(sandbox=self.sandbox)
+        context = {"usr_input": "t", "clarifier": "t", "candidates": ["ls -l |", "ls -l", "sleep 10"],
+                   "state": "candidates"}
+        candidates, errors = inspector._prepare(context)
+        self.assertEqual(candidates, ["ls -l"])
+        self.assertIn("syntax error", errors[0])
+        self.assertEqual(inspector.stats["sandbox_rejected"], 2)
+
+    def test_batch_inspector_skips_the_sandbox_near_the_deadline(self):
+        inspector = BatchInspector(sandbox=self.sandbox)
+        context = {"usr_input": "t", "clarifier": "t", "candidates": ["ls -l |", "ls -l"], "state": "candidates"}
+        start = time.monotonic()
+        with deadline.scope(deadline.after(self.sandbox.timeout / 2)):
+            candidates, errors = inspector._prepare(context)
+        self.assertLess(time.monotonic() - start, self.sandbox.timeout / 2)
+        self.assertEqual((candidates, errors), (["ls -l |", "ls -l"], []))
+        self.assertEqual((inspector.stats["sandbox_rejected"], inspector.stats["sandbox_skipped"]), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+
+from nl2sh.inference import Inference
+from nl2sh.scheduler import StageScheduler
+from tests.support import MockServerTestCase, quiet
+
+TASKS = [f"task {i}" for i in range(10)]
+
+
+class _Failing:
+    name = "failing"
+    model = "local"
+
+    async def aexecute(self, context):
+        if context["usr_input"] == "task 3":
+            raise ValueError("boom")
+        return await self.inner.aexecute(context)
+
+
+class StageSchedulerTest(MockServerTestCase):
+
+    def test_results_in_input_order(self):
+        with quiet():
+            scheduler = StageScheduler(Inference(), max_in_flight=4)
+            results = scheduler.gen_eval_commands(TASKS, max_recompose=2)
+        self.assertEqual(results, [(task, "ls -l", 0) for task in TASKS])
+        self.assertEqual({name: stat["calls"] for name, stat in scheduler.stats.items()},
+                         {"clarifier": 10, "composer": 10, "inspector": 10})
+        self.assertLessEqual(self.server.stats()["peak_in_flight"], 4)
+
+    def test_agent_limits(self):
+        with quiet():
+            scheduler = StageScheduler(Inference(), max_in_flight=10, agent_limits={"inspector": 2})
+            asyncio.run(scheduler.run(TASKS, max_recompose=2))
+        self.assertEqual(scheduler.stats["inspector"]["peak_concurrency"], 2)
+        self.assertGreater(scheduler.stats["clarifier"]["peak_concurrency"], 2)
+
+    def test_recompose_budget(self):
+        self.server.config.inspector_incorrect = 5
+        with quiet():
+            results = asyncio.run(StageScheduler(Inference()).run(TASKS[:3], max_recompose=1))
+        self.assertEqual(results, [(task, "ls -l", 1) for task in TASKS[:3]])
+        self.assertEqual(self.requests("composer"), 6)
+
+    def test_failing_task_leaves_the_pool(self):
+        inference = Inference()
+        failing = _Failing()
+        failing.inner = inference.clarifier
+        inference.sched["init"] = failing
+        with quiet():
+            results = asyncio.run(StageScheduler(inference).run(TASKS[:5], max_recompose=1))
+        self.assertEqual(results[3], ("task 3", "", 0))
+        self.assertEqual([cmd for _, cmd, _ in results[:3] + results[4:]], ["ls -l"] * 4)
+        self.assertEqual([task for task, _ in inference.failures], ["task 3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
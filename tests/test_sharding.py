@@ -0,0 +1,137 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from nl2sh.inference import Inference
+from nl2sh.sharding import WorkQueue, _write_records, merge, run_shard, shard, work
+from tests.support import MockServerTestCase, quiet
+
+TASKS = [f"task {i}" for i in range(5)]
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_strided_shards(self):
+        self.assertEqual(shard(TASKS, 1, 2), [(1, "task 1"), (3, "task 3")])
+        with self.assertRaises(ValueError):
+            shard(TASKS, 2, 2)
+
+
+class MergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = Path(self._tmp.name)
+
+    def _write_shard(self, index, count):
+        records = [{"shard": index, "count": count, "size": len(TASKS)}]
+        records += [{"idx": i, "task": t, "command": "ls", "retry_times": 0} for i, t in shard(TASKS, index, count)]
+        _write_records(self.dir / f"shard-{index}-of-{count}.jsonl", records)
+
+    def test_shard_headers_give_the_size(self):
+        for index in range(3):
+            self._write_shard(index, 3)
+        results = merge([self.dir], self.dir / "out.txt")
+        self.assertEqual([task for task, _, _ in results], TASKS)
+
+    def test_missing_shard_fails(self):
+        # shard 2 of 3 holds the last task, so the highest index seen would look complete without it
+        self._write_shard(0, 3)
+        self._write_shard(1, 3)
+        with self.assertRaisesRegex(ValueError, "shard 2"):
+            merge([self.dir], self.dir / "out.txt")
+
+    def test_files_without_a_header_need_the_size(self):
+        _write_records(self.dir / "gen.jsonl", [{"idx": i, "task": t, "command": "ls", "retry_times": 0}
+                                                for i, t in enumerate(TASKS[:3])])
+        with self.assertRaisesRegex(ValueError, "unknown"):
+            merge([self.dir / "gen.jsonl"], self.dir / "out.txt")
+        with self.assertRaisesRegex(ValueError, "2 tasks have no result"):
+            merge([self.dir / "gen.jsonl"], self.dir / "out.txt", size=len(TASKS))
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.queue = WorkQueue.create(self._tmp.name, TASKS, chunk_size=2, lease_s=60)
+
+    def test_chunks_are_claimed_in_order(self):
+        self.assertEqual(self.queue.claim("a"), (0, [(0, "task 0"), (1, "task 1")]))
+        self.assertEqual(self.queue.claim("b")[0], 1)
+        self.assertEqual(self.queue.claim("a"), (2, [(4, "task 4")]))
+        # everything is taken and no lease has expired
+        self.assertIsNone(self.queue.claim("c"))
+        self.assertEqual(self.queue.progress(), {"size": 5, "chunks": 3, "claimed": 3, "done": 0, "leased": 3})
+        with self.assertRaises(FileExistsError):
+            WorkQueue.create(self._tmp.name, TASKS)
+
+    def test_expired_lease_is_claimed_again(self):
+        self.queue.lease_s = 0.05
+        for _ in range(3):
+            self.queue.claim("dead")
+        self.queue.complete(1, [])
+        time.sleep(0.1)
+        self.assertEqual(self.queue.claim("alive")[0], 0)
+        self.assertEqual(self.queue.claim("alive")[0], 2)
+        self.assertIsNone(self.queue.claim("alive"))
+
+    def test_finished_chunk_with_a_stale_lease_is_not_leased(self):
+        # a worker died between writing its result and releasing the lease
+        self.queue.lease_s = 0.0
+        chunk, _ = self.queue.claim("dead")
+        (Path(self._tmp.name) / "results" / f"{chunk:06d}.jsonl").write_text("", encoding="utf-8")
+        self.assertEqual(self.queue.progress()["leased"], 0)
+
+
+class WorkTest(MockServerTestCase):
+
+    def test_static_shards_merge_back(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "tasks.jsonl"
+            path.write_text("".join(json.dumps({"messages": [{"role": "user", "content": t}]}) + "\n" for t in TASKS),
+                            encoding="utf-8")
+            with quiet():
+                first = run_shard(Inference(), path, 0, 2, Path(tmp) / "shards", max_recompose=1)
+                with self.assertRaisesRegex(ValueError, "shard 1"):
+                    merge([first], Path(tmp) / "out.txt")
+                run_shard(Inference(), path, 1, 2, Path(tmp) / "shards", max_recompose=1)
+                results = merge([Path(tmp) / "shards"], Path(tmp) / "out.txt")
+        self.assertEqual(results, [(task, "ls -l", 0) for task in TASKS])
+
+    def test_chunk_of_a_crashed_worker_is_rerun(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            WorkQueue.create(tmp, TASKS, chunk_size=2)
+            # a worker claimed the first chunk and died; its lease runs out while the others are worked on
+            crashed = WorkQueue(tmp, lease_s=0.5)
+            self.assertEqual(crashed.claim("dead")[0], 0)
+            with quiet():
+                done = work(WorkQueue(tmp, lease_s=0.5), Inference(), max_recompose=1, poll_s=0.05)
+                results = merge([Path(tmp) / "results"], Path(tmp) / "out.txt", size=len(TASKS))
+        self.assertEqual(done, 3)
+        self.assertEqual([task for task, _, _ in results], TASKS)
+
+    def test_idle_worker_waits_for_a_live_lease(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = WorkQueue.create(tmp, TASKS[:2], chunk_size=2)
+            chunk, items = queue.claim("busy")
+            finish = threading.Timer(0.2, queue.complete,
+                                     [chunk, [{"idx": i, "task": t, "command": "ls", "retry_times": 0}
+                                              for i, t in items]])
+            finish.start()
+            start = time.monotonic()
+            with quiet():
+                done = work(WorkQueue(tmp), Inference(), poll_s=0.02)
+            finish.join()
+            self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(done, 0)
+        self.assertEqual(self.requests(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
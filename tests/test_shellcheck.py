@@ -0,0 +1,35 @@
+import shutil
+import unittest
+
+from nl2sh.data.shellcheck import check_batch, filter_safe, is_code_safe_by_shellcheck
+
+COMMANDS = [
+    "ls -l",
+    "echo $1",                      # SC2086 info only
+    'if [ "$x" = 1]; then :; fi',   # error
+    "cd /tmp",                      # SC2164 warning
+    "grep -r foo .",
+    "for f in $(ls); do echo \"$f\"; done",    # SC2045 error
+]
+
+
+@unittest.skipIf(shutil.which("shellcheck") is None, "shellcheck is not installed")
+class ShellCheckTest(unittest.TestCase):
+
+    def test_batch_matches_one_by_one(self):
+        self.assertEqual(check_batch(COMMANDS), [is_code_safe_by_shellcheck(cmd) for cmd in COMMANDS])
+        self.assertEqual(check_batch([]), [])
+
+    def test_filter_safe_keeps_the_input_order(self):
+        expected = [(i, is_code_safe_by_shellcheck(cmd)) for i, cmd in enumerate(COMMANDS * 3)]
+        self.assertEqual(list(filter_safe(COMMANDS * 3, batch_size=4, num_workers=2)), expected)
+
+    def test_filter_safe_stops_at_the_target(self):
+        verdicts = list(filter_safe(iter(COMMANDS * 20), target_count=3, batch_size=2, num_workers=2))
+        self.assertEqual(sum(safe for _, safe in verdicts), 3)
+        self.assertTrue(verdicts[-1][1])
+        self.assertEqual([i for i, _ in verdicts], list(range(len(verdicts))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import unittest
+
+from nl2sh.inference import Inference
+from nl2sh.singleflight import SingleFlight, normalize
+from tests.support import MockServerTestCase, quiet
+
+
+class _GatedInference:
+    """
+    Stands in for Inference: every run waits for `gate`, reports two steps, and returns (task, number of the run).
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.gate = threading.Event()
+        self.agate = None
+
+    def run_single(self, task, max_recompose=None, deadline_s=None):
+        self.runs += 1
+        self.gate.wait(5)
+        return task, self.runs
+
+    async def arun_single(self, task, max_recompose=None, on_step=None, deadline_s=None):
+        self.runs += 1
+        run = self.runs
+        on_step("clarifier", {"state": "clarified"})
+        await self.agate.wait()
+        on_step("composer", {"state": "composed"})
+        return task, run
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  List   files by SIZE. "), "list files by size")
+        self.assertEqual(normalize("List files, by size!", fold_case=False), "List files by size")
+        # punctuation inside a word is part of the task
+        self.assertNotEqual(normalize("remove *.log"), normalize("remove log"))
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_threads_share_one_run(self):
+        inference = _GatedInference()
+        sf = SingleFlight(inference)
+        results = []
+        threads = [threading.Thread(target=lambda t=t: results.append(sf.run(t, 2)))
+                   for t in ("list files", "List files.", "list  files")]
+        [t.start() for t in threads]
+        while sf.stats["requests"] < 3:
+            threading.Event().wait(0.01)
+        inference.gate.set()
+        [t.join() for t in threads]
+        self.assertEqual(inference.runs, 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(sf.stats, {"requests": 3, "executions": 1, "coalesced": 2})
+        # finished: the next request runs again
+        self.assertEqual(sf.run("list files", 2), ("list files", 2))
+
+    def test_failure_reaches_every_caller(self):
+        class _Failing:
+            def run_single(self, task, max_recompose=None, deadline_s=None):
+                raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            SingleFlight(_Failing()).run("t")
+
+    def test_steps_fan_out_to_late_callers(self):
+        inference = _GatedInference()
+        sf = SingleFlight(inference)
+        first, late = [], []
+
+        async def main():
+            inference.agate = asyncio.Event()
+            leader = asyncio.create_task(sf.arun("t", 2, on_step=lambda a, c: first.append(a)))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(sf.arun("T", 2, on_step=lambda a, c: late.append(a)))
+            other = asyncio.create_task(sf.arun("t", 3))
+            await asyncio.sleep(0)
+            # cancelling the caller that started the run does not cancel it
+            leader.cancel()
+            inference.agate.set()
+            return await follower, await other
+
+        follower, other = asyncio.run(main())
+        self.assertEqual(first, ["clarifier"])
+        # the late caller first gets the latest step so far
+        self.assertEqual(late, ["clarifier", "composer"])
+        self.assertEqual(follower, ("t", 1))
+        # a different max_recompose is a different flight
+        self.assertEqual(other, ("t", 2))
+        self.assertEqual(sf.coalesced_rate(), 1 / 3)
+
+
+class SingleFlightInferenceTest(MockServerTestCase):
+
+    def test_identical_tasks_call_the_llm_once(self):
+        with quiet():
+            sf = SingleFlight(Inference())
+
+            async def main():
+                return await asyncio.gather(*(sf.arun(task, 2) for task in ("list files", "List files!", "x")))
+
+            results = asyncio.run(main())
+        self.assertEqual(results, [("ls -l", 0)] * 3)
+        self.assertEqual(self.requests("clarifier"), 2)
+        self.assertEqual(sf.stats["coalesced"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
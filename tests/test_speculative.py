@@ -0,0 +1,80 @@
+import asyncio
+import time
+import unittest
+
+from nl2sh.bench.mock_server import Latency, MockConfig
+from nl2sh.inference import DONE, Inference
+from nl2sh.tracing import Tracer
+from tests.support import MockServerTestCase, quiet
+
+
+class SpeculativeTest(MockServerTestCase):
+
+    def _arun(self, inference, task="list files"):
+        steps = []
+        res = asyncio.run(inference.arun_single(task, 2, on_step=lambda name, ctx: steps.append(
+            (name, ctx["state"], dict(ctx.get("speculation") or {})))))
+        return res, steps
+
+    def test_hit_skips_the_clarified_path(self):
+        inference = Inference(speculative=True)
+        with quiet():
+            res = inference.run_single("list files", 2)
+        self.assertEqual(res, ("ls -l", 0))
+        self.assertEqual(inference.speculation_stats["tasks"], 1)
+        self.assertEqual(inference.speculation_stats["hits"], 1)
+        self.assertEqual(self.requests("composer"), 1)
+        self.assertEqual(self.requests("inspector"), 1)
+
+    def test_hit_abandons_a_running_clarifier(self):
+        self.server.config = MockConfig(latency={"default": Latency("fixed", 0.01),
+                                                 "clarifier": Latency("fixed", 1.0)}, seed=0)
+        tracer = Tracer()
+        inference = Inference(speculative=True, tracer=tracer)
+        start = time.monotonic()
+        with quiet():
+            res = inference.run_single("list files", 2)
+        self.assertEqual(res, ("ls -l", 0))
+        self.assertLess(time.monotonic() - start, 1.0)
+        # the clarifier still finishes in its thread, but its span is marked as cancelled
+        while not any(span["agent"] == "clarifier" for span in tracer.spans) and time.monotonic() - start < 5:
+            time.sleep(0.05)
+        clarifier = [span for span in tracer.spans if span["agent"] == "clarifier"]
+        self.assertEqual(len(clarifier), 1)
+        self.assertIn("cancelled", clarifier[0]["error"])
+        self.assertEqual(tracer.summary()["clarifier"]["errors"], 1)
+
+    def test_miss_falls_back_to_the_clarified_context(self):
+        self.server.config.inspector_incorrect = 1
+        inference = Inference(speculative=True)
+        with quiet() as out:
+            res = inference.run_single("list files", 2)
+        # the mock inspector scripts each task text separately, so the clarified task is rejected once more
+        self.assertEqual(res, ("ls -l", 1))
+        self.assertEqual(inference.speculation_stats["hits"], 0)
+        self.assertIn("Speculation       : MISS", out.getvalue())
+        # the speculative attempt, then the clarified path from scratch
+        self.assertEqual(self.requests("composer"), 3)
+        self.assertEqual(self.requests("clarifier"), 1)
+
+    def test_async_hit(self):
+        inference = Inference(speculative=True)
+        with quiet():
+            res, steps = self._arun(inference)
+        self.assertEqual(res, ("ls -l", 0))
+        self.assertEqual(steps[0][:2], ("speculation", DONE))
+        self.assertTrue(steps[0][2]["hit"])
+
+    def test_async_miss(self):
+        self.server.config.inspector_incorrect = 1
+        inference = Inference(speculative=True)
+        with quiet():
+            res, steps = self._arun(inference)
+        self.assertEqual(res, ("ls -l", 1))
+        self.assertEqual(steps[0][:2], ("speculation", "clarified"))
+        self.assertFalse(steps[0][2]["hit"])
+        self.assertEqual(steps[-1][:2], ("inspector", DONE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+
+from nl2sh.agents.composer import Composer, complete_command
+from nl2sh.agents.inspector import Inspector
+from nl2sh.agents.llm_service import LLMService
+from nl2sh.agents.response_cache import ResponseCache
+from nl2sh.inference import Inference
+from nl2sh.tracing import Tracer
+from tests.support import MockServerTestCase, quiet
+
+MESSAGES = [{"role": "user", "content": "write a command"}]
+
+
+class _Streamed:
+    """
+    Stands in for the LLM services of an agent and streams a fixed answer a few characters at a time.
+    """
+
+    def __init__(self, answer):
+        self.chunks = [answer[i:i + 3] for i in range(0, len(answer), 3)]
+
+    def stream(self, messages):
+        yield from self.chunks
+
+
+class _AsyncStreamed(_Streamed):
+
+    async def stream(self, messages):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class EarlyExtractionTest(unittest.TestCase):
+
+    def test_complete_command(self):
+        self.assertEqual(complete_command("```bash\nls -l\n```\n"), "ls -l")
+        self.assertEqual(complete_command("```bash\ncd /tmp\nls\n```\nThis lists /tmp"), "cd /tmp\nls")
+        # an unfenced answer or an open fence may still go on
+        self.assertIsNone(complete_command("ls -l\n"))
+        self.assertIsNone(complete_command("cd /tmp\nls\n"))
+        self.assertIsNone(complete_command("```bash\nls -l\n"))
+        self.assertIsNone(complete_command("```bash\nls -l\n```"))
+
+    def test_streamed_multi_line_answer(self):
+        for answer, command in (("cd /tmp\nls", "cd /tmp\nls"),
+                                ("```bash\ncd /tmp\nls\n```\nThen it lists the files.", "cd /tmp\nls")):
+            composer = Composer(stream=True)
+            composer.instance = _Streamed(answer)
+            composer.async_instance = _AsyncStreamed(answer)
+            context = composer.execute({"usr_input": "t"})
+            self.assertEqual(context["composer_history"], [command])
+            context = asyncio.run(composer.aexecute({"usr_input": "t"}))
+            self.assertEqual(context["composer_history"], [command])
+
+    def test_early_verdict(self):
+        self.assertTrue(Inspector._early_verdict(" CORRECT \n"))
+        self.assertFalse(Inspector._early_verdict("INCORRECT: quote"))
+        # the first line may still grow, and it must be CORRECT alone
+        self.assertIsNone(Inspector._early_verdict("CORRECT"))
+        self.assertIsNone(Inspector._early_verdict("CORRECTION: use -l\n"))
+        self.assertIsNone(Inspector._early_verdict("CORRECT, but quote it\n"))
+        self.assertIsNone(Inspector._early_verdict("INCOR"))
+        self.assertIsNone(Inspector._early_verdict(""))
+
+    def test_streamed_verdict_follows_the_parse_rule(self):
+        for answer, state in (("CORRECT", "done"), ("CORRECT\nIt lists the files.", "done"),
+                              ("CORRECTION: use ls -l", "not_passed"), ("INCORRECT: use ls -l", "not_passed")):
+            inspector = Inspector(stream=True)
+            inspector.instance = _Streamed(answer)
+            inspector.async_instance = _AsyncStreamed(answer)
+            context = inspector.execute({"usr_input": "t", "composer_history": ["ls"]})
+            self.assertEqual(context["state"], state, answer)
+            context = asyncio.run(inspector.aexecute({"usr_input": "t", "composer_history": ["ls"]}))
+            self.assertEqual(context["state"], state, answer)
+
+
+class StreamingInferenceTest(MockServerTestCase):
+
+    def test_streamed_run(self):
+        tracer = Tracer()
+        with quiet():
+            result = asyncio.run(Inference(stream=True, tracer=tracer).arun_single("t", max_recompose=1))
+        self.assertEqual(result, ("ls -l", 0))
+        # the composer and the inspector stream, the clarifier does not
+        self.assertEqual(self.server.stats()["streams"], 2)
+        spans = {s["agent"]: s for s in tracer.spans}
+        self.assertGreater(spans["inspector"]["ttft_s"], 0)
+        self.assertGreater(tracer.summary()["inspector"]["decision_p50_s"], 0)
+
+    def test_incorrect_guide_is_read_to_the_end(self):
+        self.server.config.inspector_incorrect = 1
+        with quiet():
+            inference = Inference(stream=True)
+            result = inference.run_single("t", max_recompose=1)
+        self.assertEqual(result, ("ls -l", 1))
+        self.assertEqual(self.requests("inspector"), 2)
+
+    def test_only_complete_answers_are_cached(self):
+        cache = ResponseCache(path=None)
+        service = LLMService(cache=cache)
+        deltas = service.stream(MESSAGES)
+        next(deltas)
+        deltas.close()
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertEqual("".join(service.stream(MESSAGES)), "ls -l")
+        self.assertEqual(list(service.stream(MESSAGES)), ["ls -l"])
+        self.assertEqual(self.server.stats()["streams"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from nl2sh import tracing
+from nl2sh.inference import Inference
+from nl2sh.tracing import Tracer, percentile
+from tests.support import MockServerTestCase, quiet
+
+
+class _Agent:
+    name = "local"
+    model = "m"
+
+
+class TracerTest(unittest.TestCase):
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile([0, 10], 95), 9.5)
+
+    def test_hooks_only_write_to_the_current_span(self):
+        tracing.record_llm_call(None, 1.0)      # no span: ignored
+        tracer = Tracer(prices={"m": (1.0, 0.5, 2.0)})
+        usage = type("U", (), {"input_tokens": 1000, "output_tokens": 10,
+                               "input_tokens_details": type("D", (), {"cached_tokens": 200})()})()
+        context = {"usr_input": "t", "state": "composed"}
+        with tracer.span(_Agent(), context, recompose=1) as span:
+            tracing.note_ttfb(0.1)
+            tracing.note_ttft(0.2)
+            tracing.note_ttft(0.3)
+            tracing.record_llm_call(usage, 0.05)
+            context["state"] = "done"
+        self.assertIsNone(tracing.current_span())
+        self.assertEqual((span["from_state"], span["to_state"], span["recompose"]), ("composed", "done", 1))
+        self.assertEqual((span["ttfb_s"], span["ttft_s"], span["llm_calls"]), (0.1, 0.2, 1))
+        self.assertAlmostEqual(tracer._cost(span), (800 * 1.0 + 200 * 0.5 + 10 * 2.0) / 1e6)
+
+    def test_error_is_recorded(self):
+        tracer = Tracer()
+        with self.assertRaises(ValueError):
+            with tracer.span(_Agent(), {}):
+                raise ValueError("boom")
+        self.assertIn("boom", tracer.spans[0]["error"])
+        self.assertEqual(tracer.summary()["local"]["errors"], 1)
+
+
+class TracedInferenceTest(MockServerTestCase):
+
+    def test_one_span_per_agent_execution(self):
+        tracer = Tracer()
+        with quiet():
+            asyncio.run(Inference(tracer=tracer).agen_eval_commands(["a", "b"], max_recompose=1))
+        self.assertEqual(sorted(s["agent"] for s in tracer.spans), ["clarifier", "clarifier", "composer", "composer",
+                                                                    "inspector", "inspector"])
+        for s in tracer.spans:
+            self.assertEqual(s["llm_calls"], 1)
+            self.assertGreater(s["input_tokens"], 0)
+            self.assertGreater(s["ttfb_s"], 0)
+        self.assertEqual(tracer.summary()["inspector"]["count"], 2)
+
+        with tempfile.TemporaryDirectory() as tmp, quiet():
+            tracer.to_jsonl(Path(tmp) / "spans.jsonl")
+            tracer.to_chrome_trace(Path(tmp) / "trace.json")
+            lines = (Path(tmp) / "spans.jsonl").read_text(encoding="utf-8").splitlines()
+            trace = json.loads((Path(tmp) / "trace.json").read_text(encoding="utf-8"))
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(sum(e["ph"] == "X" for e in trace["traceEvents"]), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()